@@ -1,31 +1,33 @@
 # app.py
 import streamlit as st
-import json
-import os
 import time
 import datetime
 import uuid
-import random
-from pathlib import Path
-from dotenv import load_dotenv
+import math
 
 # Import from utils
 from utils.config import (
-    APP_CONFIG, get_api_key, get_model, 
-    save_story_to_file, load_saved_stories,
-    ensure_storage_directory
+    APP_CONFIG, get_api_key,
+    save_story_to_file, load_saved_stories, count_saved_stories, search_saved_stories, load_story,
+    new_story_id, get_user_namespace
 )
-from utils.story_generator import StoryGenerator
-
-# Load environment variables
-load_dotenv()
+from utils.story_generator import StoryGenerator, estimate_story_request
+from utils.token_budget import get_token_budget, model_family
+from utils.chat_history import ChatHistory
+from utils.jobs import JobRejected, get_job_queue
+from utils import speculation
+from utils.versions import VersionHistory, render_diff_html
 
 # Initialize story state
 def init_session_state():
     """Initialize session state variables"""
     # Core state variables
     if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+        st.session_state.chat_history = ChatHistory()
+    
+    # Number of most recent messages rendered
+    if "chat_window" not in st.session_state:
+        st.session_state.chat_window = APP_CONFIG["chat_window"]
     
     if "story_state" not in st.session_state:
         st.session_state.story_state = "welcome"
@@ -45,8 +47,15 @@ def init_session_state():
     if "title" not in st.session_state:
         st.session_state.title = None
     
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    
     if "story_id" not in st.session_state:
-        st.session_state.story_id = str(int(time.time()))
+        st.session_state.story_id = new_story_id()
+    
+    # Stories are saved to and listed from this user's namespace
+    if "user_namespace" not in st.session_state:
+        st.session_state.user_namespace = get_user_namespace()
         
     if "timestamp" not in st.session_state:
         st.session_state.timestamp = datetime.datetime.now().isoformat()
@@ -54,8 +63,40 @@ def init_session_state():
     if "generated_story" not in st.session_state:
         st.session_state.generated_story = None
     
+    # Revision history of the generated story (VersionHistory)
+    if "story_versions" not in st.session_state:
+        st.session_state.story_versions = None
+    
+    # Background generation or revision job ({"id", "kind"}), polled across reruns
+    if "active_job" not in st.session_state:
+        st.session_state.active_job = None
+    
+    # Story generated ahead of the last questions ({"id", "params"}) and the tokens wasted on discarded ones
+    if "speculation" not in st.session_state:
+        st.session_state.speculation = None
+        st.session_state.speculation_wasted = 0
+    
+    # Library view: only the visible page of saved stories is kept and rendered
     if "saved_stories" not in st.session_state:
-        st.session_state.saved_stories = load_saved_stories()
+        st.session_state.saved_stories = []
+        st.session_state.library_total = 0
+        st.session_state.library_stale = True
+    
+    if "library_page" not in st.session_state:
+        st.session_state.library_page = 0
+    
+    if "library_page_size" not in st.session_state:
+        st.session_state.library_page_size = APP_CONFIG["library_page_size"]
+    
+    if "library_sort" not in st.session_state:
+        st.session_state.library_sort = APP_CONFIG["library_sort"]
+    
+    if "library_info" not in st.session_state:
+        st.session_state.library_info = None
+    
+    if "library_query" not in st.session_state:
+        st.session_state.library_query = ""
+        st.session_state.library_results = []
     
     # UI state
     if "show_api_settings" not in st.session_state:
@@ -72,6 +113,9 @@ def init_session_state():
     
     if "word_count" not in st.session_state:
         st.session_state.word_count = APP_CONFIG["default_word_count"]
+    
+    if "use_cache" not in st.session_state:
+        st.session_state.use_cache = True
 
 def handle_input():
     """Handle user input submission"""
@@ -79,6 +123,9 @@ def handle_input():
         # Get the current input value
         user_message = st.session_state.user_input
         
+        # Back to the most recent messages when the conversation moves on
+        st.session_state.chat_window = APP_CONFIG["chat_window"]
+        
         # Process the message
         process_message(user_message)
         
@@ -130,6 +177,8 @@ def process_message(user_message):
             "content": f"Great setting! Finally, do you have a theme or message you'd like to explore in this story? (Or type 'skip' to proceed without a theme)"
         })
         st.session_state.story_state = "theme"
+        # Start writing the story while the theme and title are asked for
+        maybe_speculate()
         
     elif st.session_state.story_state == "theme":
         # Theme state - Process theme and ask for title
@@ -140,6 +189,8 @@ def process_message(user_message):
             "content": f"Would you like to provide a title for your story? (Or type 'skip' to let me generate one for you)"
         })
         st.session_state.story_state = "title"
+        # A theme changes the story; restart the speculation with it
+        maybe_speculate()
         
     elif st.session_state.story_state == "title":
         # Title state - Process title and generate story
@@ -158,10 +209,11 @@ def process_message(user_message):
         
         if "save" in command or "download" in command:
             # Save the story
-            save_current_story()
+            record = save_current_story()
+            notice = duplicate_notice(record)
             st.session_state.chat_history.append({
                 "role": "assistant", 
-                "content": f"✅ I've saved your story! You can find it in the sidebar. What would you like to do next? You can start a new story, or make changes to this one."
+                "content": f"✅ I've saved your story! You can find it in the sidebar.{' ' + notice if notice else ''} What would you like to do next? You can start a new story, or make changes to this one."
             })
         
         elif "new" in command or "another" in command or "start over" in command:
@@ -173,6 +225,13 @@ def process_message(user_message):
             })
             st.session_state.story_state = "genre"
         
+        elif command in ("undo", "undo revision", "revert"):
+            # Step back to the version before the last revision
+            st.session_state.chat_history.append({
+                "role": "assistant", 
+                "content": "↩️ I've undone the last revision." if undo_revision() else "There is no revision to undo."
+            })
+        
         elif any(word in command for word in ["revise", "change", "modify", "edit", "update", "rewrite"]):
             # Handle story revision request
             st.session_state.chat_history.append({
@@ -189,89 +248,269 @@ def process_message(user_message):
             })
     
     elif st.session_state.story_state == "revising":
-        # Revising state - Make changes to the story
+        # Revising state - Make changes to the story in the background
         if st.session_state.generated_story:
-            try:
-                # Create generator
-                api_key = get_api_key()
-                generator = StoryGenerator(api_key)
+            session_id = st.session_state.session_id
+            story_content = st.session_state.generated_story["content"]
+            revision_params = dict(
+                model=st.session_state.model,
+                temperature=st.session_state.temperature,
+                use_cache=st.session_state.use_cache
+            )
                 
-                # Get the expansion
-                revised_story = generator.expand_story(
-                    st.session_state.generated_story["content"],
-                    user_message,
-                    model=st.session_state.model,
-                    temperature=st.session_state.temperature
-                )
+            def revise_story(job):
+                generator = StoryGenerator(api_key, session_id=session_id)
+                # Edit only the affected paragraphs when possible
+                revise = generator.revise_story if APP_CONFIG["revision_mode"] == "sections" else generator.expand_story
+                return revise(story_content, user_message, **revision_params)
                 
-                # Update the story
-                st.session_state.generated_story["content"] = revised_story
-                st.session_state.generated_story["metadata"]["last_revised"] = datetime.datetime.now().isoformat()
+            if start_job("revision", revise_story):
+                st.session_state.active_job["request"] = user_message
                 
-                st.session_state.chat_history.append({
-                    "role": "assistant", 
-                    "content": "I've updated your story with the requested changes. What would you like to do next?"
-                })
-                
-                st.session_state.story_state = "display"
-                
-            except Exception as e:
-                st.error(f"Failed to revise story: {str(e)}")
-                st.session_state.chat_history.append({
-                    "role": "assistant", 
-                    "content": f"I'm sorry, I had trouble updating the story. Would you like to try again with a different request?"
-                })
-
-def generate_story_content():
-    """Generate story content based on user inputs"""
+def start_job(kind, fn):
+    """
+    Submit a background job for this session.
+    Returns False, after telling the user why, if the job was not admitted.
+    """
     try:
-        api_key = get_api_key()
-        if not api_key:
-            st.error("API key is required to generate a story")
-            return False
-            
-        # Create story generator
-        generator = StoryGenerator(api_key)
-        
-        # Generate the story
-        story_result = generator.generate_story(
-            title=st.session_state.title,
-            genre=st.session_state.genre,
-            characters=st.session_state.characters,
-            setting=st.session_state.setting,
-            theme=st.session_state.theme,
-            word_count=st.session_state.word_count,
-            temperature=st.session_state.temperature,
-            model=st.session_state.model
-        )
-        
-        # Store the result
-        st.session_state.generated_story = story_result
-        if not st.session_state.title and "title" in story_result:
-            st.session_state.title = story_result["title"]
-        
-        # Add to chat history
+        job = get_job_queue().submit(kind, fn, session_id=st.session_state.session_id)
+    except JobRejected as e:
         st.session_state.chat_history.append({
             "role": "assistant", 
-            "content": f"📖 **{story_result['title']}**\n\n{story_result['content'][:200]}... *(full story shown below)*\n\nWhat would you like to do with this story? You can save it, start a new one, or ask for changes."
+            "content": f"⏳ {str(e)}"
         })
+        return False
+    st.session_state.active_job = {"id": job.id, "kind": kind}
+    return True
         
-        # Update state
-        st.session_state.story_state = "display"
-        return True
+def cancel_active_job():
+    """Cancel this session's background job, if any, and forget it"""
+    if st.session_state.active_job:
+        get_job_queue().cancel(st.session_state.active_job["id"])
+        st.session_state.active_job = None
         
-    except Exception as e:
-        st.error(f"Failed to generate story: {str(e)}")
+def current_story_params():
+    """Story generation parameters from the conversation and settings so far"""
+    return dict(
+        title=st.session_state.title,
+        genre=st.session_state.genre,
+        characters=st.session_state.characters,
+        setting=st.session_state.setting,
+        theme=st.session_state.theme,
+        word_count=st.session_state.word_count,
+        temperature=st.session_state.temperature,
+        model=st.session_state.model,
+        use_cache=st.session_state.use_cache
+    )
+    
+def story_job(api_key, session_id, story_params, long_form=False):
+    """Job function writing a story with the given parameters"""
+    def write_story(job):
+        generator = StoryGenerator(api_key, session_id=session_id)
+        if long_form:
+            # Outline first, then write the chapters in parallel
+            return generator.generate_long_story(**story_params)
+        if APP_CONFIG["stream_responses"]:
+            # Publish chunks progressively as they arrive
+            story_stream = generator.stream_story(**story_params)
+            job.stream(story_stream, story_params["word_count"])
+            return story_stream.result
+        return generator.generate_story(**story_params)
+    return write_story
+    
+def maybe_speculate():
+    """
+    Speculatively start writing the story before the last questions are answered.
+    
+    Most users skip the theme and title, so the story is started with neither
+    as soon as the setting is known (and restarted if a theme is given). It is
+    adopted if the final parameters match and discarded otherwise. Nothing is
+    started for long-form stories, once the session has wasted its share of
+    tokens on discarded speculations, or when no worker is spare.
+    """
+    if not APP_CONFIG["speculation_enabled"] or is_long_form():
+        return
+    api_key = get_api_key()
+    if not api_key:
+        return
+    
+    story_params = current_story_params()
+    spec = st.session_state.speculation
+    if spec and spec["params"] == story_params:
+        return
+    discard_speculation()
+    
+    if st.session_state.speculation_wasted >= APP_CONFIG["speculation_max_wasted_tokens"]:
+        speculation.record_skip()
+        return
+    
+    session_id = st.session_state.session_id
+    
+    # Always streamed, so a discarded speculation stops at its next chunk
+    def write_story(job):
+        generator = StoryGenerator(api_key, session_id=session_id)
+        story_stream = generator.stream_story(**story_params)
+        job.stream(story_stream, story_params["word_count"])
+        return story_stream.result
+    
+    # Only on a spare worker, leaving one free and most of them to real requests. No
+    # session id: it must not take the session's slot for real requests, and the
+    # session holds at most one speculation (a discarded one may still be stopping)
+    job = get_job_queue().submit_spare("speculation", write_story, APP_CONFIG["speculation_max_load"])
+    if job is None:
+        speculation.record_skip()
+        return
+    st.session_state.speculation = {"id": job.id, "params": story_params}
+    speculation.record_start()
+
+def discard_speculation():
+    """Cancel the session's speculative story, counting it as a miss"""
+    spec = st.session_state.speculation
+    if not spec:
+        return
+    st.session_state.speculation = None
+    queue = get_job_queue()
+    job = queue.get(spec["id"])
+    queue.cancel(spec["id"])
+    text = None
+    if job is not None and job.started_at is not None:
+        text = job.result["content"] if job.status == "done" and job.result else job.text
+    wasted = speculation.wasted_tokens(spec["params"], text)
+    st.session_state.speculation_wasted += wasted
+    speculation.record_miss(wasted)
+
+def adopt_speculation(story_params):
+    """
+    Make the speculative story the session's story job if it was started with
+    the final parameters.
+    
+    Returns:
+    - True if it was adopted, False if there was none or it was discarded
+    """
+    spec = st.session_state.speculation
+    if not spec:
+        return False
+    job = get_job_queue().get(spec["id"])
+    if spec["params"] != story_params or job is None or job.status in ("failed", "cancelled"):
+        discard_speculation()
+        return False
+    st.session_state.speculation = None
+    st.session_state.active_job = {"id": job.id, "kind": "story"}
+    # Time already spent writing it is taken off the wait
+    started = job.started_at or time.time()
+    speculation.record_hit((job.finished_at or time.time()) - started)
+    return True
+
+def start_story_job():
+    """Submit the story generation job for the current story parameters"""
+    api_key = get_api_key()
+    if not api_key:
+        st.error("API key is required to generate a story")
+        return
+    
+    story_params = current_story_params()
+    if adopt_speculation(story_params):
+        return
+    
+    write_story = story_job(api_key, st.session_state.session_id, story_params, is_long_form())
+    if not start_job("story", write_story):
+        # Not admitted: sending the title again retries
         st.session_state.chat_history.append({
             "role": "assistant", 
-            "content": f"I'm sorry, I had trouble generating your story. Would you like to try again?"
+            "content": "Send your title again (or 'skip') when you're ready to retry."
         })
-        # Revert to setting state
-        st.session_state.story_state = "setting" 
-        return False
+        st.session_state.story_state = "title"
+
+def collect_active_job():
+    """Apply the result of this session's background job once it has finished"""
+    active = st.session_state.active_job
+    if not active:
+        return
+    job = get_job_queue().get(active["id"])
+    if job is not None and not job.finished:
+        return
+    st.session_state.active_job = None
+    error = job.error if job is not None else "the job was lost (the server may have restarted)"
+    
+    if active["kind"] == "story":
+        if job is not None and job.status == "done":
+            story_result = job.result
+            
+            # Store the result
+            st.session_state.generated_story = story_result
+            st.session_state.story_versions = VersionHistory(story_result["content"])
+            if not st.session_state.title and "title" in story_result:
+                st.session_state.title = story_result["title"]
+            
+            # Add to chat history
+            st.session_state.chat_history.append({
+                "role": "assistant", 
+                "content": f"📖 **{story_result['title']}**\n\n{story_result['content'][:200]}... *(full story shown below)*\n\nWhat would you like to do with this story? You can save it, start a new one, or ask for changes."
+            })
+            
+            # Update state
+            st.session_state.story_state = "display"
+        elif job is None or job.status == "failed":
+            st.error(f"Failed to generate story: {error}")
+            st.session_state.chat_history.append({
+                "role": "assistant", 
+                "content": f"I'm sorry, I had trouble generating your story. Would you like to try again?"
+            })
+            # Revert to setting state
+            st.session_state.story_state = "setting"
+    
+    elif active["kind"] == "revision":
+        if job is not None and job.status == "done":
+            # Update the story, keeping the previous version in its history
+            st.session_state.story_versions.commit(job.result, active.get("request"))
+            st.session_state.generated_story["content"] = job.result
+            st.session_state.generated_story["metadata"]["last_revised"] = datetime.datetime.now().isoformat()
+            
+            st.session_state.chat_history.append({
+                "role": "assistant", 
+                "content": "I've updated your story with the requested changes. What would you like to do next?"
+            })
+            
+            st.session_state.story_state = "display"
+        elif job is None or job.status == "failed":
+            st.error(f"Failed to revise story: {error}")
+            st.session_state.chat_history.append({
+                "role": "assistant", 
+                "content": f"I'm sorry, I had trouble updating the story. Would you like to try again with a different request?"
+            })
+
+@st.fragment(run_every=APP_CONFIG["job_poll_interval"])
+def render_job_status():
+    """
+    Show the progress of this session's background job, polling until it finishes.
+    Only called while a job is active, so idle sessions don't rerun on a timer.
+    """
+    active = st.session_state.active_job
+    if not active:
+        return
+    job = get_job_queue().get(active["id"])
+    if job is None or job.finished:
+        # Apply the result in a full rerun
+        st.rerun()
+    
+    status = job.snapshot()
+    action = "Writing your story" if active["kind"] == "story" else "Updating your story"
+    if status["status"] == "queued":
+        st.info(f"⏳ Waiting for a free storyteller... ({status['queued_seconds']:.0f}s)")
+    else:
+        st.info(f"✍️ {action}... ({status['elapsed_seconds']:.0f}s)")
+    if status["progress"] is not None:
+        st.progress(status["progress"])
+    if status["text"]:
+        with st.expander("📖 Full Story", expanded=True):
+            st.markdown(status["text"])
+
+def is_long_form():
+    """Whether the requested length calls for outline-then-chapters generation"""
+    return st.session_state.word_count > APP_CONFIG["long_form_threshold"]
 
 def save_current_story():
-    """Save the current story to a file"""
+    """Save the current story to a file and return its record"""
     if not st.session_state.generated_story:
         st.error("No story to save")
         return
@@ -289,11 +528,47 @@ def save_current_story():
         "saved_at": datetime.datetime.now().isoformat()
     }
     
-    # Save the story
-    save_story_to_file(story["title"], story["content"], metadata)
+    # Save the story with its revision history
+    versions = st.session_state.story_versions
+    record = save_story_to_file(story["title"], story["content"], metadata, versions=versions.to_dict() if versions and len(versions) > 1 else None)
     
-    # Reload stories
-    st.session_state.saved_stories = load_saved_stories()
+    # Reload the visible library page on the next render
+    st.session_state.library_stale = True
+    return record
+
+def duplicate_notice(record):
+    """Message about the near-duplicates found when a story was saved, or None"""
+    duplicates = (record or {}).get("near_duplicates")
+    if not duplicates:
+        return None
+    names = ", ".join(f"\"{duplicate['title']}\" ({duplicate['similarity']:.0%} similar)" for duplicate in duplicates[:3])
+    if APP_CONFIG["dedupe_on_save"] == "merge":
+        return f"It replaced {len(duplicates)} nearly identical saved {'story' if len(duplicates) == 1 else 'stories'}: {names}."
+    return f"⚠️ It is nearly identical to {names} in your library."
+
+def load_versions(story):
+    """Revision history of a loaded story; one saved without a history starts a new one"""
+    data = story.pop("versions", None)
+    if data:
+        versions = VersionHistory.from_dict(data)
+        if versions.text == story["content"]:
+            return versions
+    return VersionHistory(story["content"])
+
+def undo_revision():
+    """
+    Restore the story to the version before its last revision.
+    Returns False if there is no revision to undo.
+    """
+    versions = st.session_state.story_versions
+    if not versions or st.session_state.active_job:
+        return False
+    text = versions.undo()
+    if text is None:
+        return False
+    st.session_state.generated_story["content"] = text
+    st.session_state.generated_story.setdefault("metadata", {})["last_revised"] = datetime.datetime.now().isoformat()
+    return True
 
 def reset_story_state():
     """Reset story state for a new story"""
@@ -303,9 +578,79 @@ def reset_story_state():
     st.session_state.theme = None
     st.session_state.title = None
     st.session_state.generated_story = None
-    st.session_state.story_id = str(int(time.time()))
+    st.session_state.story_versions = None
+    cancel_active_job()
+    discard_speculation()
+    st.session_state.story_id = new_story_id()
     st.session_state.timestamp = datetime.datetime.now().isoformat()
 
+def refresh_library():
+    """Load the visible page of saved stories from the index"""
+    page_size = st.session_state.library_page_size
+    total = count_saved_stories()
+    last_page = max(0, math.ceil(total / page_size) - 1)
+    st.session_state.library_page = min(st.session_state.library_page, last_page)
+    st.session_state.library_total = total
+    st.session_state.saved_stories = load_saved_stories(
+        order=st.session_state.library_sort,
+        offset=st.session_state.library_page * page_size,
+        limit=page_size
+    )
+    query = st.session_state.library_query.strip()
+    st.session_state.library_results = search_saved_stories(query) if query else []
+    st.session_state.library_stale = False
+
+def set_library_page(page):
+    """Show another page of the library"""
+    st.session_state.library_page = page
+    st.session_state.library_info = None
+    st.session_state.library_stale = True
+
+def set_library_query():
+    """Search the library for the text in the search box"""
+    st.session_state.library_query = st.session_state.selected_library_query
+    st.session_state.library_info = None
+    st.session_state.library_stale = True
+
+def set_library_sort():
+    """Set the library sort order, starting again from the first page"""
+    st.session_state.library_sort = st.session_state.selected_library_sort
+    set_library_page(0)
+
+def set_library_page_size():
+    """Set the number of stories per library page, starting again from the first page"""
+    st.session_state.library_page_size = st.session_state.selected_library_page_size
+    set_library_page(0)
+
+def toggle_library_info(file_path):
+    """Show or hide the details of one saved story"""
+    if st.session_state.library_info == file_path:
+        st.session_state.library_info = None
+    else:
+        st.session_state.library_info = file_path
+
+def render_story_info(story):
+    """Show the details of one saved story, reading the story file only when opened"""
+    try:
+        metadata = load_story(story["file_path"]).get("metadata", {})
+    except Exception as e:
+        st.caption(f"Could not read story: {str(e)}")
+        return
+    
+    with st.container(border=True):
+        st.write(f"**Genre:** {metadata.get('genre') or 'Unknown'}")
+        st.write(f"**Created:** {(metadata.get('saved_at') or 'Unknown').split('T')[0]}")
+        if metadata.get("characters"):
+            st.write(f"**Characters:** {metadata['characters']}")
+        if metadata.get("setting"):
+            st.write(f"**Setting:** {metadata['setting']}")
+        if metadata.get("theme"):
+            st.write(f"**Theme:** {metadata['theme']}")
+
+def load_earlier_messages():
+    """Render another window of older chat messages"""
+    st.session_state.chat_window += APP_CONFIG["chat_window"]
+
 def toggle_advanced_options():
     """Toggle advanced options visibility"""
     st.session_state.show_advanced_options = not st.session_state.show_advanced_options
@@ -322,6 +667,10 @@ def set_word_count():
     """Set the word count to use"""
     st.session_state.word_count = st.session_state.selected_word_count
 
+def set_fresh_sample():
+    """Set whether to bypass the response cache"""
+    st.session_state.use_cache = not st.session_state.selected_fresh_sample
+
 def main():
     # Page configuration with app name from config
     st.set_page_config(
@@ -337,6 +686,9 @@ def main():
     # Initialize all session state variables
     init_session_state()
     
+    # Apply the result of a background job that finished since the last run
+    collect_active_job()
+    
     # Header with version
     st.title(f"{APP_CONFIG['app_icon']} {APP_CONFIG['app_name']}")
     st.caption(f"Chat with an AI storyteller to create your custom story • v{APP_CONFIG['version']}")
@@ -351,8 +703,12 @@ def main():
         # Stories section
         st.header("Your Stories")
         
+        # Query the visible page only when it changed
+        if st.session_state.library_stale:
+            refresh_library()
+        
         # If we have saved stories, display them
-        if st.session_state.saved_stories:
+        if st.session_state.library_total:
             # Add a new story button at the top
             if st.button("➕ New Story", use_container_width=True, type="primary"):
                 reset_story_state()
@@ -365,14 +721,65 @@ def main():
             
             # Display saved stories
             st.subheader("Saved Stories")
-            for i, story in enumerate(st.session_state.saved_stories):
+            
+            # Full-text search
+            st.text_input(
+                "Search stories",
+                value=st.session_state.library_query,
+                key="selected_library_query",
+                on_change=set_library_query,
+                placeholder="🔍 Search titles, content, characters...",
+                label_visibility="collapsed"
+            )
+            searching = bool(st.session_state.library_query.strip())
+            
+            # Sort order and page size
+            sort_labels = {"newest": "Newest first", "oldest": "Oldest first", "title": "Title A-Z"}
+            page_sizes = sorted(set(APP_CONFIG["library_page_sizes"]) | {st.session_state.library_page_size})
+            col1, col2 = st.columns([3, 2])
+            with col1:
+                st.selectbox(
+                    "Sort by",
+                    options=list(sort_labels),
+                    index=list(sort_labels).index(st.session_state.library_sort),
+                    format_func=sort_labels.get,
+                    key="selected_library_sort",
+                    on_change=set_library_sort,
+                    label_visibility="collapsed"
+                )
+            with col2:
+                st.selectbox(
+                    "Stories per page",
+                    options=page_sizes,
+                    index=page_sizes.index(st.session_state.library_page_size),
+                    format_func=lambda size: f"{size} / page",
+                    key="selected_library_page_size",
+                    on_change=set_library_page_size,
+                    label_visibility="collapsed"
+                )
+            
+            if searching:
+                stories = st.session_state.library_results
+                st.caption(f"{len(stories)} matching stories" if stories else "No matching stories")
+            else:
+                stories = st.session_state.saved_stories
+            
+            for i, story in enumerate(stories):
                 # Create a clickable card for each story
                 with st.container():
                     col1, col2 = st.columns([4, 1])
                     with col1:
                         if st.button(f"📖 {story['title']}", key=f"load_{i}", use_container_width=True):
-                            # Load the story data
+                            # Load the full story data
+                            try:
+                                story = load_story(story["file_path"])
+                            except Exception as e:
+                                st.error(f"Error loading story {story['file_path']}: {str(e)}")
+                                st.stop()
+                            cancel_active_job()
+                            discard_speculation()
                             st.session_state.generated_story = story
+                            st.session_state.story_versions = load_versions(story)
                             st.session_state.genre = story.get('metadata', {}).get('genre')
                             st.session_state.characters = story.get('metadata', {}).get('characters')
                             st.session_state.setting = story.get('metadata', {}).get('setting')
@@ -387,11 +794,36 @@ def main():
                             st.session_state.story_state = "display"
                             st.rerun()
                     
-                    # Show metadata in a tooltip/expander
-                    with st.expander("ℹ️", expanded=False):
-                        if 'metadata' in story:
-                            st.write(f"**Genre:** {story['metadata'].get('genre', 'Unknown')}")
-                            st.write(f"**Created:** {story['metadata'].get('saved_at', 'Unknown').split('T')[0]}")
+                    with col2:
+                        st.button(
+                            "ℹ️", key=f"info_{i}", use_container_width=True,
+                            on_click=toggle_library_info, args=(story["file_path"],)
+                        )
+                    
+                    if story.get("snippet"):
+                        st.caption(story["snippet"])
+                    
+                    # Details are only rendered, and the file only read, for the opened story
+                    if st.session_state.library_info == story["file_path"]:
+                        render_story_info(story)
+            
+            # Page navigation
+            page = st.session_state.library_page
+            pages = math.ceil(st.session_state.library_total / st.session_state.library_page_size)
+            if pages > 1 and not searching:
+                col1, col2, col3 = st.columns([1, 2, 1])
+                with col1:
+                    st.button(
+                        "◀", key="library_prev", disabled=page == 0,
+                        on_click=set_library_page, args=(page - 1,)
+                    )
+                with col2:
+                    st.caption(f"Page {page + 1} of {pages} · {st.session_state.library_total} stories")
+                with col3:
+                    st.button(
+                        "▶", key="library_next", disabled=page >= pages - 1,
+                        on_click=set_library_page, args=(page + 1,)
+                    )
         else:
             st.info("Start chatting to create your first story!")
         
@@ -430,11 +862,44 @@ def main():
                 # Word count slider
                 st.slider(
                     "Story Length",
-                    min_value=300, max_value=2000, step=100,
+                    min_value=300, max_value=APP_CONFIG["max_word_count"], step=100,
                     value=st.session_state.word_count,
                     key="selected_word_count",
                     on_change=set_word_count,
-                    help="Approximate word count for the generated story"
+                    help=f"Approximate word count for the generated story. Stories over {APP_CONFIG['long_form_threshold']} words are outlined first and written chapter by chapter."
+                )
+                
+                # Expected cost of the next story with the current settings
+                estimate = estimate_story_request(
+                    st.session_state.title, st.session_state.genre, st.session_state.characters,
+                    st.session_state.setting, st.session_state.theme,
+                    st.session_state.word_count, st.session_state.model
+                )
+                st.caption(
+                    f"Expected cost: ~{estimate['prompt_tokens']} prompt + ~{estimate['completion_tokens']} "
+                    f"completion tokens (max_tokens {estimate['max_tokens']})"
+                )
+                calibration = get_token_budget().calibration().get(model_family(st.session_state.model))
+                if calibration and calibration["samples"]:
+                    st.caption(
+                        f"Calibrated from {calibration['samples']} responses: {calibration['tokens_per_word']:.2f} tokens/word, "
+                        f"length ×{calibration['verbosity']:.2f}, prompt ×{calibration['prompt_ratio']:.2f}"
+                    )
+                
+                # Cache bypass
+                st.checkbox(
+                    "Fresh sample",
+                    value=not st.session_state.use_cache,
+                    key="selected_fresh_sample",
+                    on_change=set_fresh_sample,
+                    help="Always ask the model again instead of reusing a cached response for an identical request"
+                )
+        
+                # Memory held by this session's transcript
+                usage = st.session_state.chat_history.memory_usage()
+                st.caption(
+                    f"Chat memory: {usage['total_bytes'] / 1024:.1f} KiB for {usage['messages']} messages "
+                    f"({usage['archived_messages']} archived compressed)"
                 )
         
         # API Key Settings
@@ -459,23 +924,25 @@ def main():
     # Main content area
     main_container = st.container()
     
-    # Generate story if in generating state
-    if st.session_state.story_state == "generating":
-        try:
-            # Display a spinner while generating
-            with st.spinner("Generating your story... This may take a moment."):
-                # Generate the story
-                success = generate_story_content()
-                if success:
-                    st.rerun()  # Refresh to display the story
-        except Exception as e:
-            st.error(f"Failed to generate story: {str(e)}")
+    # Generation runs as a background job; this run only submits it and shows its progress
+    if st.session_state.story_state == "generating" and not st.session_state.active_job:
+        start_story_job()
+    # Only a session with a job in progress polls for its status
+    if st.session_state.active_job:
+        render_job_status()
             
     # Display chat interface in the main container
     with main_container:
-        # Display chat history
+        # Display the most recent part of the chat history
         if st.session_state.chat_history:
-            for i, message in enumerate(st.session_state.chat_history):
+            hidden = len(st.session_state.chat_history) - st.session_state.chat_window
+            if hidden > 0:
+                st.button(
+                    f"⬆️ Load earlier messages ({hidden} hidden)",
+                    key="load_earlier",
+                    on_click=load_earlier_messages
+                )
+            for message in st.session_state.chat_history.window(st.session_state.chat_window):
                 if message["role"] == "user":
                     st.chat_message("user").markdown(message["content"])
                 else:  # assistant
@@ -498,14 +965,23 @@ def main():
                         st.caption(f"Genre: {metadata.get('genre', 'Not specified')}")
                         if metadata.get('generation_time'):
                             st.caption(f"Generation time: {metadata.get('generation_time')} seconds")
+                        if metadata.get('time_to_first_token'):
+                            st.caption(f"Time to first token: {metadata.get('time_to_first_token')} seconds")
                         if metadata.get('model'):
                             st.caption(f"Model: {metadata.get('model')}")
                 
                 with col2:
                     # Action buttons
                     if st.button("Save Story", key="save_button"):
-                        save_current_story()
+                        notice = duplicate_notice(save_current_story())
                         st.success("✅ Story saved!")
+                        if notice:
+                            st.warning(notice)
+                    
+                    versions = st.session_state.story_versions
+                    if versions and versions.current > 0 and st.button("↩️ Undo Revision", key="undo_button"):
+                        undo_revision()
+                        st.rerun()
                     
                     if st.button("Start New Story", key="new_button"):
                         reset_story_state()
@@ -515,6 +991,21 @@ def main():
                         })
                         st.session_state.story_state = "genre"
                         st.rerun()
+            
+            # Revision history, with the changes of each revision highlighted
+            versions = st.session_state.story_versions
+            if versions and len(versions) > 1:
+                with st.expander(f"🕘 Revision History ({len(versions) - 1} revision{'s' if len(versions) > 2 else ''})"):
+                    infos = versions.versions()
+                    
+                    def describe(index):
+                        info = infos[index]
+                        state = " (current)" if index == versions.current else " (undone)" if index > versions.current else ""
+                        return f"Version {index + 1}{state}: {info['request'] or 'revision'}"
+                    
+                    index = st.selectbox("Revision", list(range(len(versions) - 1, 0, -1)), format_func=describe)
+                    previous, delta = versions.delta(index)
+                    st.html(render_diff_html(previous, delta))
         
         # Input at the bottom - only show if we have an API key
         if get_api_key():
@@ -532,6 +1023,8 @@ def main():
                 placeholder = "Enter a title (or 'skip' to auto-generate)..."
             elif st.session_state.story_state == "revising":
                 placeholder = "Describe what changes you'd like to make..."
+            if st.session_state.active_job:
+                placeholder = "Please wait while I work on your story..."
             
             # Initial welcome message if no chat history
             if not st.session_state.chat_history:
@@ -544,7 +1037,8 @@ def main():
             st.chat_input(
                 placeholder=placeholder,
                 key="user_input",
-                on_submit=handle_input
+                on_submit=handle_input,
+                disabled=bool(st.session_state.active_job)
             )
         else:
             st.warning("⚠️ Please enter your Groq API key in the sidebar to continue.")
@@ -0,0 +1,7 @@
+# benchmarks/__init__.py
+"""
+Benchmarks for the local hot paths of the app (no network).
+
+Run from the project root:
+    python -m benchmarks.run --sizes 1000 10000 --output results.json
+"""
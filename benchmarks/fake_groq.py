@@ -0,0 +1,60 @@
+# benchmarks/fake_groq.py
+from types import SimpleNamespace
+
+STORY_TEXT = "Title: The Lantern Keeper\n\n" + "\n\n".join(
+    "The lantern keeper walked the harbour wall at dusk, counting the ships that had not come home. "
+    "\"They will come,\" she said to the gulls, and the gulls, as always, said nothing useful."
+    for _ in range(12)
+)
+
+class _Raw:
+    """Raw response as returned by with_raw_response: headers plus parse()."""
+    
+    def __init__(self, value):
+        self.value = value
+        self.headers = {"x-ratelimit-remaining-requests": "10000", "x-ratelimit-remaining-tokens": "1000000"}
+    
+    def parse(self):
+        return self.value
+
+class _Stream:
+    def __init__(self, chunks):
+        self._chunks = chunks
+    
+    def __iter__(self):
+        return iter(self._chunks)
+    
+    def close(self):
+        pass
+
+class _Completions:
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+        self.with_raw_response = SimpleNamespace(create=lambda **kwargs: _Raw(self.create(**kwargs)))
+    
+    def create(self, model, messages, max_tokens=None, temperature=None, stream=False):
+        self.calls += 1
+        usage = SimpleNamespace(prompt_tokens=200, completion_tokens=len(self.text.split()), total_tokens=0)
+        if not stream:
+            choice = SimpleNamespace(message=SimpleNamespace(content=self.text), finish_reason="stop")
+            return SimpleNamespace(choices=[choice], usage=usage)
+        
+        chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "), finish_reason=None)], x_groq=None)
+            for word in self.text.split(" ")
+        ]
+        chunks.append(SimpleNamespace(
+            choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason="stop")],
+            x_groq=SimpleNamespace(usage=usage)
+        ))
+        return _Stream(chunks)
+
+class FakeGroq:
+    """
+    Stand-in for the Groq client that answers instantly with a canned story,
+    so benchmarks measure only local work.
+    """
+    
+    def __init__(self, text=STORY_TEXT):
+        self.chat = SimpleNamespace(completions=_Completions(text))
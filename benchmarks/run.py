@@ -0,0 +1,271 @@
+# benchmarks/run.py
+"""
+Benchmark the app's local hot paths against a fake Groq backend.
+
+Each scenario reports the median wall time of several runs and the peak
+memory allocated during one extra traced run. Results are written as JSON;
+pass a previous results file as --baseline to flag regressions.
+
+Usage:
+    python -m benchmarks.run --sizes 1000 10000 100000 -o results.json
+    python -m benchmarks.run -o new.json --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from streamlit.testing.v1 import AppTest
+import utils.config as config
+import utils.story_generator as story_generator
+from utils.config import APP_CONFIG, load_saved_stories, save_story_to_file, search_saved_stories
+import utils.scheduler as scheduler
+from benchmarks.fake_groq import FakeGroq, STORY_TEXT
+from benchmarks.library import make_library
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_SCRIPT = str(ROOT / "app.py")
+
+# Answers that walk the conversation from the welcome message to a displayed story
+CONVERSATION = ["Let's write a story", "Fantasy", "A keeper and a stranger", "A harbour town", "skip", "skip"]
+
+def measure(fn, repeat=3, setup=None):
+    """
+    Time a scenario and record its peak traced memory.
+    
+    Parameters:
+    - fn: Callable taking the value returned by setup
+    - repeat: Number of timed runs
+    - setup: Optional callable run (untimed) before every run
+    
+    Returns:
+    - Dictionary with median and min seconds, runs and peak_kib
+    """
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state)
+        times.append(time.perf_counter() - start)
+    
+    # Tracing slows everything down, so memory comes from a separate run
+    state = setup() if setup else None
+    tracemalloc.start()
+    try:
+        fn(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    return {
+        "seconds": round(statistics.median(times), 6),
+        "min_seconds": round(min(times), 6),
+        "runs": repeat,
+        "peak_kib": round(peak / 1024, 1)
+    }
+
+def reset_index():
+    """Drop the process-wide story indexes so the next access reopens them."""
+    with config._story_index_lock:
+        for index in config._story_indexes.values():
+            index.close()
+        config._story_indexes.clear()
+
+def use_library(path):
+    """Point the app's storage at a library directory."""
+    APP_CONFIG["file_storage_path"] = str(path)
+    reset_index()
+
+def remove_new_files(path, before):
+    """Delete story files created by a scenario so the library stays at its size."""
+    for file_path in set(Path(path).glob("*.json")) - before:
+        file_path.unlink()
+    reset_index()
+
+def patch_backend():
+    """Route every Groq call to the fake client and lift rate limits and caching."""
+    os.environ["GROQ_API_KEY"] = "benchmark"
+    story_generator.get_client = lambda api_key, hold=False: FakeGroq()
+    scheduler._scheduler = scheduler.RequestScheduler(
+        rate_limits={"default": {"requests_per_minute": 10 ** 9, "tokens_per_minute": 10 ** 12}}
+    )
+    APP_CONFIG["cache_enabled"] = False
+    APP_CONFIG["telemetry_log_enabled"] = False
+
+def wait_for_job(at, timeout=30.0):
+    """Rerun the app until the session's background job has been collected."""
+    deadline = time.monotonic() + timeout
+    while at.session_state.active_job:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Background job did not finish in time")
+        time.sleep(0.001)
+        at.run()
+    return at
+
+def run_conversation(at):
+    """Answer every prompt of the story conversation, then save the story."""
+    for message in CONVERSATION:
+        at.chat_input[0].set_value(message).run()
+    wait_for_job(at)
+    at.chat_input[0].set_value("save").run()
+    if at.session_state.story_state != "display" or at.exception:
+        raise RuntimeError(f"Conversation did not reach a displayed story (state {at.session_state.story_state})")
+    return at
+
+def library_scenarios(path, size, repeat):
+    results = {}
+    
+    def cold_setup():
+        reset_index()
+        for file_path in path.glob(APP_CONFIG["story_index_file"] + "*"):
+            file_path.unlink()
+    
+    results[f"load_saved_stories/cold[{size}]"] = measure(
+        lambda _: load_saved_stories(), repeat, cold_setup
+    )
+    results[f"load_saved_stories/warm[{size}]"] = measure(
+        lambda _: load_saved_stories(), repeat, reset_index
+    )
+    results[f"load_saved_stories/cached[{size}]"] = measure(
+        lambda _: load_saved_stories(), repeat
+    )
+    
+    queries = ["lantern", "harbour keeper", "kavo", "silver dra", "stranger winter glass"]
+    results[f"search x{len(queries)}[{size}]"] = measure(
+        lambda _: [search_saved_stories(query) for query in queries], repeat
+    )
+    
+    before = set(path.glob("*.json"))
+    counter = iter(range(10 ** 9))
+    def save_many(_):
+        for _ in range(100):
+            i = next(counter)
+            save_story_to_file(f"Benchmark Story {i}", STORY_TEXT, {"genre": "Fantasy", "saved_at": datetime.now().isoformat()})
+    results[f"save_story_to_file x100[{size}]"] = measure(save_many, repeat)
+    remove_new_files(path, before)
+    return results
+
+def app_scenarios(path, size, repeat):
+    results = {}
+    before = set(path.glob("*.json"))
+    
+    def fresh_app():
+        reset_index()
+        return AppTest.from_file(APP_SCRIPT, default_timeout=600)
+    
+    results[f"app/cold_start[{size}]"] = measure(lambda at: at.run(), repeat, fresh_app)
+    results[f"app/rerun[{size}]"] = measure(lambda at: at.run(), repeat, lambda: fresh_app().run())
+    results[f"app/conversation[{size}]"] = measure(run_conversation, repeat, lambda: fresh_app().run())
+    remove_new_files(path, before)
+    return results
+
+def generator_scenarios(repeat):
+    generator = story_generator.StoryGenerator("benchmark", session_id="benchmark")
+    texts = [STORY_TEXT, "# " + STORY_TEXT[7:], "\n" + STORY_TEXT, STORY_TEXT.replace("Title: ", "")] * 2500
+    
+    def extract_titles(_):
+        for text in texts:
+            generator._finalize_story(text, None, "Fantasy", "a", "b", None, 800, 0.7, "model", 1.0)
+    
+    return {
+        "title_extraction x10000": measure(extract_titles, repeat),
+        "generate_story x100": measure(
+            lambda _: [generator.generate_story(None, "Fantasy", "a", "b", use_cache=False) for _ in range(100)], repeat
+        )
+    }
+
+def compare(results, baseline, threshold):
+    """
+    Compare median times against a baseline.
+    
+    Returns:
+    - List of (scenario, baseline seconds, current seconds, ratio) for regressions beyond threshold
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous["seconds"]:
+            continue
+        ratio = current["seconds"] / previous["seconds"]
+        marker = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:45s} {previous['seconds']:10.4f}s -> {current['seconds']:10.4f}s  x{ratio:5.2f} {marker}")
+        if marker:
+            regressions.append((name, previous["seconds"], current["seconds"], ratio))
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app's local hot paths with a fake Groq backend.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Library sizes to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per scenario")
+    parser.add_argument("--app-max-size", type=int, default=10000, help="Largest library to drive the full app on (AppTest is slow)")
+    parser.add_argument("--data-dir", default=str(ROOT / "benchmarks" / ".data"), help="Where synthetic libraries are kept between runs")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--baseline", default=None, help="Previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Slowdown ratio above 1 reported as a regression")
+    parser.add_argument("--clean", action="store_true", help="Delete the synthetic libraries afterwards")
+    args = parser.parse_args(argv)
+    
+    patch_backend()
+    data_dir = Path(args.data_dir)
+    original_storage = APP_CONFIG["file_storage_path"]
+    results = {}
+    try:
+        results.update(generator_scenarios(args.repeat))
+        for size in args.sizes:
+            print(f"Preparing library of {size} stories...", file=sys.stderr)
+            path = make_library(data_dir / f"library-{size}", size)
+            use_library(path)
+            print(f"Benchmarking library of {size} stories...", file=sys.stderr)
+            results.update(library_scenarios(path, size, args.repeat))
+            if size <= args.app_max_size:
+                results.update(app_scenarios(path, size, args.repeat))
+    finally:
+        use_library(original_storage)
+        if args.clean:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": args.sizes,
+            "repeat": args.repeat
+        },
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    
+    for name, result in results.items():
+        print(f"{name:45s} {result['seconds']:10.4f}s  peak {result['peak_kib']:>10.1f} KiB")
+    print(f"Results written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        print(f"\nCompared with {args.baseline}:")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} scenario(s) slower than x{1 + args.threshold:.2f}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# benchmarks/stress_storage.py
+"""
+Multi-threaded stress test of story storage.
+
+Writer threads save stories concurrently, all under the same title and
+spread over several user namespaces, while reader threads keep listing,
+searching and loading stories. The run fails (exit status 1) if any save
+is lost or overwritten, any read sees a partly written story, or a story
+shows up in another user's namespace.
+
+Usage:
+    python -m benchmarks.stress_storage --writers 16 --saves 50
+    python -m benchmarks.stress_storage --backend segment --no-wal
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import utils.config as config
+from utils.config import (
+    APP_CONFIG, count_saved_stories, load_saved_stories, load_story, new_story_id,
+    save_story_to_file, search_saved_stories
+)
+from benchmarks.run import reset_index
+
+TITLE = "The Lantern Keeper"
+
+def _writer(namespace, writer, saves, barrier, results):
+    barrier.wait()
+    for i in range(saves):
+        content = f"writer {writer} story {i} " + "the keeper walked the harbour wall " * 40
+        start = time.perf_counter()
+        try:
+            record = save_story_to_file(
+                TITLE, content, {"genre": "Fantasy", "writer": writer}, story_id=new_story_id(), namespace=namespace
+            )
+        except Exception as e:
+            results["errors"].append(f"save failed in {namespace}: {e}")
+            continue
+        results["save_seconds"].append(time.perf_counter() - start)
+        results["saved"].append((namespace, record["file_path"], content))
+
+def _reader(namespaces, stop, results):
+    while not stop.is_set():
+        for namespace in namespaces:
+            try:
+                for record in load_saved_stories(limit=5, namespace=namespace):
+                    story = load_story(record["file_path"])
+                    if story["title"] != TITLE or not story["content"].startswith("writer "):
+                        results["errors"].append(f"inconsistent read of {record['file_path']}")
+                search_saved_stories("harbour", 5, namespace=namespace)
+                results["reads"] += 1
+            except Exception as e:
+                results["errors"].append(f"read failed in {namespace}: {e}")
+
+def run_stress(path, writers=16, saves=50, readers=4, namespaces=4):
+    """
+    Run one stress test against a fresh library directory.
+    
+    Parameters:
+    - path: Empty directory to keep the library in
+    - writers: Number of concurrent writer threads
+    - saves: Stories saved by each writer
+    - readers: Number of concurrent reader threads
+    - namespaces: Number of user namespaces the writers are spread over
+    
+    Returns:
+    - Dictionary with throughput, latency and the list of consistency errors
+    """
+    APP_CONFIG["file_storage_path"] = str(path)
+    APP_CONFIG["storage_namespaces"] = True
+    reset_index()
+    config._story_stores.clear()
+    
+    names = [f"user{n}" for n in range(namespaces)]
+    results = {"saved": [], "save_seconds": [], "reads": 0, "errors": []}
+    barrier = threading.Barrier(writers)
+    stop = threading.Event()
+    writer_threads = [
+        threading.Thread(target=_writer, args=(names[w % namespaces], w, saves, barrier, results))
+        for w in range(writers)
+    ]
+    reader_threads = [threading.Thread(target=_reader, args=(names, stop, results)) for _ in range(readers)]
+    
+    # Open every namespace up front so the run measures saving, not startup reconciles
+    for name in names:
+        count_saved_stories(namespace=name)
+    
+    for thread in reader_threads:
+        thread.start()
+    start = time.perf_counter()
+    for thread in writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in reader_threads:
+        thread.join()
+    
+    # Every save must be listed in its own namespace and read back intact
+    errors = results["errors"]
+    expected = {name: [] for name in names}
+    for namespace, file_path, content in results["saved"]:
+        expected[namespace].append((file_path, content))
+    for name in names:
+        listed = {record["file_path"] for record in load_saved_stories(namespace=name)}
+        paths = [file_path for file_path, _ in expected[name]]
+        if len(set(paths)) != len(paths):
+            errors.append(f"{name}: {len(paths) - len(set(paths))} saves reused another story's id")
+        if listed != set(paths):
+            errors.append(f"{name}: {len(set(paths) - listed)} saves missing, {len(listed - set(paths))} unexpected")
+        for file_path, content in expected[name]:
+            if load_story(file_path)["content"] != content:
+                errors.append(f"{name}: {file_path} does not hold the content saved to it")
+    
+    save_seconds = sorted(results["save_seconds"]) or [0.0]
+    return {
+        "backend": APP_CONFIG["storage_backend"],
+        "wal": APP_CONFIG["story_index_wal"],
+        "writers": writers,
+        "readers": readers,
+        "namespaces": namespaces,
+        "saves": len(results["saved"]),
+        "seconds": round(elapsed, 3),
+        "saves_per_second": round(len(results["saved"]) / elapsed, 1) if elapsed else 0.0,
+        "save_p50_ms": round(save_seconds[len(save_seconds) // 2] * 1000, 2),
+        "save_p99_ms": round(save_seconds[min(len(save_seconds) - 1, int(len(save_seconds) * 0.99))] * 1000, 2),
+        "read_rounds": results["reads"],
+        "errors": errors
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress story storage with concurrent saves and reads.")
+    parser.add_argument("--writers", type=int, default=16, help="Concurrent writer threads")
+    parser.add_argument("--saves", type=int, default=50, help="Stories saved by each writer")
+    parser.add_argument("--readers", type=int, default=4, help="Concurrent reader threads")
+    parser.add_argument("--namespaces", type=int, default=4, help="User namespaces the writers are spread over")
+    parser.add_argument("--backend", choices=["json", "segment"], default="json")
+    parser.add_argument("--no-wal", action="store_true", help="Use the shared-connection index instead of WAL")
+    args = parser.parse_args(argv)
+    
+    APP_CONFIG["storage_backend"] = args.backend
+    APP_CONFIG["story_index_wal"] = not args.no_wal
+    path = tempfile.mkdtemp(prefix="storychat-stress-")
+    try:
+        result = run_stress(path, args.writers, args.saves, args.readers, args.namespaces)
+    finally:
+        reset_index()
+        for store in config._story_stores.values():
+            store.close()
+        config._story_stores.clear()
+        shutil.rmtree(path, ignore_errors=True)
+    
+    print(json.dumps({key: value for key, value in result.items() if key != "errors"}, indent=2))
+    for error in result["errors"][:20]:
+        print(f"ERROR: {error}", file=sys.stderr)
+    if result["errors"]:
+        print(f"{len(result['errors'])} consistency errors", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# pages/1_Metrics.py
+import time
+import pandas as pd
+import streamlit as st
+from utils.config import APP_CONFIG, get_story_cache
+from utils.client_pool import get_pool_stats
+from utils import speculation, telemetry
+from utils.latency import latency_summary
+from utils.jobs import get_job_queue
+from utils.response_cache import get_response_cache
+
+METRICS = {
+    "Total latency (s)": "latency",
+    "Time to first token (s)": "ttft",
+    "Queue wait (s)": "queue_wait",
+    "Tokens per second": "tokens_per_second"
+}
+
+WINDOWS = {
+    "Last 15 minutes": (15 * 60, "1min"),
+    "Last hour": (3600, "5min"),
+    "Last 24 hours": (24 * 3600, "1h"),
+    "All": (None, "1h")
+}
+
+def load_records(source, window):
+    """Load call records from the chosen source, limited to the time window."""
+    if source == "On-disk log":
+        records = telemetry.read_log_records()
+    else:
+        records = telemetry.get_records()
+    if window is not None:
+        cutoff = time.time() - window
+        records = [r for r in records if r["timestamp"] >= cutoff]
+    return records
+
+def main():
+    st.set_page_config(
+        page_title=f"{APP_CONFIG['app_name']} - Metrics",
+        page_icon=APP_CONFIG['app_icon'],
+        layout="wide"
+    )
+    st.title("📊 Groq call metrics")
+    
+    # Occupancy of this process's background job queue
+    jobs = get_job_queue().stats()
+    st.caption(
+        f"Background jobs: {jobs['jobs']['queued']} queued, {jobs['jobs']['running'] + jobs['jobs']['streaming']} running "
+        f"(limits: {jobs['workers']} workers, {jobs['max_active']} active, {jobs['max_per_session']} per session)"
+    )
+    spec = speculation.get_stats()
+    hit_rate = f"{spec['hit_rate']:.0%}" if spec["hit_rate"] is not None else "n/a"
+    st.caption(
+        f"Speculative stories: {spec['started']} started, {spec['hits']} used, {spec['misses']} discarded, "
+        f"{spec['skipped']} skipped (hit rate {hit_rate}, {spec['saved_seconds']}s saved, ~{spec['wasted_tokens']} tokens wasted)"
+    )
+    pool = get_pool_stats()
+    st.caption(
+        f"Groq clients: {pool['clients']} pooled, {sum(entry['in_use'] for entry in pool['entries'])} requests in flight, "
+        f"{sum(entry['requests'] for entry in pool['entries'])} requests served"
+    )
+    responses = get_response_cache()
+    if responses is None:
+        st.caption("Response cache: off")
+    else:
+        cache = responses.stats()
+        st.caption(
+            f"Response cache: {cache['hits']} hits ({cache['disk_hits']} from disk), {cache['misses']} misses "
+            f"(hit rate {cache['hit_rate']:.0%}, {cache['memory_entries']} in memory, {cache['disk_bytes'] / 1024 / 1024:.1f} MB on disk)"
+        )
+    stories = get_story_cache().stats()
+    st.caption(
+        f"Story cache: {stories['entries']} stories ({stories['bytes'] / 1024 / 1024:.1f} MB), "
+        f"{stories['hits']} hits, {stories['misses']} misses, {stories['stale']} stale (hit rate {stories['hit_rate']:.0%})"
+    )
+    
+    # The decaying histograms hedging reads its thresholds from
+    live = latency_summary()
+    if live:
+        with st.expander(f"Current latency (half-life {APP_CONFIG['latency_half_life']:.0f}s, used for hedging)"):
+            st.dataframe(
+                pd.DataFrame.from_dict(live, orient="index").rename_axis("model/metric"),
+                use_container_width=True
+            )
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        source = st.radio("Source", ["This process", "On-disk log"], horizontal=True)
+    with col2:
+        window_label = st.selectbox("Window", list(WINDOWS.keys()), index=1)
+    with col3:
+        metric_label = st.selectbox("Metric", list(METRICS.keys()))
+    
+    window, frequency = WINDOWS[window_label]
+    metric = METRICS[metric_label]
+    records = load_records(source, window)
+    if not records:
+        st.info("No calls recorded yet. Generate a story and come back.")
+        return
+    
+    df = pd.DataFrame(records)
+    df["time"] = pd.to_datetime(df["timestamp"], unit="s")
+    # Hedge losers and streams the user stopped are closed on purpose, not failures
+    cancelled = df["error"] == "Cancelled"
+    failed = df["error"].notna() & ~cancelled
+    
+    # Headline numbers
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Calls", len(df))
+    col2.metric("Error rate", f"{failed.mean():.1%}")
+    col3.metric("Cancelled", int(cancelled.sum()))
+    col4.metric("Retries", int(df["retries"].sum()))
+    col5.metric("Completion tokens", int(df["completion_tokens"].fillna(0).sum()))
+    
+    # Percentiles per model
+    st.subheader(f"{metric_label} by model")
+    summary = telemetry.summarize(records, metric)
+    st.dataframe(
+        pd.DataFrame.from_dict(summary, orient="index").rename_axis("model"),
+        use_container_width=True
+    )
+    
+    # Percentiles per model over time
+    st.subheader(f"{metric_label} over time")
+    percentile = st.radio("Percentile", [50, 95, 99], index=1, horizontal=True, format_func=lambda p: f"p{p}")
+    samples = df[df[metric].notna()]
+    if samples.empty:
+        st.caption("No samples for this metric in the window.")
+    else:
+        series = (
+            samples.groupby([samples["time"].dt.floor(frequency), "model"])[metric]
+            .quantile(percentile / 100.0)
+            .unstack("model")
+        )
+        st.line_chart(series)
+    
+    # Error taxonomy
+    st.subheader("Errors")
+    if failed.any():
+        errors = df[failed].groupby(["model", "error"]).size().unstack("error", fill_value=0)
+        st.dataframe(errors, use_container_width=True)
+    else:
+        st.caption("No failed calls in the window.")
+    
+    with st.expander("Recent calls"):
+        st.dataframe(
+            df.sort_values("timestamp", ascending=False).drop(columns=["timestamp"]).head(200),
+            use_container_width=True
+        )
+
+if __name__ == "__main__":
+    main()
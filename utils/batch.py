@@ -0,0 +1,184 @@
+# utils/batch.py
+"""
+Headless batch story generation.
+
+Reads story specs from a JSONL or CSV file, generates them concurrently with
+the async Groq client and appends one JSON line per finished story to an
+output file. Re-running with the same output file resumes where a previous
+run stopped: specs that already have a successful result are skipped.
+
+Usage:
+    python -m utils.batch specs.jsonl -o results.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+from utils.config import APP_CONFIG
+from utils.story_generator import AsyncStoryGenerator
+
+SPEC_FIELDS = ("title", "genre", "characters", "setting", "theme", "word_count", "temperature", "model")
+
+def spec_id(spec):
+    """
+    Stable identifier of a spec: its "id" field, or a digest of its contents.
+    """
+    if spec.get("id"):
+        return str(spec["id"])
+    payload = json.dumps({k: spec.get(k) for k in SPEC_FIELDS}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+def _normalize_spec(raw):
+    spec = {k: (v if v != "" else None) for k, v in raw.items()}
+    for key in ("word_count",):
+        if spec.get(key) is not None:
+            spec[key] = int(spec[key])
+    for key in ("temperature",):
+        if spec.get(key) is not None:
+            spec[key] = float(spec[key])
+    spec["id"] = spec_id(spec)
+    return spec
+
+def read_specs(path):
+    """
+    Read story specs from a .jsonl or .csv file.
+    
+    Returns:
+    - List of spec dictionaries, each with an "id"
+    """
+    path = Path(path)
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return [_normalize_spec(row) for row in rows]
+
+def read_completed(output_path):
+    """
+    Collect the ids of specs that already have a successful result.
+    
+    A trailing partial line left by a crash is cut off so new results
+    can be appended safely.
+    
+    Returns:
+    - Set of completed spec ids
+    """
+    output_path = Path(output_path)
+    if not output_path.exists():
+        return set()
+    
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    
+    completed = set()
+    for line in data.decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("status") == "ok":
+            completed.add(record["id"])
+    return completed
+
+async def run_batch(specs, output_path, api_key, concurrency=4, model=None, progress=None):
+    """
+    Generate stories for a list of specs and stream results to a JSONL file.
+    
+    Parameters:
+    - specs: List of spec dictionaries (see read_specs)
+    - output_path: JSONL file results are appended to
+    - api_key: Groq API key
+    - concurrency: Maximum number of requests in flight
+    - model: Model for specs that do not name one (defaults to APP_CONFIG)
+    - progress: Optional callable(done, total, record) invoked after each story
+    
+    Returns:
+    - Dictionary with counts, elapsed time and throughput
+    """
+    completed = read_completed(output_path)
+    pending = [spec for spec in specs if spec["id"] not in completed]
+    semaphore = asyncio.Semaphore(concurrency)
+    generator = AsyncStoryGenerator(api_key, max_connections=concurrency)
+    stats = {"total": len(pending), "skipped": len(specs) - len(pending), "ok": 0, "failed": 0, "completion_tokens": 0}
+    start_time = time.time()
+    
+    async def run_one(spec):
+        async with semaphore:
+            try:
+                result = await generator.generate_story(
+                    title=spec.get("title"),
+                    genre=spec.get("genre"),
+                    characters=spec.get("characters"),
+                    setting=spec.get("setting"),
+                    theme=spec.get("theme"),
+                    word_count=spec.get("word_count"),
+                    temperature=spec.get("temperature"),
+                    model=spec.get("model") or model,
+                    use_cache=False
+                )
+                return {"id": spec["id"], "status": "ok", "spec": spec, "result": result}
+            except Exception as e:
+                return {"id": spec["id"], "status": "error", "spec": spec, "error": str(e)}
+    
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            for task in asyncio.as_completed([run_one(spec) for spec in pending]):
+                record = await task
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                
+                if record["status"] == "ok":
+                    stats["ok"] += 1
+                    stats["completion_tokens"] += record["result"]["metadata"].get("completion_tokens", 0)
+                else:
+                    stats["failed"] += 1
+                if progress:
+                    progress(stats["ok"] + stats["failed"], stats["total"], record)
+    finally:
+        await generator.aclose()
+    
+    elapsed = time.time() - start_time
+    stats["elapsed"] = round(elapsed, 2)
+    stats["stories_per_minute"] = round(stats["ok"] / elapsed * 60, 2) if elapsed else 0.0
+    stats["tokens_per_second"] = round(stats["completion_tokens"] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate stories in bulk from a JSONL or CSV file of specs.")
+    parser.add_argument("specs", help="Input .jsonl or .csv file with one story spec per line/row")
+    parser.add_argument("-o", "--output", required=True, help="Output .jsonl file (appended to; used to resume)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Maximum number of requests in flight")
+    parser.add_argument("-m", "--model", default=APP_CONFIG["default_model"], help="Model for specs that do not name one")
+    parser.add_argument("--api-key", default=None, help="Groq API key (defaults to GROQ_API_KEY)")
+    args = parser.parse_args(argv)
+    
+    load_dotenv()
+    api_key = args.api_key or os.getenv("GROQ_API_KEY")
+    if not api_key:
+        parser.error("a Groq API key is required (--api-key or GROQ_API_KEY)")
+    
+    specs = read_specs(args.specs)
+    
+    def progress(done, total, record):
+        status = "ok" if record["status"] == "ok" else f"error: {record['error']}"
+        print(f"[{done}/{total}] {record['id']} {status}", file=sys.stderr)
+    
+    stats = asyncio.run(run_batch(specs, args.output, api_key, args.concurrency, args.model, progress))
+    print(
+        f"{stats['ok']} generated, {stats['failed']} failed, {stats['skipped']} already done "
+        f"in {stats['elapsed']}s ({stats['stories_per_minute']} stories/min, {stats['tokens_per_second']} tokens/s)"
+    )
+    return 0 if stats["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# utils/chat_history.py
+import json
+import sys
+import zlib
+from utils.config import APP_CONFIG
+
+def _message_size(message):
+    """Approximate memory held by one message dictionary, in bytes."""
+    return sys.getsizeof(message) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in message.items())
+
+class ChatHistory:
+    """
+    Chat transcript with a bounded in-memory tail.
+    
+    The most recent messages are kept as plain dictionaries. Once there are
+    more than `max_messages` of them, the oldest are moved in chunks into a
+    zlib-compressed archive, which is only decompressed when earlier messages
+    are asked for. Supports append, len and truth testing like the plain list
+    it replaces.
+    """
+    
+    def __init__(self, max_messages=None, archive_chunk=None):
+        """
+        Parameters:
+        - max_messages: Messages kept uncompressed before the oldest are archived
+        - archive_chunk: Messages compressed together into one archive block
+        """
+        self.max_messages = max_messages or APP_CONFIG["chat_history_max_messages"]
+        self.archive_chunk = archive_chunk or APP_CONFIG["chat_history_archive_chunk"]
+        self._recent = []
+        # Compressed blocks of older messages, oldest first, with their message counts
+        self._archive = []
+        self._archived_count = 0
+    
+    def __len__(self):
+        return self._archived_count + len(self._recent)
+    
+    def __bool__(self):
+        return len(self) > 0
+    
+    def append(self, message):
+        """Add a message ({"role", "content"}) to the end of the transcript."""
+        self._recent.append(message)
+        if len(self._recent) > self.max_messages:
+            self._compact()
+    
+    def _compact(self):
+        chunk = self._recent[:self.archive_chunk]
+        del self._recent[:self.archive_chunk]
+        blob = zlib.compress(json.dumps(chunk).encode("utf-8"), 6)
+        self._archive.append((blob, len(chunk)))
+        self._archived_count += len(chunk)
+    
+    def window(self, count):
+        """
+        The last `count` messages, oldest first.
+        Archived blocks are decompressed only as far back as the window reaches.
+        """
+        if count <= len(self._recent):
+            return self._recent[len(self._recent) - count:] if count > 0 else []
+        
+        needed = count - len(self._recent)
+        earlier = []
+        for blob, _ in reversed(self._archive):
+            earlier[:0] = json.loads(zlib.decompress(blob).decode("utf-8"))
+            if len(earlier) >= needed:
+                break
+        return earlier[max(0, len(earlier) - needed):] + self._recent
+    
+    def clear(self):
+        """Remove every message."""
+        self._recent = []
+        self._archive = []
+        self._archived_count = 0
+    
+    def memory_usage(self):
+        """
+        Memory held by this transcript.
+        
+        Returns:
+        - Dictionary with messages, archived_messages, recent_bytes, archived_bytes and total_bytes
+        """
+        recent_bytes = sum(_message_size(message) for message in self._recent)
+        archived_bytes = sum(len(blob) for blob, _ in self._archive)
+        return {
+            "messages": len(self),
+            "archived_messages": self._archived_count,
+            "recent_bytes": recent_bytes,
+            "archived_bytes": archived_bytes,
+            "total_bytes": recent_bytes + archived_bytes
+        }
@@ -0,0 +1,142 @@
+# utils/client_pool.py
+import atexit
+import hashlib
+import threading
+import time
+import httpx
+from groq import AsyncGroq, Groq
+from utils.config import APP_CONFIG
+
+# Process-wide registry of Groq clients, shared by all Streamlit sessions.
+# Keyed by a digest of the API key so raw keys are never used as dict keys.
+_clients = {}
+_lock = threading.Lock()
+
+def _key_digest(api_key):
+    """Return a stable, non-reversible registry key for an API key."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+def _new_http_client():
+    """
+    Create an HTTP client with keep-alive connection pooling.
+    Pool limits come from APP_CONFIG.
+    """
+    limits = httpx.Limits(
+        max_connections=APP_CONFIG["client_max_connections"],
+        max_keepalive_connections=APP_CONFIG["client_max_keepalive_connections"],
+        keepalive_expiry=APP_CONFIG["client_keepalive_expiry"]
+    )
+    return httpx.Client(limits=limits, timeout=APP_CONFIG["client_timeout"])
+
+def _evict_idle(now):
+    """
+    Close and drop clients that have not been used for longer than the idle timeout.
+    Clients with a request in flight are never idle. Must be called with the registry lock held.
+    """
+    idle_timeout = APP_CONFIG["client_idle_timeout"]
+    idle = [
+        d for d, entry in _clients.items()
+        if not entry["in_use"] and now - entry["last_used"] > idle_timeout
+    ]
+    for digest in idle:
+        entry = _clients.pop(digest)
+        try:
+            entry["client"].close()
+        except Exception:
+            pass
+
+def get_client(api_key, hold=False):
+    """
+    Get the shared Groq client for an API key, creating it on first use.
+    
+    Parameters:
+    - api_key: Groq API key
+    - hold: Mark the client as in use by a request, so it is not evicted
+      until release_client() is called
+    
+    Returns:
+    - Groq client backed by a pooled keep-alive HTTP connection
+    """
+    digest = _key_digest(api_key)
+    now = time.monotonic()
+    
+    with _lock:
+        _evict_idle(now)
+        entry = _clients.get(digest)
+        if entry is None:
+            # Retries are handled by the request scheduler, not the SDK
+            client = Groq(api_key=api_key, http_client=_new_http_client(), max_retries=0)
+            entry = {"client": client, "created": now, "last_used": now, "requests": 0, "in_use": 0}
+            _clients[digest] = entry
+        entry["last_used"] = now
+        entry["requests"] += 1
+        if hold:
+            entry["in_use"] += 1
+        return entry["client"]
+
+def release_client(api_key):
+    """End a request that held the API key's client (see get_client)."""
+    digest = _key_digest(api_key)
+    with _lock:
+        entry = _clients.get(digest)
+        if entry is not None and entry["in_use"]:
+            entry["in_use"] -= 1
+            entry["last_used"] = time.monotonic()
+
+def close_all_clients():
+    """Close every pooled client and empty the registry."""
+    with _lock:
+        for entry in _clients.values():
+            try:
+                entry["client"].close()
+            except Exception:
+                pass
+        _clients.clear()
+
+# Close pooled connections cleanly when the server shuts down
+atexit.register(close_all_clients)
+
+def get_pool_stats():
+    """
+    Get a snapshot of the client registry.
+    
+    Returns:
+    - Dictionary with the number of pooled clients and per-client usage
+    """
+    now = time.monotonic()
+    with _lock:
+        return {
+            "clients": len(_clients),
+            "entries": [
+                {
+                    "age": round(now - entry["created"], 1),
+                    "idle": round(now - entry["last_used"], 1),
+                    "requests": entry["requests"],
+                    "in_use": entry["in_use"]
+                }
+                for entry in _clients.values()
+            ]
+        }
+
+def new_async_client(api_key, max_connections=None):
+    """
+    Create an async Groq client with its own pooled HTTP connections.
+    
+    Async clients are bound to the event loop that uses them, so they are not
+    kept in the process-wide registry; the caller owns and closes them.
+    
+    Parameters:
+    - api_key: Groq API key
+    - max_connections: Pool size (defaults to APP_CONFIG["client_max_connections"])
+    
+    Returns:
+    - AsyncGroq client
+    """
+    max_connections = max_connections or APP_CONFIG["client_max_connections"]
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=APP_CONFIG["client_keepalive_expiry"]
+    )
+    http_client = httpx.AsyncClient(limits=limits, timeout=APP_CONFIG["client_timeout"])
+    return AsyncGroq(api_key=api_key, http_client=http_client, max_retries=0)
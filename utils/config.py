@@ -1,9 +1,18 @@
 # utils/config.py
 import os
 import json
+import hashlib
+import re
+import tempfile
+import threading
+import time
 from pathlib import Path
-from dotenv import load_dotenv
+from dotenv import find_dotenv, load_dotenv
 import streamlit as st
+from utils import minhash
+from utils.story_cache import StoryCache
+from utils.story_index import StoryIndex
+from utils.story_store import SegmentStore, is_locator, locator, locator_key, locator_namespace
 
 # Application configuration
 APP_CONFIG = {
@@ -14,7 +23,85 @@ APP_CONFIG = {
     "default_temperature": 0.7,
     "default_max_tokens": 1500,
     "default_word_count": 800,
+    "max_word_count": 10000,
+    "long_form_threshold": 2000,
+    "long_form_chapter_words": 1200,
+    "long_form_max_workers": 8,
     "file_storage_path": "stories",
+    "stream_responses": True,
+    "client_max_connections": 20,
+    "client_max_keepalive_connections": 10,
+    "client_keepalive_expiry": 30.0,
+    "client_idle_timeout": 600,
+    "client_timeout": 60.0,
+    "cache_enabled": True,
+    "cache_max_entries": 256,
+    "cache_ttl": 24 * 3600,
+    "cache_disk_enabled": True,
+    "cache_dir": ".cache",
+    "cache_max_disk_bytes": 50 * 1024 * 1024,
+    "story_index_file": ".index.sqlite3",
+    "revision_mode": "sections",
+    "revision_max_sections": 4,
+    "rate_limits": {
+        "default": {"requests_per_minute": 30, "tokens_per_minute": 6000},
+        "llama3-70b-8192": {"requests_per_minute": 30, "tokens_per_minute": 6000},
+        "llama3-8b-8192": {"requests_per_minute": 30, "tokens_per_minute": 30000},
+        "mixtral-8x7b-32768": {"requests_per_minute": 30, "tokens_per_minute": 5000},
+        "gemma-7b-it": {"requests_per_minute": 30, "tokens_per_minute": 15000}
+    },
+    "scheduler_max_retries": 4,
+    "scheduler_backoff_base": 1.0,
+    "scheduler_backoff_cap": 30.0,
+    "hedging_enabled": False,
+    "hedge_percentile": 95,
+    "hedge_min_samples": 20,
+    "hedge_default_delay": 5.0,
+    "hedge_max_workers": 16,
+    "latency_half_life": 300.0,
+    "title_parallel": True,
+    "title_model": "llama3-8b-8192",
+    "title_max_tokens": 32,
+    "title_wait": 5.0,
+    "title_max_workers": 8,
+    "token_budget_margin": 0.15,
+    "max_completion_tokens": 8192,
+    "expansion_growth": 1.25,
+    "telemetry_buffer_size": 5000,
+    "telemetry_log_enabled": True,
+    "telemetry_dir": ".telemetry",
+    "telemetry_log_max_bytes": 5 * 1024 * 1024,
+    "telemetry_log_backups": 3,
+    "config_check_interval": 2.0,
+    "library_page_size": 10,
+    "library_page_sizes": [5, 10, 25, 50],
+    "library_sort": "newest",
+    "chat_history_max_messages": 60,
+    "chat_history_archive_chunk": 20,
+    "chat_window": 20,
+    "library_search_limit": 20,
+    "storage_backend": "json",
+    "segment_dir": ".segments",
+    "segment_compress_level": 6,
+    "segment_compact_ratio": 0.5,
+    "story_index_wal": True,
+    "storage_namespaces": False,
+    "namespace_dir": "users",
+    "namespace_query_param": False,
+    "job_workers": 8,
+    "job_max_active": 32,
+    "job_max_per_session": 1,
+    "job_retention": 600,
+    "job_poll_interval": 0.5,
+    "speculation_enabled": True,
+    "speculation_max_wasted_tokens": 6000,
+    "speculation_max_load": 0.5,
+    "version_snapshot_interval": 10,
+    "dedupe_on_save": "flag",
+    "dedupe_threshold": 0.8,
+    "duplicates_dir": ".duplicates",
+    "story_cache_entries": 256,
+    "story_cache_max_bytes": 32 * 1024 * 1024,
     "genre_options": [
         "Fantasy", "Science Fiction", "Mystery", "Romance", 
         "Adventure", "Horror", "Historical Fiction", "Comedy",
@@ -23,22 +110,63 @@ APP_CONFIG = {
     "version": "1.1.0"
 }
 
+# Settings resolved from .env and Streamlit secrets, cached for the process
+_settings = {"loaded": False, "env_path": None, "env_mtime": None, "checked_at": 0.0, "api_key": None}
+_settings_lock = threading.Lock()
+
+def _file_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def reload_settings():
+    """
+    Resolve settings from the .env file, environment variables and Streamlit secrets.
+    
+    The first load keeps variables already set in the environment; a reload
+    after the .env file changed lets the file's new values take effect.
+    """
+    with _settings_lock:
+        reloading = _settings["loaded"]
+        if _settings["env_path"] is None:
+            _settings["env_path"] = find_dotenv(usecwd=True) or os.path.abspath(".env")
+        env_path = _settings["env_path"]
+        _settings["env_mtime"] = _file_mtime(env_path)
+        if _settings["env_mtime"] is not None:
+            load_dotenv(env_path, override=reloading)
+        
+        # First check if API key is in environment variables (from .env)
+        api_key = os.getenv("GROQ_API_KEY")
+        
+        # If not in environment, try Streamlit secrets (for cloud deployment)
+        if not api_key and "groq" in st.secrets:
+            api_key = st.secrets["groq"]["api_key"]
+        
+        _settings["api_key"] = api_key
+        _settings["checked_at"] = time.monotonic()
+        _settings["loaded"] = True
+
+def _check_settings():
+    """Load settings on first use, and reload them if the .env file changed since."""
+    if not _settings["loaded"]:
+        reload_settings()
+        return
+    now = time.monotonic()
+    if now - _settings["checked_at"] < APP_CONFIG["config_check_interval"]:
+        return
+    _settings["checked_at"] = now
+    if _file_mtime(_settings["env_path"]) != _settings["env_mtime"]:
+        reload_settings()
+
 def load_api_key():
     """
     Load the API key from environment variables or Streamlit secrets.
+    Resolved once per process; the .env file is re-read only when its mtime changes.
     Returns the API key or None if not found.
     """
-    # Try to load from .env file
-    load_dotenv()
-    
-    # First check if API key is in environment variables (from .env)
-    api_key = os.getenv("GROQ_API_KEY")
-    
-    # If not in environment, try Streamlit secrets (for cloud deployment)
-    if not api_key and "groq" in st.secrets:
-        api_key = st.secrets["groq"]["api_key"]
-        
-    return api_key
+    _check_settings()
+    return _settings["api_key"]
 
 def get_api_key():
     """
@@ -62,16 +190,145 @@ def get_model():
         return st.session_state.model
     return APP_CONFIG["default_model"]
 
-def ensure_storage_directory():
+def ensure_storage_directory(namespace=""):
     """
     Ensures the stories storage directory exists.
+    
+    Parameters:
+    - namespace: User namespace; "" for the shared library
+    
     Returns the path to the storage directory.
     """
     storage_path = Path(APP_CONFIG["file_storage_path"])
+    if namespace:
+        storage_path = storage_path / APP_CONFIG["namespace_dir"] / namespace
     storage_path.mkdir(exist_ok=True, parents=True)
     return storage_path
 
-def save_story_to_file(title, content, metadata=None):
+_CROCKFORD_BASE32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+def new_story_id():
+    """
+    Generate a collision-free story id.
+    
+    The id is a ULID: a 48-bit millisecond timestamp followed by 80 random
+    bits, as 26 Crockford base32 characters, so ids sort by creation time.
+    """
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    return "".join(_CROCKFORD_BASE32[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+def get_user_namespace():
+    """
+    Storage namespace of the current user, when per-user namespaces are enabled.
+    
+    The user is the signed-in account (Streamlit authentication). The
+    "user" query parameter is only used when namespace_query_param is on,
+    as anyone can edit it. Returns "" for the shared library.
+    """
+    if not APP_CONFIG["storage_namespaces"]:
+        return ""
+    user = st.user.get("email")
+    if not user and APP_CONFIG["namespace_query_param"]:
+        user = st.query_params.get("user")
+    if not user:
+        return ""
+    # Readable and filesystem-safe, with a digest so distinct users never share a directory
+    safe_user = re.sub(r"[^A-Za-z0-9_-]", "_", user)[:40]
+    return f"{safe_user}-{hashlib.sha1(user.encode('utf-8')).hexdigest()[:10]}"
+
+def current_namespace():
+    """Storage namespace of the current session ("" for the shared library)."""
+    return st.session_state.get("user_namespace", "") if APP_CONFIG["storage_namespaces"] else ""
+
+def uses_segment_store():
+    """Whether stories are kept in the compressed segment store instead of JSON files."""
+    return APP_CONFIG["storage_backend"] == "segment"
+
+# Process-wide segment stores, one per namespace, opened on first use
+_story_stores = {}
+_story_store_lock = threading.Lock()
+
+def get_story_store(namespace=None):
+    """
+    Get the compressed segment store holding a namespace's stories (segment backend).
+    
+    Parameters:
+    - namespace: User namespace; defaults to the current session's
+    
+    Returns the SegmentStore instance.
+    """
+    namespace = current_namespace() if namespace is None else namespace
+    with _story_store_lock:
+        store = _story_stores.get(namespace)
+        if store is None:
+            store = _story_stores[namespace] = SegmentStore(
+                ensure_storage_directory(namespace) / APP_CONFIG["segment_dir"],
+                APP_CONFIG["segment_compress_level"]
+            )
+        return store
+
+# Process-wide cache of opened stories, shared by all sessions and namespaces
+_story_cache = None
+_story_cache_lock = threading.Lock()
+
+def get_story_cache():
+    """
+    Get the process-wide cache of full stories, configured from APP_CONFIG.
+    """
+    global _story_cache
+    with _story_cache_lock:
+        if _story_cache is None:
+            _story_cache = StoryCache(APP_CONFIG["story_cache_entries"], APP_CONFIG["story_cache_max_bytes"])
+        return _story_cache
+
+# Process-wide story metadata indexes, one per namespace, reconciled against storage once at startup
+_story_indexes = {}
+_story_index_lock = threading.Lock()
+
+def get_story_index(namespace=None):
+    """
+    Get the persistent story metadata index of a namespace, creating and reconciling it on first use.
+    
+    Parameters:
+    - namespace: User namespace; defaults to the current session's
+    
+    Returns the StoryIndex instance.
+    """
+    namespace = current_namespace() if namespace is None else namespace
+    with _story_index_lock:
+        index = _story_indexes.get(namespace)
+        if index is None:
+            storage_path = ensure_storage_directory(namespace)
+            if uses_segment_store():
+                store = get_story_store(namespace)
+                index = StoryIndex(store.path / APP_CONFIG["story_index_file"], APP_CONFIG["story_index_wal"])
+                errors = index.reconcile_store(store, lambda key: locator(key, namespace))
+            else:
+                index = StoryIndex(storage_path / APP_CONFIG["story_index_file"], APP_CONFIG["story_index_wal"])
+                errors = index.reconcile(storage_path)
+            for file_path, error in errors:
+                st.error(f"Error loading story {file_path}: {error}")
+            _story_indexes[namespace] = index
+        return index
+
+def _write_json_atomic(file_path, data):
+    """
+    Write JSON so readers see either the old file or the complete new one:
+    write a temporary file in the same directory, fsync it, then rename it
+    over the target.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=file_path.parent, prefix=f".{file_path.stem}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def save_story_to_file(title, content, metadata=None, story_id=None, namespace=None, versions=None):
     """
     Save a story to a JSON file.
     
@@ -79,15 +336,31 @@ def save_story_to_file(title, content, metadata=None):
     - title: Story title
     - content: Story content
     - metadata: Dictionary of additional metadata (genre, characters, etc.)
+    - story_id: Id of the story; defaults to the session's (saving again replaces the story)
+    - namespace: User namespace; defaults to the current session's
+    - versions: Revision history (VersionHistory.to_dict()) to keep with the story (optional)
     
     Returns:
-    - Path to the saved file
+    - Record of the saved story, in the same form as the entries of load_saved_stories,
+      with "near_duplicates": records of other saved stories with nearly the same content
+      (removed from the library when APP_CONFIG["dedupe_on_save"] is "merge")
     """
-    storage_path = ensure_storage_directory()
+    namespace = current_namespace() if namespace is None else namespace
+    story_id = story_id or st.session_state.get("story_id") or new_story_id()
+    storage_path = ensure_storage_directory(namespace)
+    
+    # Other stories with nearly the same content (earlier saves of this story don't count)
+    signature = minhash.signature(content)
+    duplicates = []
+    if APP_CONFIG["dedupe_on_save"] != "off":
+        duplicates = [
+            record for record in get_story_index(namespace).find_near_duplicates(signature, APP_CONFIG["dedupe_threshold"])
+            if not Path(record["file_path"]).stem.endswith(f"_{story_id}")
+        ]
     
     # Create a safe filename from the title
     safe_title = "".join(c if c.isalnum() or c in " _-" else "_" for c in title)
-    safe_filename = f"{safe_title}_{int(st.session_state.get('story_id', 0))}.json"
+    safe_filename = f"{safe_title}_{story_id}.json"
     file_path = storage_path / safe_filename
     
     # Prepare story data
@@ -97,32 +370,130 @@ def save_story_to_file(title, content, metadata=None):
         "timestamp": st.session_state.get("timestamp", ""),
         "metadata": metadata or {}
     }
+    if versions:
+        story_data["versions"] = versions
+    
+    if uses_segment_store():
+        # Append to the segment store; the key plays the role of the file name
+        store = get_story_store(namespace)
+        entry = store.put(file_path.stem, story_data)
+        record = get_story_index(namespace).upsert(
+            locator(entry["key"], namespace), story_data, entry["length"], entry["seq"], signature
+        )
+    else:
+        # Save to file; concurrent readers never see a partly written story
+        _write_json_atomic(file_path, story_data)
+    
+        # Keep the metadata index in step with the directory
+        record = get_story_index(namespace).upsert(file_path, story_data, signature=signature)
+    
+    # The new save replaces its near-duplicates
+    if APP_CONFIG["dedupe_on_save"] == "merge":
+        for duplicate in duplicates:
+            remove_duplicate_story(duplicate["file_path"], namespace)
+    if uses_segment_store() and store.stats()["dead_ratio"] > APP_CONFIG["segment_compact_ratio"]:
+        store.compact()
+    get_story_cache().invalidate(record["file_path"])
+    record["near_duplicates"] = duplicates
+    return record
+
+def remove_duplicate_story(file_path, namespace=None):
+    """
+    Take a near-duplicate story out of the library. A JSON file is moved to
+    the duplicates directory rather than deleted; a segment store story gets
+    a tombstone and its space is reclaimed by the next compaction.
+    
+    Parameters:
+    - file_path: Path to the story JSON file (or segment store locator)
+    - namespace: User namespace; defaults to the current session's
+    """
+    namespace = current_namespace() if namespace is None else namespace
+    if is_locator(file_path):
+        get_story_store(namespace).delete(locator_key(file_path))
+    else:
+        duplicates_path = ensure_storage_directory(namespace) / APP_CONFIG["duplicates_dir"]
+        duplicates_path.mkdir(exist_ok=True)
+        try:
+            os.replace(file_path, duplicates_path / Path(file_path).name)
+        except FileNotFoundError:
+            pass
+    get_story_cache().invalidate(str(file_path))
+    get_story_index(namespace).remove(file_path)
+
+def load_saved_stories(order="newest", offset=0, limit=None, namespace=None):
+    """
+    List saved stories from the metadata index.
     
-    # Save to file
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(story_data, f, indent=2)
+    Parameters:
+    - order: "newest", "oldest" or "title"
+    - offset: Number of stories to skip, for paging
+    - limit: Maximum number of stories to return (None for all)
+    - namespace: User namespace; defaults to the current session's
     
-    return file_path
+    Returns:
+    - List of StoryRecord objects (title, timestamp, file_path, size, mtime and
+      genre/saved_at metadata). Content is not included; use load_story to
+      read a full story.
+    """
+    return get_story_index(namespace).list_stories(order, offset, limit)
 
-def load_saved_stories():
+def search_saved_stories(query, limit=None, namespace=None):
     """
-    Load all saved stories from the storage directory.
+    Ranked full-text search over the saved stories.
+    
+    Parameters:
+    - query: Search text; the last word also matches as a prefix
+    - limit: Maximum number of results (defaults to APP_CONFIG)
+    - namespace: User namespace; defaults to the current session's
     
     Returns:
-    - List of story dictionaries
+    - List of story records, best match first, each with a "snippet" of matching content
     """
-    storage_path = ensure_storage_directory()
-    stories = []
+    return get_story_index(namespace).search(query, limit or APP_CONFIG["library_search_limit"])
+
+def count_saved_stories(namespace=None):
+    """
+    Number of saved stories in the metadata index.
     
-    for file_path in storage_path.glob("*.json"):
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                story_data = json.load(f)
-                story_data["file_path"] = str(file_path)
-                stories.append(story_data)
-        except Exception as e:
-            st.error(f"Error loading story {file_path}: {str(e)}")
-    
-    # Sort by timestamp if available
-    stories.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-    return stories
\ No newline at end of file
+    Parameters:
+    - namespace: User namespace; defaults to the current session's
+    """
+    return get_story_index(namespace).count()
+    
+def load_story(file_path):
+    """
+    Load one saved story in full.
+    
+    Stories are served from the process-wide story cache while the stored
+    version is unchanged, and read from storage otherwise.
+    
+    Parameters:
+    - file_path: Path to the story JSON file (or segment store locator)
+    
+    Returns:
+    - Story dictionary including content; a copy the caller may modify
+    """
+    key = str(file_path)
+    cache = get_story_cache()
+    
+    # Version stamp of the stored story, taken before reading it: a story saved
+    # in between is cached under the older stamp and read again next time
+    if is_locator(file_path):
+        store = get_story_store(locator_namespace(file_path))
+        stamp = store.seq(locator_key(file_path))
+    else:
+        stat = os.stat(file_path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+    story_data = cache.get(key, stamp)
+    if story_data is not None:
+        return story_data
+    
+    if is_locator(file_path):
+        story_data, _, size = store.read(locator_key(file_path))
+    else:
+        with open(file_path, "r", encoding="utf-8") as f:
+            story_data = json.load(f)
+        size = stamp[1]
+    story_data["file_path"] = key
+    cache.put(key, stamp, story_data, size)
+    return story_data
@@ -0,0 +1,69 @@
+# utils/dedupe.py
+"""
+Find and remove near-duplicate stories in a library.
+
+Usage:
+    python -m utils.dedupe [--namespace NAME] [--threshold 0.8]
+    python -m utils.dedupe --apply
+
+Stories are compared by the MinHash signatures of their word shingles and
+grouped into clusters of near-identical stories. Without --apply the
+clusters are only reported. With --apply the newest story of each cluster
+is kept and the others are removed from the library: JSON files are moved
+to the duplicates directory, segment store stories are deleted.
+"""
+import argparse
+import sys
+import time
+from utils.config import APP_CONFIG, count_saved_stories, get_story_index, remove_duplicate_story
+
+def _newest_first(record):
+    return record.get("saved_at") or record.get("timestamp") or ""
+
+def find_clusters(namespace="", threshold=None):
+    """
+    Cluster the stories of a library by content similarity.
+    
+    The signatures and LSH buckets stored in the story index are used, so
+    no story content is read.
+    
+    Parameters:
+    - namespace: User namespace ("" for the shared library)
+    - threshold: Minimum estimated Jaccard similarity (defaults to APP_CONFIG["dedupe_threshold"])
+    
+    Returns:
+    - Dictionary with stories (count), seconds, and clusters: lists of story
+      records, the one to keep first
+    """
+    threshold = APP_CONFIG["dedupe_threshold"] if threshold is None else threshold
+    start = time.perf_counter()
+    clusters = [
+        sorted(cluster, key=_newest_first, reverse=True)
+        for cluster in get_story_index(namespace).near_duplicate_clusters(threshold)
+    ]
+    return {"stories": count_saved_stories(namespace), "seconds": round(time.perf_counter() - start, 3), "clusters": clusters}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find and remove near-duplicate stories.")
+    parser.add_argument("--namespace", default="", help="User namespace (default: the shared library)")
+    parser.add_argument("--threshold", type=float, default=APP_CONFIG["dedupe_threshold"], help="Minimum similarity (0-1)")
+    parser.add_argument("--apply", action="store_true", help="Keep the newest story of each cluster and remove the others")
+    args = parser.parse_args(argv)
+    
+    result = find_clusters(args.namespace, args.threshold)
+    duplicates = sum(len(cluster) - 1 for cluster in result["clusters"])
+    for cluster in result["clusters"]:
+        keep, *others = cluster
+        print(f"Keep {keep['title']} ({keep['file_path']})")
+        for story in others:
+            print(f"  {'removed' if args.apply else 'duplicate'}: {story['title']} ({story['file_path']})")
+            if args.apply:
+                remove_duplicate_story(story["file_path"], args.namespace)
+    print(
+        f"{result['stories']} stories, {len(result['clusters'])} clusters, {duplicates} duplicates "
+        f"{'removed' if args.apply else 'found'} ({result['seconds']}s)"
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# utils/jobs.py
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from utils.config import APP_CONFIG
+
+# Job statuses: queued -> running (-> streaming) -> done, failed or cancelled
+JOB_STATUSES = ("queued", "running", "streaming", "done", "failed", "cancelled")
+FINISHED_STATUSES = frozenset(("done", "failed", "cancelled"))
+
+class JobRejected(Exception):
+    """Raised by submit() when a concurrency limit leaves no room for another job."""
+    
+    def __init__(self, message, scope):
+        """
+        Parameters:
+        - message: Explanation for the user
+        - scope: "session" when the session's own limit was hit, "global" for the process-wide one
+        """
+        super().__init__(message)
+        self.scope = scope
+
+class JobCancelled(Exception):
+    """Raised inside a job's function when the job has been cancelled."""
+
+class Job:
+    """
+    A unit of background work and its observable state.
+    
+    The worker thread updates status, partial text and progress as the job
+    runs; script runs read them through snapshot() on every poll. The job's
+    function receives the Job itself, so it can stream text into it.
+    """
+    
+    def __init__(self, kind, fn, session_id=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.session_id = session_id
+        self.status = "queued"
+        self.text = ""
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._fn = fn
+        self._cancel = threading.Event()
+        self._future = None
+    
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+    
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested; for long-running job functions."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+    
+    def stream(self, chunks, expected_words=None):
+        """
+        Consume a stream of text chunks, publishing the text received so far.
+        
+        Parameters:
+        - chunks: Iterable of text deltas
+        - expected_words: Expected length of the full text, for progress (optional)
+        
+        Returns:
+        - The full text
+        """
+        self.status = "streaming"
+        words = 0
+        try:
+            for delta in chunks:
+                self.check_cancelled()
+                self.text += delta
+                if expected_words:
+                    words += delta.count(" ")
+                    self.progress = min(0.99, words / expected_words)
+        except JobCancelled:
+            # Stop the request behind the stream (and anything it started) right away
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            raise
+        return self.text
+    
+    def snapshot(self):
+        """
+        Current state of the job.
+        
+        Returns:
+        - Dictionary with id, kind, status, text, progress, error and queued/elapsed seconds
+        """
+        now = time.time()
+        started = self.started_at or now
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "text": self.text,
+            "progress": self.progress,
+            "error": self.error,
+            "queued_seconds": round(started - self.submitted_at, 2),
+            "elapsed_seconds": round((self.finished_at or now) - started, 2) if self.started_at else 0.0
+        }
+
+class JobQueue:
+    """
+    Process-wide pool of worker threads running jobs for all sessions.
+    
+    Jobs outlive the script run that submitted them: a session keeps the job
+    id and polls it on later reruns. Admission is limited per session and
+    globally, counting queued and running jobs; finished jobs are kept for
+    `retention` seconds so their results can be collected.
+    """
+    
+    def __init__(self, max_workers=None, max_active=None, max_per_session=None, retention=None):
+        """
+        Parameters:
+        - max_workers: Jobs running at the same time
+        - max_active: Jobs queued or running at the same time, across all sessions
+        - max_per_session: Jobs queued or running at the same time for one session
+        - retention: Seconds a finished job is kept
+        """
+        self.max_workers = max_workers or APP_CONFIG["job_workers"]
+        self.max_active = max_active or APP_CONFIG["job_max_active"]
+        self.max_per_session = max_per_session or APP_CONFIG["job_max_per_session"]
+        self.retention = retention or APP_CONFIG["job_retention"]
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+    
+    def submit(self, kind, fn, session_id=None):
+        """
+        Queue a job.
+        
+        Parameters:
+        - kind: Kind of job ("story", "revision", ...)
+        - fn: Callable taking the Job and returning its result
+        - session_id: Session the job belongs to, for the per-session limit
+        
+        Returns:
+        - The queued Job
+        
+        Raises:
+        - JobRejected if the session or the process already has its maximum of active jobs
+        """
+        with self._lock:
+            self._prune(time.time())
+            active = [job for job in self._jobs.values() if not job.finished]
+            if len(active) >= self.max_active:
+                raise JobRejected("Too many stories are being written right now. Please try again shortly.", "global")
+            if session_id is not None and sum(job.session_id == session_id for job in active) >= self.max_per_session:
+                raise JobRejected("Your previous request is still in progress.", "session")
+            job = Job(kind, fn, session_id)
+            self._jobs[job.id] = job
+            job._future = self._executor.submit(self._run, job)
+        return job
+    
+    def submit_spare(self, kind, fn, max_share):
+        """
+        Queue a low-priority job only if it can start at once on a spare worker.
+        
+        At least one worker is always left free for other jobs, and jobs of
+        this kind together hold at most `max_share` of the workers, so they
+        never delay real requests by occupying the pool.
+        
+        Parameters:
+        - kind: Kind of job
+        - fn: Callable taking the Job and returning its result
+        - max_share: Fraction of the workers jobs of this kind may hold
+        
+        Returns:
+        - The queued Job, or None if there was no spare worker
+        """
+        with self._lock:
+            self._prune(time.time())
+            active = [job for job in self._jobs.values() if not job.finished]
+            same_kind = sum(job.kind == kind for job in active)
+            if len(active) + 1 >= self.max_workers or same_kind + 1 > int(self.max_workers * max_share):
+                return None
+            job = Job(kind, fn)
+            self._jobs[job.id] = job
+            job._future = self._executor.submit(self._run, job)
+        return job
+    
+    def _run(self, job):
+        if job._cancel.is_set():
+            job.finished_at = time.time()
+            job.status = "cancelled"
+            return
+        job.started_at = time.time()
+        job.status = "running"
+        try:
+            job.result = job._fn(job)
+            status = "done"
+        except JobCancelled:
+            status = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+            status = "failed"
+        # Readers treat a finished status as final, so it is set last
+        job.finished_at = time.time()
+        job.status = status
+    
+    def get(self, job_id):
+        """Get a job by id, or None if it is unknown or was pruned."""
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def cancel(self, job_id):
+        """
+        Cancel a job. A queued job never starts; a running one stops at its
+        next cancellation check (streamed jobs check between chunks).
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return
+        job._cancel.set()
+        if job._future.cancel():
+            job.finished_at = time.time()
+            job.status = "cancelled"
+    
+    def stats(self):
+        """
+        Returns:
+        - Dictionary with the number of jobs in each status and the configured limits
+        """
+        with self._lock:
+            counts = {status: 0 for status in JOB_STATUSES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {"jobs": counts, "workers": self.max_workers, "max_active": self.max_active, "max_per_session": self.max_per_session}
+    
+    def _prune(self, now):
+        """Drop finished jobs past their retention. Must be called with the lock held."""
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.retention
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """
+    Get the process-wide job queue shared by all sessions.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
@@ -0,0 +1,113 @@
+# utils/latency.py
+import math
+import threading
+import time
+from utils.config import APP_CONFIG
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram with approximate percentiles.
+    
+    Buckets grow by a constant factor from `min_value` to `max_value`, so
+    memory is fixed and percentiles are accurate to within one bucket.
+    Observations decay exponentially with age, so percentiles follow current
+    latency: an observation counts half as much after `half_life` seconds.
+    """
+    
+    def __init__(self, min_value=0.01, max_value=600.0, growth=1.1, half_life=None):
+        """
+        Parameters:
+        - min_value: Smallest distinguishable latency in seconds
+        - max_value: Largest tracked latency in seconds (larger values go in the last bucket)
+        - growth: Ratio between consecutive bucket bounds
+        - half_life: Seconds after which an observation's weight has halved (None for no decay)
+        """
+        self.min_value = min_value
+        self.growth = growth
+        self.half_life = half_life
+        self._log_growth = math.log(growth)
+        self.buckets = [0.0] * (int(math.log(max_value / min_value) / self._log_growth) + 2)
+        self.count = 0.0
+        self._decayed_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _decay(self):
+        """Age every bucket to the current time. Must be called with the lock held."""
+        now = time.monotonic()
+        if self.half_life is None or now <= self._decayed_at:
+            return
+        factor = 0.5 ** ((now - self._decayed_at) / self.half_life)
+        self._decayed_at = now
+        self.buckets = [weight * factor for weight in self.buckets]
+        self.count *= factor
+    
+    def _bucket(self, value):
+        if value <= self.min_value:
+            return 0
+        index = int(math.log(value / self.min_value) / self._log_growth) + 1
+        return min(index, len(self.buckets) - 1)
+    
+    def record(self, seconds):
+        """Add one observation."""
+        with self._lock:
+            self._decay()
+            self.buckets[self._bucket(seconds)] += 1
+            self.count += 1
+    
+    def percentile(self, p):
+        """
+        Approximate percentile (0-100) in seconds, or None if empty.
+        Returns the upper bound of the bucket holding the percentile.
+        """
+        with self._lock:
+            self._decay()
+            if not self.count:
+                return None
+            # Slightly under the exact rank, so float rounding in the decayed weights can't overshoot it
+            rank = self.count * p / 100.0 * (1 - 1e-9)
+            seen = 0
+            for index, bucket_count in enumerate(self.buckets):
+                seen += bucket_count
+                if seen >= rank:
+                    return self.min_value * (self.growth ** index)
+        return None
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+def get_histogram(model, metric):
+    """
+    Get the process-wide histogram for a model and metric ("ttft" or "total"),
+    decaying with APP_CONFIG["latency_half_life"].
+    """
+    key = (model, metric)
+    with _histograms_lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = LatencyHistogram(half_life=APP_CONFIG["latency_half_life"])
+            _histograms[key] = histogram
+        return histogram
+
+def record_latency(model, metric, seconds):
+    """Record one latency observation for a model."""
+    get_histogram(model, metric).record(seconds)
+
+def latency_summary():
+    """
+    Summarize every histogram.
+    
+    Returns:
+    - Dictionary of "model/metric" to count (decayed weight of recent
+      observations), p50, p95 and p99 in seconds
+    """
+    with _histograms_lock:
+        items = list(_histograms.items())
+    summary = {}
+    for (model, metric), histogram in items:
+        summary[f"{model}/{metric}"] = {
+            "count": round(histogram.count, 1),
+            "p50": histogram.percentile(50),
+            "p95": histogram.percentile(95),
+            "p99": histogram.percentile(99)
+        }
+    return summary
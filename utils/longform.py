@@ -0,0 +1,100 @@
+# utils/longform.py
+import json
+import math
+import re
+
+OUTLINE_SYSTEM_PROMPT = "You are a creative storyteller who plans long stories. You answer with valid JSON only."
+
+def chapter_count(word_count, chapter_words):
+    """
+    Number of chapters needed for a story of the given length.
+    """
+    return max(2, math.ceil(word_count / chapter_words))
+
+def build_outline_messages(title, genre, characters, setting, theme, word_count, chapters):
+    """
+    Build the chat messages asking for a chapter outline.
+    """
+    prompt = f"""
+    Plan a {genre.lower() + " " if genre else ""}story of about {word_count} words in exactly {chapters} chapters.
+    
+    {f"Title: {title}" if title else "Also invent a creative and captivating title."}
+    Characters: {characters}
+    Setting: {setting}
+    {f"Theme: {theme}" if theme else ""}
+    
+    Answer with a JSON object of the form
+    {{"title": "...", "chapters": [{{"title": "...", "summary": "..."}}]}}
+    where each summary is two or three sentences describing what happens in that chapter.
+    """
+    
+    return [
+        {"role": "system", "content": OUTLINE_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_outline(text):
+    """
+    Parse the outline JSON returned by the model.
+    
+    Parameters:
+    - text: Model response, possibly wrapped in prose or a code fence
+    
+    Returns:
+    - Dictionary with "title" and a non-empty "chapters" list of {"title", "summary"}
+    """
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        raise ValueError("Outline response did not contain JSON")
+    outline = json.loads(match.group(0))
+    chapters = [
+        {"title": str(chapter.get("title", "")).strip() or f"Chapter {i + 1}", "summary": str(chapter.get("summary", "")).strip()}
+        for i, chapter in enumerate(outline.get("chapters") or [])
+        if isinstance(chapter, dict)
+    ]
+    if not chapters:
+        raise ValueError("Outline response did not contain any chapters")
+    return {"title": str(outline.get("title", "")).strip(), "chapters": chapters}
+
+def build_chapter_messages(system_prompt, outline, index, genre, characters, setting, theme, chapter_words):
+    """
+    Build the chat messages for one chapter, given the full outline and the
+    summaries of the neighbouring chapters.
+    """
+    chapters = outline["chapters"]
+    chapter = chapters[index]
+    contents = "\n".join(f"{i + 1}. {c['title']}" for i, c in enumerate(chapters))
+    previous_summary = chapters[index - 1]["summary"] if index > 0 else "This is the first chapter."
+    next_summary = chapters[index + 1]["summary"] if index + 1 < len(chapters) else "This is the final chapter; bring the story to a satisfying close."
+    
+    prompt = f"""
+    You are writing chapter {index + 1} of {len(chapters)} of the {genre.lower() + " " if genre else ""}story "{outline['title']}".
+    
+    Characters: {characters}
+    Setting: {setting}
+    {f"Theme: {theme}" if theme else ""}
+    
+    Chapters:
+    {contents}
+    
+    Previous chapter: {previous_summary}
+    This chapter ({chapter['title']}): {chapter['summary']}
+    Next chapter: {next_summary}
+    
+    Write only this chapter, approximately {chapter_words} words long, without a chapter heading.
+    Include dialogue and descriptive language, and make it flow from the previous chapter into the next.
+    """
+    
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+
+def stitch_chapters(outline, chapter_texts):
+    """
+    Join chapter texts into a single story with chapter headings.
+    """
+    return "\n\n".join(
+        f"## {chapter['title']}\n\n{text.strip()}"
+        for chapter, text in zip(outline["chapters"], chapter_texts)
+    )
@@ -0,0 +1,160 @@
+# utils/migrate_storage.py
+"""
+Move saved stories into the compressed segment store, and maintain it.
+
+Usage:
+    python -m utils.migrate_storage migrate [--source stories]
+    python -m utils.migrate_storage report
+    python -m utils.migrate_storage compact
+
+After migrating, set APP_CONFIG["storage_backend"] = "segment" to use it.
+The JSON files are left in place.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from utils.config import APP_CONFIG
+from utils.story_store import SegmentStore
+
+def open_store(storage_path):
+    return SegmentStore(Path(storage_path) / APP_CONFIG["segment_dir"], APP_CONFIG["segment_compress_level"])
+
+def migrate(source_path, store, force=False):
+    """
+    Copy every story JSON file in a directory into the segment store.
+    Stories already in the store are skipped unless force is set, so the
+    migration can be re-run after an interruption.
+    
+    Returns:
+    - Dictionary with migrated, skipped and failed counts, and the failures
+    """
+    result = {"migrated": 0, "skipped": 0, "failed": 0, "errors": []}
+    for file_path in sorted(Path(source_path).glob("*.json")):
+        key = file_path.stem
+        if key in store and not force:
+            result["skipped"] += 1
+            continue
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                story_data = json.load(f)
+            store.put(key, story_data, sync=False)
+            result["migrated"] += 1
+        except Exception as e:
+            result["failed"] += 1
+            result["errors"].append((str(file_path), str(e)))
+    store.sync()
+    return result
+
+def _timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - start
+
+def report(source_path, store_path):
+    """
+    Compare disk usage and cold-load times of the JSON directory and the segment store.
+    
+    "List" reads titles and metadata only; "load all" also reads every story's content.
+    Both start from fresh objects, but the OS page cache is not dropped.
+    
+    Returns:
+    - Dictionary with a "json" and a "segment" entry
+    """
+    files = sorted(Path(source_path).glob("*.json"))
+    
+    def json_list():
+        stories = []
+        for file_path in files:
+            with open(file_path, "r", encoding="utf-8") as f:
+                story_data = json.load(f)
+            stories.append((story_data.get("title"), story_data.get("metadata", {}).get("genre")))
+        return stories
+    
+    def json_load_all():
+        total = 0
+        for file_path in files:
+            with open(file_path, "r", encoding="utf-8") as f:
+                total += len(json.load(f).get("content", ""))
+        return total
+    
+    def segment_list():
+        store = SegmentStore(store_path, APP_CONFIG["segment_compress_level"])
+        try:
+            return [(entry["title"], entry["genre"]) for entry in store.entries()]
+        finally:
+            store.close()
+    
+    def segment_load_all():
+        store = SegmentStore(store_path, APP_CONFIG["segment_compress_level"])
+        try:
+            return sum(len(store.get(entry["key"]).get("content", "")) for entry in store.entries())
+        finally:
+            store.close()
+    
+    json_stories, json_list_time = _timed(json_list)
+    _, json_load_time = _timed(json_load_all)
+    segment_stories, segment_list_time = _timed(segment_list)
+    _, segment_load_time = _timed(segment_load_all)
+    
+    store = SegmentStore(store_path, APP_CONFIG["segment_compress_level"])
+    stats = store.stats()
+    store.close()
+    return {
+        "json": {
+            "stories": len(json_stories),
+            "bytes": sum(file_path.stat().st_size for file_path in files),
+            "list_seconds": round(json_list_time, 4),
+            "load_all_seconds": round(json_load_time, 4)
+        },
+        "segment": {
+            "stories": len(segment_stories),
+            "bytes": stats["segment_bytes"] + stats["meta_bytes"],
+            "dead_bytes": stats["dead_bytes"],
+            "list_seconds": round(segment_list_time, 4),
+            "load_all_seconds": round(segment_load_time, 4)
+        }
+    }
+
+def _print_report(result):
+    print(f"{'':10s} {'stories':>8s} {'disk (KiB)':>12s} {'list (s)':>10s} {'load all (s)':>13s}")
+    for name in ("json", "segment"):
+        row = result[name]
+        print(
+            f"{name:10s} {row['stories']:8d} {row['bytes'] / 1024:12.1f} "
+            f"{row['list_seconds']:10.4f} {row['load_all_seconds']:13.4f}"
+        )
+    if result["segment"]["bytes"]:
+        print(f"Disk usage ratio: {result['json']['bytes'] / result['segment']['bytes']:.1f}x smaller")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate saved stories to the compressed segment store and maintain it.")
+    parser.add_argument("command", choices=["migrate", "report", "compact"])
+    parser.add_argument("--source", default=APP_CONFIG["file_storage_path"], help="Directory of story JSON files")
+    parser.add_argument("--force", action="store_true", help="Re-copy stories that are already in the store")
+    args = parser.parse_args(argv)
+    
+    store_path = Path(args.source) / APP_CONFIG["segment_dir"]
+    if args.command == "migrate":
+        store = open_store(args.source)
+        result = migrate(args.source, store, args.force)
+        store.close()
+        for file_path, error in result["errors"]:
+            print(f"Error migrating {file_path}: {error}", file=sys.stderr)
+        print(f"{result['migrated']} migrated, {result['skipped']} already in the store, {result['failed']} failed")
+        _print_report(report(args.source, store_path))
+        return 0 if result["failed"] == 0 else 1
+    
+    if args.command == "compact":
+        store = open_store(args.source)
+        reclaimed = store.compact()
+        store.close()
+        print(f"Reclaimed {reclaimed / 1024:.1f} KiB")
+        return 0
+    
+    _print_report(report(args.source, store_path))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# utils/minhash.py
+import string
+import zlib
+import numpy as np
+
+# Signature length and its split into LSH bands. With 16 bands of 8 rows, stories
+# with a Jaccard similarity of 0.7 become candidates about half of the time and
+# those above 0.85 almost always; candidates are then checked against the threshold
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Words per shingle
+SHINGLE_SIZE = 5
+
+# Shingles hashed per batch in bulk signature computation (bounds memory to NUM_PERM x this x 8 bytes)
+_BATCH_SHINGLES = 32768
+
+# Words whose hash is cached, before the cache is cleared
+_WORD_CACHE_SIZE = 200000
+
+# Punctuation (ASCII and the typographic marks common in generated prose) is split off words
+_PUNCTUATION = str.maketrans({mark: " " for mark in string.punctuation + "“”‘’—–…«»"})
+_SHIFT = np.uint64(32)
+_MAX_HASH = np.uint32(0xFFFFFFFF)
+
+# Fixed multiply-shift hash functions ((a * x + b) mod 2^64) >> 32, with odd a,
+# so signatures stay comparable across runs
+_rng = np.random.default_rng(20240611)
+_A = (_rng.integers(1, 1 << 63, NUM_PERM, dtype=np.uint64) << np.uint64(1) | np.uint64(1))[:, None]
+_B = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)[:, None]
+_SHINGLE_MULTIPLIERS = _rng.integers(1, 1 << 32, SHINGLE_SIZE, dtype=np.uint64)
+_BAND_MULTIPLIERS = _rng.integers(1, 1 << 63, ROWS, dtype=np.uint64) | np.uint64(1)
+
+class _WordHashes(dict):
+    """Cache of stable 32-bit word hashes (Python's own hash() differs between processes)."""
+    
+    def __missing__(self, word):
+        if len(self) >= _WORD_CACHE_SIZE:
+            self.clear()
+        value = self[word] = zlib.crc32(word.encode("utf-8"))
+        return value
+
+_word_hashes = _WordHashes()
+
+def _permuted(hashes):
+    """Every hash function applied to every shingle hash (NUM_PERM rows)."""
+    permuted = _A * hashes[None, :]
+    permuted += _B
+    permuted >>= _SHIFT
+    return permuted
+
+def shingle_hashes(text):
+    """
+    Hash the overlapping word n-grams of a text.
+    
+    Parameters:
+    - text: Story text
+    
+    Returns:
+    - uint64 array of 32-bit shingle hashes (empty for texts without words); repeated
+      shingles are kept, as they do not change the minimum
+    """
+    words = text.lower().translate(_PUNCTUATION).split()
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    word_hashes = np.fromiter(map(_word_hashes.__getitem__, words), dtype=np.uint64, count=len(words))
+    size = min(SHINGLE_SIZE, len(words))
+    count = len(words) - size + 1
+    # Combine each window of word hashes; overflow wraps, which is fine for hashing
+    combined = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        combined += word_hashes[offset:offset + count] * _SHINGLE_MULTIPLIERS[offset]
+    return (combined >> _SHIFT) ^ (combined & np.uint64(0xFFFFFFFF))
+
+def signature(text):
+    """
+    MinHash signature of a text.
+    
+    Returns:
+    - uint32 array of NUM_PERM minimum hashes, or None for texts without words
+    """
+    shingles = shingle_hashes(text)
+    if not len(shingles):
+        return None
+    return _permuted(shingles).min(axis=1).astype(np.uint32)
+
+def signatures(texts):
+    """
+    MinHash signatures of many texts, computed in vectorized batches.
+    
+    Parameters:
+    - texts: Iterable of texts
+    
+    Returns:
+    - uint32 array of shape (len(texts), NUM_PERM); rows of texts without words are all 0xFFFFFFFF
+    """
+    shingle_sets = [shingle_hashes(text) for text in texts]
+    result = np.full((len(shingle_sets), NUM_PERM), _MAX_HASH, dtype=np.uint32)
+    
+    # Batch consecutive texts so one matrix of permuted hashes covers many of them
+    start = 0
+    while start < len(shingle_sets):
+        end = start
+        total = 0
+        while end < len(shingle_sets) and (end == start or total + len(shingle_sets[end]) <= _BATCH_SHINGLES):
+            total += len(shingle_sets[end])
+            end += 1
+        rows = [i for i in range(start, end) if len(shingle_sets[i])]
+        if rows:
+            hashes = np.concatenate([shingle_sets[i] for i in rows])
+            offsets = np.cumsum([0] + [len(shingle_sets[i]) for i in rows[:-1]])
+            # Minimum over each text's span of columns
+            result[rows] = np.minimum.reduceat(_permuted(hashes), offsets, axis=1).T.astype(np.uint32)
+        start = end
+    return result
+
+def similarities(signature, stored):
+    """
+    Estimated Jaccard similarity of one signature to many stored ones.
+    
+    Parameters:
+    - signature: Signature to compare
+    - stored: List of signatures as returned by to_bytes()
+    
+    Returns:
+    - float array, one similarity per stored signature
+    """
+    if not stored:
+        return np.empty(0)
+    return (from_bytes(stored) == signature).mean(axis=1)
+
+def band_hashes(signature_rows):
+    """
+    LSH bucket of every band of one or more signatures.
+    
+    Parameters:
+    - signature_rows: One signature, or an array of signatures (one per row)
+    
+    Returns:
+    - int64 array of BANDS bucket ids (one row per signature for a 2-D input)
+    """
+    rows = np.asarray(signature_rows, dtype=np.uint64)
+    banded = rows.reshape(rows.shape[:-1] + (BANDS, ROWS))
+    return (banded * _BAND_MULTIPLIERS).sum(axis=-1).view(np.int64)
+
+def has_words(signature_row):
+    """Whether a row of signatures() belongs to a text with words."""
+    return bool((signature_row != _MAX_HASH).any())
+
+def to_bytes(signature_row):
+    return np.asarray(signature_row, dtype=np.uint32).tobytes()
+
+def from_bytes(stored):
+    """Stack signatures stored with to_bytes() into a uint32 array, one per row."""
+    return np.frombuffer(b"".join(stored), dtype=np.uint32).reshape(len(stored), NUM_PERM)
+
+def _candidate_pairs(signature_rows):
+    """Pairs of rows sharing an LSH bucket in at least one band, found by sorting each band's bucket ids."""
+    valid = np.flatnonzero((signature_rows != _MAX_HASH).any(axis=1))
+    if len(valid) < 2:
+        return set()
+    buckets = band_hashes(signature_rows[valid])
+    pairs = set()
+    for band in range(BANDS):
+        order = np.argsort(buckets[:, band], kind="stable")
+        sorted_buckets = buckets[order, band]
+        boundaries = np.flatnonzero(np.diff(sorted_buckets)) + 1
+        for group in np.split(order, boundaries):
+            if len(group) > 1:
+                members = valid[np.sort(group)]
+                pairs.update((int(members[i]), int(members[j])) for i in range(len(members)) for j in range(i + 1, len(members)))
+    return pairs
+
+def cluster(signature_rows, threshold, pairs=None):
+    """
+    Group near-duplicate texts by their signatures.
+    
+    Candidate pairs share an LSH bucket in at least one band; a pair is kept
+    if its estimated similarity reaches the threshold, and clusters are the
+    connected groups of kept pairs.
+    
+    Parameters:
+    - signature_rows: uint32 array of signatures, one per row (all-0xFFFFFFFF rows are ignored)
+    - threshold: Minimum estimated Jaccard similarity
+    - pairs: Candidate pairs of row indexes, e.g. from a stored LSH index;
+      computed from the signatures' bands when omitted
+    
+    Returns:
+    - List of clusters with more than one member, each a sorted list of row indexes
+    """
+    signature_rows = np.asarray(signature_rows, dtype=np.uint32)
+    if pairs is None:
+        pairs = _candidate_pairs(signature_rows)
+    if not pairs:
+        return []
+    
+    # Check every candidate pair at once
+    left, right = np.array(sorted(pairs)).T
+    scores = (signature_rows[left] == signature_rows[right]).mean(axis=1)
+    
+    parent = {}
+    
+    def find(i):
+        parent.setdefault(i, i)
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    for i, j in zip(left[scores >= threshold], right[scores >= threshold]):
+        parent[find(int(i))] = find(int(j))
+    groups = {}
+    for i in parent:
+        groups.setdefault(find(i), []).append(i)
+    return sorted(sorted(group) for group in groups.values() if len(group) > 1)
@@ -0,0 +1,199 @@
+# utils/response_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from utils.config import APP_CONFIG
+
+class ResponseCache:
+    """
+    Content-addressed cache for model responses.
+    
+    Entries live in a bounded in-memory LRU and, optionally, in an on-disk
+    tier of one small JSON file per key. Both tiers honour the same TTL.
+    """
+    
+    def __init__(self, max_entries=256, ttl=None, disk_path=None, max_disk_bytes=None):
+        """
+        Parameters:
+        - max_entries: Maximum number of entries kept in memory
+        - ttl: Seconds an entry stays valid (None for no expiry)
+        - disk_path: Directory for the on-disk tier (None to disable it)
+        - max_disk_bytes: Size limit for the on-disk tier (None for no limit)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_path = Path(disk_path) if disk_path else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        
+        if self.disk_path:
+            self.disk_path.mkdir(exist_ok=True, parents=True)
+            self._disk_bytes = sum(p.stat().st_size for p in self.disk_path.glob("*.json"))
+    
+    @staticmethod
+    def make_key(kind, messages, **params):
+        """
+        Build a cache key from the full prompt and the model parameters.
+        
+        Parameters:
+        - kind: Request type (e.g. "story" or "expansion")
+        - messages: Chat messages sent to the model
+        - params: Model parameters (model, temperature, max_tokens, ...)
+        
+        Returns:
+        - Hex digest identifying the request
+        """
+        payload = json.dumps({"kind": kind, "messages": messages, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+    
+    def get(self, key):
+        """
+        Look up a cached value.
+        
+        Returns:
+        - The cached value, or None on a miss
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._expired(entry["created"]):
+                    del self._memory[key]
+                else:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry["value"]
+            
+            entry = self._read_disk(key)
+            if entry is not None:
+                self._remember(key, entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry["value"]
+            
+            self.misses += 1
+            return None
+    
+    def set(self, key, value):
+        """
+        Store a JSON-serializable value under a key in both tiers.
+        """
+        entry = {"created": time.time(), "value": value}
+        with self._lock:
+            self._remember(key, entry)
+            self._write_disk(key, entry)
+    
+    def clear(self):
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self.disk_path:
+                for file_path in self.disk_path.glob("*.json"):
+                    file_path.unlink(missing_ok=True)
+                self._disk_bytes = 0
+    
+    def stats(self):
+        """
+        Get cache counters.
+        
+        Returns:
+        - Dictionary with hit/miss counts, hit rate and tier sizes
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes
+            }
+    
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def _read_disk(self, key):
+        if not self.disk_path:
+            return None
+        file_path = self.disk_path / f"{key}.json"
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry["created"]):
+            self._unlink(file_path)
+            return None
+        return entry
+    
+    def _write_disk(self, key, entry):
+        if not self.disk_path:
+            return
+        file_path = self.disk_path / f"{key}.json"
+        tmp_path = file_path.with_suffix(".tmp")
+        try:
+            if file_path.exists():
+                self._disk_bytes -= file_path.stat().st_size
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, file_path)
+            self._disk_bytes += file_path.stat().st_size
+        except OSError:
+            return
+        if self.max_disk_bytes is not None and self._disk_bytes > self.max_disk_bytes:
+            self._trim_disk()
+    
+    def _trim_disk(self):
+        # Evict the oldest files until the tier fits in its size limit again
+        files = sorted(self.disk_path.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for file_path in files:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._unlink(file_path)
+    
+    def _unlink(self, file_path):
+        try:
+            size = file_path.stat().st_size
+            file_path.unlink()
+            self._disk_bytes -= size
+        except OSError:
+            pass
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """
+    Get the process-wide response cache, configured from APP_CONFIG.
+    Returns None if caching is disabled.
+    """
+    global _cache
+    if not APP_CONFIG["cache_enabled"]:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            disk_path = None
+            if APP_CONFIG["cache_disk_enabled"]:
+                disk_path = Path(APP_CONFIG["file_storage_path"]) / APP_CONFIG["cache_dir"]
+            _cache = ResponseCache(
+                max_entries=APP_CONFIG["cache_max_entries"],
+                ttl=APP_CONFIG["cache_ttl"],
+                disk_path=disk_path,
+                max_disk_bytes=APP_CONFIG["cache_max_disk_bytes"]
+            )
+        return _cache
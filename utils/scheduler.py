@@ -0,0 +1,313 @@
+# utils/scheduler.py
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+import groq
+from utils.config import APP_CONFIG
+from utils.token_budget import get_token_budget
+
+# Errors worth retrying: rate limits, timeouts, dropped connections and 5xx responses
+RETRYABLE_ERRORS = (groq.RateLimitError, groq.APITimeoutError, groq.APIConnectionError, groq.InternalServerError)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+def parse_reset(value):
+    """
+    Parse a rate-limit reset header ("2m59.56s", "7.66s", "120ms" or plain seconds).
+    
+    Returns:
+    - Seconds as a float, or None if the value cannot be parsed
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously up to its capacity.
+    Not thread-safe on its own; the scheduler guards it with its lock.
+    """
+    
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+    
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+    
+    def time_until(self, amount, now):
+        """Seconds until `amount` tokens are available (0 if they already are)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+    
+    def consume(self, amount, now):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+    
+    def sync(self, remaining, now):
+        """Lower the local estimate to what the server reports as remaining."""
+        self._refill(now)
+        self.tokens = min(self.tokens, float(remaining))
+
+class _ModelState:
+    def __init__(self, limits):
+        requests_per_minute = limits["requests_per_minute"]
+        tokens_per_minute = limits["tokens_per_minute"]
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.blocked_until = 0.0
+        # Waiting tickets per session, served round-robin across sessions
+        self.queues = {}
+        self.turns = deque()
+
+class RequestScheduler:
+    """
+    Rate-limit-aware scheduler for Groq API calls.
+    
+    Tracks request and token budgets per model with token buckets, corrects
+    them from the x-ratelimit-* response headers, serves waiting requests
+    round-robin across sessions, and retries rate-limit and transient errors
+    with jittered exponential backoff.
+    """
+    
+    def __init__(self, rate_limits=None, max_retries=None, backoff_base=None, backoff_cap=None):
+        """
+        Parameters:
+        - rate_limits: Dict of model name (or "default") to requests_per_minute/tokens_per_minute
+        - max_retries: Retries after the first attempt
+        - backoff_base: Base delay in seconds for exponential backoff
+        - backoff_cap: Maximum delay in seconds between retries
+        """
+        self.rate_limits = rate_limits or APP_CONFIG["rate_limits"]
+        self.max_retries = APP_CONFIG["scheduler_max_retries"] if max_retries is None else max_retries
+        self.backoff_base = backoff_base or APP_CONFIG["scheduler_backoff_base"]
+        self.backoff_cap = backoff_cap or APP_CONFIG["scheduler_backoff_cap"]
+        self._models = {}
+        self._cond = threading.Condition()
+    
+    def _state(self, model):
+        state = self._models.get(model)
+        if state is None:
+            state = _ModelState(self.rate_limits.get(model, self.rate_limits["default"]))
+            self._models[model] = state
+        return state
+    
+    def _enqueue(self, state, session_id, ticket):
+        queue = state.queues.setdefault(session_id, deque())
+        queue.append(ticket)
+        if len(queue) == 1:
+            state.turns.append(session_id)
+    
+    def _discard(self, model, session_id, ticket):
+        """
+        Remove an abandoned ticket (cancelled or interrupted wait) from the queue.
+        Must be called with the lock held.
+        """
+        state = self._state(model)
+        queue = state.queues.get(session_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del state.queues[session_id]
+            state.turns.remove(session_id)
+        self._cond.notify_all()
+    
+    def _try_acquire(self, model, tokens, session_id, ticket):
+        """
+        Grant the ticket if it is first in line and the budgets allow it.
+        Must be called with the lock held.
+        
+        Returns:
+        - Seconds to wait before trying again (0 when granted, None when not this ticket's turn)
+        """
+        state = self._state(model)
+        if state.turns[0] != session_id or state.queues[session_id][0] is not ticket:
+            return None
+        
+        now = time.monotonic()
+        wait = max(
+            state.blocked_until - now,
+            state.requests.time_until(1, now),
+            state.tokens.time_until(tokens, now)
+        )
+        if wait > 0:
+            return wait
+        
+        state.requests.consume(1, now)
+        state.tokens.consume(tokens, now)
+        state.queues[session_id].popleft()
+        state.turns.popleft()
+        if state.queues[session_id]:
+            state.turns.append(session_id)
+        else:
+            del state.queues[session_id]
+        return 0.0
+    
+    def acquire(self, model, tokens, session_id=None):
+        """
+        Block until a request for `model` estimated at `tokens` tokens may be sent.
+        
+        Returns:
+        - Seconds spent waiting in the queue
+        """
+        start = time.monotonic()
+        ticket = object()
+        with self._cond:
+            self._enqueue(self._state(model), session_id, ticket)
+            try:
+                while True:
+                    wait = self._try_acquire(model, tokens, session_id, ticket)
+                    if wait == 0.0:
+                        self._cond.notify_all()
+                        return time.monotonic() - start
+                    self._cond.wait(timeout=wait if wait is not None else 0.5)
+            except BaseException:
+                self._discard(model, session_id, ticket)
+                raise
+    
+    async def acquire_async(self, model, tokens, session_id=None):
+        """
+        Async variant of acquire; waits without blocking the event loop.
+        
+        Returns:
+        - Seconds spent waiting in the queue
+        """
+        start = time.monotonic()
+        ticket = object()
+        with self._cond:
+            self._enqueue(self._state(model), session_id, ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_acquire(model, tokens, session_id, ticket)
+                    if wait == 0.0:
+                        self._cond.notify_all()
+                        return time.monotonic() - start
+                await asyncio.sleep(min(wait, 1.0) if wait is not None else 0.05)
+        except BaseException:
+            with self._cond:
+                self._discard(model, session_id, ticket)
+            raise
+    
+    def update_from_headers(self, model, headers):
+        """
+        Correct the local budgets from x-ratelimit-* (and retry-after) response headers.
+        """
+        if headers is None:
+            return
+        now = time.monotonic()
+        with self._cond:
+            state = self._state(model)
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if remaining_requests is not None:
+                reset = parse_reset(headers.get("x-ratelimit-reset-requests"))
+                if int(float(remaining_requests)) <= 0 and reset:
+                    # Exhausted: hold the model until the server's window resets
+                    state.blocked_until = max(state.blocked_until, now + reset)
+                else:
+                    state.requests.sync(int(float(remaining_requests)), now)
+            if remaining_tokens is not None:
+                state.tokens.sync(int(float(remaining_tokens)), now)
+            retry_after = parse_reset(headers.get("retry-after"))
+            if retry_after:
+                state.blocked_until = max(state.blocked_until, now + retry_after)
+    
+    def _backoff(self, attempt, error):
+        """Delay before the next attempt: the server's retry-after if given, else full-jitter exponential."""
+        response = getattr(error, "response", None)
+        retry_after = parse_reset(response.headers.get("retry-after")) if response is not None else None
+        if retry_after:
+            return retry_after
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+    
+    def call(self, send, model, tokens, session_id=None, info=None):
+        """
+        Send a request through the scheduler, retrying rate-limit and transient errors.
+        
+        Parameters:
+        - send: Callable returning a raw API response (with .headers and .parse())
+        - model: Model the request targets
+        - tokens: Estimated tokens the request will consume (prompt + max_tokens)
+        - session_id: Identifier used for fair ordering between sessions
+        - info: Dict to accumulate queue_wait and retries into, so they are known even if the call fails
+        
+        Returns:
+        - Tuple of (parsed response, info dict with queue_wait and retries)
+        """
+        info = info if info is not None else {"queue_wait": 0.0, "retries": 0}
+        for attempt in range(self.max_retries + 1):
+            info["queue_wait"] += self.acquire(model, tokens, session_id)
+            try:
+                raw = send()
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                self._record_failure(model, e)
+                info["retries"] += 1
+                time.sleep(self._backoff(attempt, e))
+                continue
+            self.update_from_headers(model, raw.headers)
+            return raw.parse(), info
+    
+    async def call_async(self, send, model, tokens, session_id=None, info=None):
+        """
+        Async variant of call; `send` is a coroutine function returning a raw API response.
+        """
+        info = info if info is not None else {"queue_wait": 0.0, "retries": 0}
+        for attempt in range(self.max_retries + 1):
+            info["queue_wait"] += await self.acquire_async(model, tokens, session_id)
+            try:
+                raw = await send()
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                self._record_failure(model, e)
+                info["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            self.update_from_headers(model, raw.headers)
+            return await raw.parse(), info
+    
+    def _record_failure(self, model, error):
+        # A 429 tells us the budget is exhausted right now, whatever the buckets think
+        response = getattr(error, "response", None)
+        if isinstance(error, groq.RateLimitError) and response is not None:
+            self.update_from_headers(model, response.headers)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """
+    Get the process-wide request scheduler shared by all sessions.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
+
+def estimate_request_tokens(messages, max_tokens, model=None):
+    """
+    Token cost of a request for rate-limit budgeting: estimated prompt tokens plus max_tokens.
+    """
+    return get_token_budget().estimate_prompt_tokens(messages, model) + max_tokens
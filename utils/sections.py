@@ -0,0 +1,155 @@
+# utils/sections.py
+import re
+
+# Requests that touch the whole story and cannot be served by editing a few paragraphs
+_GLOBAL_REQUEST = re.compile(
+    r"\b(whole|entire|everything|throughout|overall|all (?:of )?the|every|tone|style|"
+    r"tense|point of view|pov|longer|shorter|expand|condense|summari[sz]e|translate|rewrite (?:it|the story))\b",
+    re.IGNORECASE
+)
+_PARAGRAPH_NUMBER = re.compile(r"\b(?:paragraph|section|para)\s*#?\s*(\d+)\b", re.IGNORECASE)
+_ORDINALS = {
+    "first": 0, "second": 1, "third": 2, "fourth": 3, "fifth": 4,
+    "sixth": 5, "seventh": 6, "eighth": 7, "ninth": 8, "tenth": 9
+}
+_ORDINAL_PARAGRAPH = re.compile(r"\b(" + "|".join(_ORDINALS) + r"|last|final)\s+(?:paragraph|section|para)\b", re.IGNORECASE)
+_OPENING = re.compile(r"\b(beginning|opening|start|intro|introduction)\b", re.IGNORECASE)
+_ENDING = re.compile(r"\b(ending|end|conclusion|finale|climax)\b", re.IGNORECASE)
+_MARKER = re.compile(r"^\s*\[P(\d+)\]\s*$", re.MULTILINE)
+_WORD = re.compile(r"[a-z0-9']+")
+
+_STOPWORDS = {
+    "the", "and", "that", "this", "with", "from", "into", "have", "make", "more", "less",
+    "about", "where", "when", "what", "which", "there", "their", "they", "them", "then",
+    "please", "change", "modify", "edit", "update", "revise", "rewrite", "story", "part",
+    "should", "would", "could", "some", "want", "like", "instead", "also", "just", "than"
+}
+
+def split_sections(text):
+    """
+    Split story text into paragraphs.
+    
+    Parameters:
+    - text: Story text with paragraphs separated by blank lines
+    
+    Returns:
+    - List of paragraph strings
+    """
+    return [part.strip() for part in re.split(r"\n\s*\n", text) if part.strip()]
+
+def join_sections(sections):
+    """Join paragraphs back into story text."""
+    return "\n\n".join(sections)
+
+def is_global_request(request):
+    """Whether a revision request applies to the story as a whole."""
+    return bool(_GLOBAL_REQUEST.search(request))
+
+def _keywords(text):
+    return {word for word in _WORD.findall(text.lower()) if len(word) > 3 and word not in _STOPWORDS}
+
+def select_sections(sections, request, max_sections=4):
+    """
+    Pick the paragraphs a revision request most likely refers to.
+    
+    Explicit references ("paragraph 3", "the last paragraph", "the ending")
+    win; otherwise paragraphs are ranked by keyword overlap with the request.
+    
+    Parameters:
+    - sections: List of paragraphs
+    - request: The user's revision request
+    - max_sections: Upper bound on the number of paragraphs returned
+    
+    Returns:
+    - Sorted list of paragraph indexes (empty if nothing matched)
+    """
+    count = len(sections)
+    selected = set()
+    
+    for match in _PARAGRAPH_NUMBER.finditer(request):
+        index = int(match.group(1)) - 1
+        if 0 <= index < count:
+            selected.add(index)
+    for match in _ORDINAL_PARAGRAPH.finditer(request):
+        word = match.group(1).lower()
+        index = count - 1 if word in ("last", "final") else _ORDINALS[word]
+        if 0 <= index < count:
+            selected.add(index)
+    if not selected and _OPENING.search(request):
+        selected.update(range(min(2, count)))
+    if not selected and _ENDING.search(request):
+        selected.update(range(max(0, count - 2), count))
+    
+    if not selected:
+        wanted = _keywords(request)
+        scores = []
+        for index, section in enumerate(sections):
+            score = len(wanted & _keywords(section))
+            if score:
+                scores.append((score, index))
+        scores.sort(key=lambda item: (-item[0], item[1]))
+        selected.update(index for _, index in scores[:max_sections])
+    
+    return sorted(selected)[:max_sections]
+
+def build_context_summary(sections, selected, width=100):
+    """
+    Build a compact outline of the story: one truncated line per paragraph,
+    with the selected paragraphs marked for editing.
+    
+    Parameters:
+    - sections: List of paragraphs
+    - selected: Indexes of the paragraphs sent in full
+    - width: Maximum characters kept per paragraph line
+    
+    Returns:
+    - Outline text
+    """
+    lines = []
+    for index, section in enumerate(sections):
+        marker = f"[P{index + 1}]"
+        if index in selected:
+            lines.append(f"{marker} (to revise, given in full below)")
+        else:
+            line = " ".join(section.split())
+            if len(line) > width:
+                line = line[:width].rsplit(" ", 1)[0] + "…"
+            lines.append(f"{marker} {line}")
+    return "\n".join(lines)
+
+def parse_replacements(text, allowed):
+    """
+    Parse a model response made of "[P<n>]" markers followed by replacement text.
+    
+    Parameters:
+    - text: Model response
+    - allowed: Indexes (0-based) the model was asked to revise
+    
+    Returns:
+    - Dictionary mapping paragraph index to replacement text (may span several paragraphs)
+    """
+    replacements = {}
+    markers = list(_MARKER.finditer(text))
+    for position, match in enumerate(markers):
+        index = int(match.group(1)) - 1
+        end = markers[position + 1].start() if position + 1 < len(markers) else len(text)
+        if index in allowed:
+            replacements[index] = text[match.end():end].strip()
+    return replacements
+
+def apply_replacements(sections, replacements):
+    """
+    Patch replacement text into the list of paragraphs.
+    An empty replacement removes the paragraph.
+    
+    Returns:
+    - Updated story text
+    """
+    patched = []
+    for index, section in enumerate(sections):
+        if index in replacements:
+            if replacements[index]:
+                patched.append(replacements[index])
+        else:
+            patched.append(section)
+    return join_sections(patched)
@@ -0,0 +1,69 @@
+# utils/speculation.py
+import threading
+from utils.story_generator import estimate_story_request
+from utils.token_budget import get_token_budget
+
+# Process-wide outcome counters of speculative story generation
+_stats = {"started": 0, "hits": 0, "misses": 0, "skipped": 0, "wasted_tokens": 0, "saved_seconds": 0.0}
+_stats_lock = threading.Lock()
+
+def record_start():
+    """Count a speculative generation that was started."""
+    with _stats_lock:
+        _stats["started"] += 1
+
+def record_skip():
+    """Count a speculation that was not started (waste cap reached or queue busy)."""
+    with _stats_lock:
+        _stats["skipped"] += 1
+
+def record_hit(saved_seconds):
+    """
+    Count a speculation that was reused for the real request.
+    
+    Parameters:
+    - saved_seconds: How long it had been running when the request came in
+    """
+    with _stats_lock:
+        _stats["hits"] += 1
+        _stats["saved_seconds"] += saved_seconds
+
+def record_miss(wasted_tokens):
+    """Count a speculation that was discarded, with the tokens it consumed."""
+    with _stats_lock:
+        _stats["misses"] += 1
+        _stats["wasted_tokens"] += wasted_tokens
+
+def get_stats():
+    """
+    Snapshot of the speculation counters.
+    
+    Returns:
+    - Dictionary with started, hits, misses, skipped, wasted_tokens, saved_seconds
+      and hit_rate (hits over resolved speculations, None before any)
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    resolved = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / resolved if resolved else None
+    stats["saved_seconds"] = round(stats["saved_seconds"], 2)
+    return stats
+
+def wasted_tokens(story_params, text):
+    """
+    Estimated tokens spent on a discarded speculation: its prompt, if it was
+    sent, plus the text it had produced.
+    
+    Parameters:
+    - story_params: Parameters of the speculative story request
+    - text: Text produced before it was discarded (None if it never started)
+    """
+    if text is None:
+        return 0
+    model = story_params["model"]
+    prompt_tokens = estimate_story_request(
+        story_params["title"], story_params["genre"], story_params["characters"], story_params["setting"],
+        story_params["theme"], story_params["word_count"], model
+    )["prompt_tokens"]
+    completion_tokens = get_token_budget().estimate_prompt_tokens([{"role": "assistant", "content": text}], model) if text else 0
+    return prompt_tokens + completion_tokens
@@ -0,0 +1,112 @@
+# utils/story_cache.py
+import copy
+import threading
+from collections import OrderedDict
+
+class StoryCache:
+    """
+    Process-wide LRU cache of full stories, shared by all sessions.
+    
+    Sessions only keep lightweight records of the library; a story's
+    content is read when it is opened, and the parsed story is kept here so
+    the next session opening it does not read it again. Every entry carries
+    the version stamp of what was read (file mtime and size, or segment
+    store sequence number) and is only served while the stamp still matches,
+    so stories changed on disk, by this process or another, are read afresh.
+    """
+    
+    def __init__(self, max_entries=256, max_bytes=None):
+        """
+        Parameters:
+        - max_entries: Maximum number of stories kept
+        - max_bytes: Maximum total size of the kept stories, as stored (None for no limit)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+    
+    def get(self, key, stamp):
+        """
+        Look up a story.
+        
+        Parameters:
+        - key: File path or segment store locator
+        - stamp: Current version stamp of the story
+        
+        Returns:
+        - A copy of the cached story (callers may modify it), or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["stamp"] != stamp:
+                self._drop(key)
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            story = entry["story"]
+        return copy.deepcopy(story)
+    
+    def put(self, key, stamp, story, size):
+        """
+        Keep a story that was just read.
+        
+        Parameters:
+        - key: File path or segment store locator
+        - stamp: Version stamp taken before the story was read
+        - story: Parsed story; a copy is kept
+        - size: Size of the story as stored, in bytes
+        """
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        story = copy.deepcopy(story)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = {"stamp": stamp, "story": story, "size": size}
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["size"]
+    
+    def invalidate(self, key):
+        """Forget a story, e.g. after it was saved again or removed."""
+        with self._lock:
+            self._drop(key)
+    
+    def clear(self):
+        """Forget every story."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self):
+        """
+        Get cache counters.
+        
+        Returns:
+        - Dictionary with hit/miss/stale counts, hit rate, entries and bytes held
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            }
+    
+    def _drop(self, key):
+        """Remove an entry if present. Must be called with the lock held."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["size"]
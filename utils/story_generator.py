@@ -1,23 +1,595 @@
 # utils/story_generator.py
+import asyncio
+import contextlib
 import time
 import re
+import itertools
+import math
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime
-import streamlit as st
-from groq import Groq
 from utils.config import APP_CONFIG, get_model
+from utils.client_pool import get_client, new_async_client, release_client
+from utils.response_cache import ResponseCache, get_response_cache
+from utils.scheduler import get_scheduler, estimate_request_tokens
+from utils.latency import get_histogram, record_latency
+from utils.token_budget import get_token_budget
+from utils import telemetry
+from utils import sections as story_sections
+from utils import longform
+
+STORY_SYSTEM_PROMPT = "You are a creative storyteller. Your task is to write engaging, original stories based on user parameters. Make your stories vivid, emotionally resonant, and memorable."
+EXPANSION_SYSTEM_PROMPT = "You are a creative storyteller. Your task is to expand or modify existing stories based on user requests while maintaining narrative consistency."
+TITLE_SYSTEM_PROMPT = "You write short, evocative titles for stories. You answer with the title only."
+REVISION_SYSTEM_PROMPT = "You are a careful story editor. You revise only the paragraphs you are given, keeping them consistent with the rest of the story, and you answer strictly in the requested format."
+
+def _finished(response):
+    """Whether a blocking completion ended normally (not cut off by max_tokens or a filter)."""
+    return getattr(response.choices[0], "finish_reason", None) == "stop"
+
+def _timed_text(chunks, model, start_time, record_ttft=True, on_done=None):
+    """
+    Yield the non-empty text deltas of a streamed chat completion, recording
+    time-to-first-token and total latency in the model's latency histograms.
+    
+    on_done, if given, is called with (usage, text, finish_reason) once the
+    stream is exhausted; usage comes from the final chunk when the API sends it.
+    """
+    first = record_ttft
+    parts = []
+    usage = None
+    finish_reason = None
+    for chunk in chunks:
+        x_groq = getattr(chunk, "x_groq", None)
+        usage = getattr(chunk, "usage", None) or getattr(x_groq, "usage", None) or usage
+        if not chunk.choices:
+            continue
+        finish_reason = getattr(chunk.choices[0], "finish_reason", None) or finish_reason
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if first:
+            record_latency(model, "ttft", time.time() - start_time)
+            first = False
+        parts.append(delta)
+        yield delta
+    record_latency(model, "total", time.time() - start_time)
+    if on_done:
+        on_done(usage, "".join(parts), finish_reason)
+
+# Worker threads that open hedged streams while the caller waits on the fastest one
+_hedge_executor = ThreadPoolExecutor(max_workers=APP_CONFIG["hedge_max_workers"], thread_name_prefix="hedge")
+
+# Title requests run beside the story request they belong to
+_title_executor = ThreadPoolExecutor(max_workers=APP_CONFIG["title_max_workers"], thread_name_prefix="title")
+
+# First line of a story written with its title: an optional "Title:" or "#" prefix, then the title
+_TITLE_LINE = re.compile(r'^(?:Title:\s*|\s*#\s*|\s*)(.*?)(?:\n|$)', re.IGNORECASE)
+
+# First line of a story, and the "Title:" label (optionally in markdown) that marks it as a heading
+_FIRST_LINE = re.compile(r'^\s*([^\n]*)(?:\n|$)')
+_TITLE_LABEL = re.compile(r'^[#*_\s]*title\s*:', re.IGNORECASE)
+
+# Longest first line still taken for a heading rather than the story's opening
+_MAX_HEADING_CHARS = 120
+
+def separate_title(title):
+    """Whether a story's title is generated by its own request rather than as part of the story."""
+    return not title and APP_CONFIG["title_parallel"]
+
+def clean_title(text):
+    """
+    Turn a title model's answer into a bare title: its first non-empty line
+    without a "Title:" label, markdown or quotes.
+    
+    Returns:
+    - Title, or None if the answer holds none
+    """
+    line = next((line for line in (text or "").splitlines() if line.strip()), "")
+    for _ in range(2):
+        # Labels and quotes come in either order ("Title: \"...\"" or "**Title: ...**")
+        line = line.strip().strip('#*_"\'“”‘’').strip()
+        line = re.sub(r'^title\s*:\s*', '', line, flags=re.IGNORECASE)
+    return line[:120] or None
+
+def _close_quietly(stream):
+    try:
+        stream.close()
+    except Exception:
+        pass
+
+class _MeteredStream:
+    """
+    Wraps a chunk stream to complete its telemetry record: time to the first
+    content chunk, usage from the final chunk, and the error or cancellation
+    that ended it.
+    """
+    
+    def __init__(self, stream, call, on_close=None):
+        """
+        Parameters:
+        - stream: Chunk stream of the API
+        - call: Telemetry record of the call
+        - on_close: Called once when the stream ends, fails or is closed (optional)
+        """
+        self._stream = stream
+        self._call = call
+        self._on_close = on_close
+    
+    def _closed(self):
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close()
+    
+    def __iter__(self):
+        call = self._call
+        usage = None
+        try:
+            for chunk in self._stream:
+                x_groq = getattr(chunk, "x_groq", None)
+                usage = getattr(chunk, "usage", None) or getattr(x_groq, "usage", None) or usage
+                if call["ttft"] is None and chunk.choices and chunk.choices[0].delta.content:
+                    call["ttft"] = time.time() - call["_start"]
+                yield chunk
+        except GeneratorExit:
+            telemetry.finish_call(call, usage, error="Cancelled")
+            raise
+        except Exception as e:
+            telemetry.finish_call(call, usage, error=e)
+            raise
+        finally:
+            self._closed()
+        telemetry.finish_call(call, usage)
+    
+    def close(self):
+        telemetry.finish_call(self._call, error="Cancelled")
+        try:
+            self._stream.close()
+        finally:
+            self._closed()
+
+class StoryStream:
+    """
+    Iterable over the text chunks of a streamed completion.
+    
+    Iterating yields each non-empty text delta as it arrives. Once the stream
+    is exhausted, `result` holds the finalized value (the same value the
+    blocking method would have returned) and `time_to_first_token` holds the
+    delay in seconds before the first chunk arrived.
+    """
+    
+    def __init__(self, chunks, finalize, start_time, title_future=None):
+        """
+        Parameters:
+        - chunks: Iterator of text chunks
+        - finalize: Callable(text, completion_time, time_to_first_token) building the result
+        - start_time: time.time() at which the request was sent
+        - title_future: Parallel title request of the story, cancelled with it (optional)
+        """
+        self._chunks = chunks
+        self._finalize = finalize
+        self._start_time = start_time
+        self._title_future = title_future
+        self.time_to_first_token = None
+        self.text = ""
+        self.result = None
+    
+    def __iter__(self):
+        parts = []
+        for delta in self._chunks:
+            if self.time_to_first_token is None:
+                self.time_to_first_token = time.time() - self._start_time
+            parts.append(delta)
+            yield delta
+        
+        self.text = "".join(parts)
+        completion_time = time.time() - self._start_time
+        self.result = self._finalize(self.text, completion_time, self.time_to_first_token)
+    
+    def close(self):
+        """
+        Abandon the stream: close the underlying request and cancel the title
+        request if it has not started. A title request already running still
+        finishes into the response cache, where an identical story request finds it.
+        """
+        if self._title_future is not None:
+            self._title_future.cancel()
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
 
 class StoryGenerator:
-    def __init__(self, api_key):
+    def __init__(self, api_key, session_id=None):
         """
         Initialize the story generator with an API key.
+        The underlying Groq client is shared process-wide per API key and
+        looked up for every request, so a generator kept by a long or queued
+        job never uses a client that was evicted while it waited.
         
         Parameters:
         - api_key: Groq API key
+        - session_id: Identifier of the calling session, used for fair request scheduling
         """
         self.api_key = api_key
-        self.client = Groq(api_key=api_key)
+        self.session_id = session_id
+    
+    def _create(self, model, messages, max_tokens, temperature, stream=False, expected_words=None, kind="story"):
+        """
+        Send a chat completion request through the process-wide rate-limit scheduler.
+        Every call is recorded in the telemetry log under `kind`; blocking
+        responses also feed their usage into the token budget calibration.
+        
+        Returns:
+        - The parsed completion (or a chunk stream when stream=True)
+        """
+        start_time = time.time()
+        call = telemetry.start_call(kind, model, self.session_id, stream)
+        # Held until the response (or the whole stream) has been read
+        client = get_client(self.api_key, hold=True)
+        try:
+            response, _ = get_scheduler().call(
+                lambda: client.chat.completions.with_raw_response.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=stream
+                ),
+                model,
+                estimate_request_tokens(messages, max_tokens, model),
+                self.session_id,
+                info=call
+            )
+        except Exception as e:
+            release_client(self.api_key)
+            telemetry.finish_call(call, error=e)
+            raise
+        if stream:
+            return _MeteredStream(response, call, on_close=lambda: release_client(self.api_key))
+        release_client(self.api_key)
+        
+        record_latency(model, "total", time.time() - start_time)
+        telemetry.finish_call(call, response.usage)
+        choice = response.choices[0]
+        get_token_budget().observe(
+            model, messages, response.usage, choice.message.content,
+            expected_words, getattr(choice, "finish_reason", None) == "length"
+        )
+        return response
+    
+    def _observer(self, model, messages, expected_words, outcome=None):
+        """
+        Callback feeding a finished stream's usage into the token budget calibration,
+        and its finish reason into `outcome` (a dictionary, if given).
+        """
+        budget = get_token_budget()
+        def observe(usage, text, finish_reason):
+            budget.observe(model, messages, usage, text, expected_words, finish_reason == "length")
+            if outcome is not None:
+                outcome["finish_reason"] = finish_reason
+        return observe
+    
+    def _max_tokens(self, messages, model, words, overhead=32):
+        """
+        Tight max_tokens for a response of about `words` words, from the calibrated token budget.
+        """
+        budget = get_token_budget()
+        return budget.completion_budget(words, model, budget.estimate_prompt_tokens(messages, model), overhead)
+    
+    def _stream_text(self, model, messages, max_tokens, temperature, expected_words=None, kind="story", outcome=None):
+        """
+        Start a streamed completion. Once it is exhausted, `outcome` (if given)
+        holds its "finish_reason".
+        
+        Returns:
+        - Iterator of text deltas
+        """
+        start_time = time.time()
+        return _timed_text(
+            self._create(model, messages, max_tokens, temperature, stream=True, kind=kind), model, start_time,
+            on_done=self._observer(model, messages, expected_words, outcome)
+        )
+    
+    def _hedge_delay(self, model):
+        """
+        How long to wait for the first token before hedging: the configured
+        percentile of the model's observed time-to-first-token, or a default
+        until enough samples have been seen.
+        """
+        histogram = get_histogram(model, "ttft")
+        if histogram.count >= APP_CONFIG["hedge_min_samples"]:
+            return histogram.percentile(APP_CONFIG["hedge_percentile"])
+        return APP_CONFIG["hedge_default_delay"]
+    
+    def _fallback_model(self, model):
+        """First configured model other than `model`, or None."""
+        for candidate in [APP_CONFIG["default_model"]] + APP_CONFIG["alternative_models"]:
+            if candidate != model:
+                return candidate
+        return None
     
-    def generate_story(self, title, genre, characters, setting, theme=None, word_count=None, temperature=None, model=None):
+    def _hedged_stream_text(self, model, messages, max_tokens, temperature, expected_words=None, kind="story", outcome=None):
+        """
+        Start a streamed completion, hedging against a slow model.
+        
+        If hedging is enabled and the model has not produced a first token within
+        its hedge delay (or fails), the same request is sent to a fallback model.
+        Whichever stream yields a first token first wins and the other is closed.
+        
+        Returns:
+        - Tuple of (model that won, iterator of text deltas)
+        """
+        fallback = self._fallback_model(model)
+        if not APP_CONFIG["hedging_enabled"] or fallback is None:
+            return model, self._stream_text(model, messages, max_tokens, temperature, expected_words, kind, outcome)
+        
+        def open_stream(candidate, holder):
+            holder["start"] = time.time()
+            stream = self._create(candidate, messages, max_tokens, temperature, stream=True, kind=kind)
+            holder["stream"] = stream
+            text = _timed_text(
+                stream, candidate, holder["start"], record_ttft=False,
+                on_done=self._observer(candidate, messages, expected_words, outcome)
+            )
+            first = next(text, None)
+            holder["first"] = True
+            if not holder.get("cancelled"):
+                record_latency(candidate, "ttft", time.time() - holder["start"])
+            return candidate, first, text
+        
+        holders = {model: {}, fallback: {}}
+        futures = [_hedge_executor.submit(open_stream, model, holders[model])]
+        done, _ = wait(futures, timeout=self._hedge_delay(model))
+        if not done or futures[0].exception() is not None:
+            futures.append(_hedge_executor.submit(open_stream, fallback, holders[fallback]))
+        
+        winner = None
+        pending = set(futures)
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in futures if f in done and f.exception() is None), None)
+        if winner is None:
+            raise futures[0].exception()
+        
+        # Cancel the slower request: close its stream now, or as soon as it opens
+        for future, candidate in zip(futures, (model, fallback)):
+            if future is winner:
+                continue
+            holder = holders[candidate]
+            holder["cancelled"] = True
+            if not future.cancel():
+                if "first" not in holder and "start" in holder:
+                    # Censored sample: it was at least this slow
+                    record_latency(candidate, "ttft", time.time() - holder["start"])
+                if "stream" in holder:
+                    _close_quietly(holder["stream"])
+                future.add_done_callback(lambda f, holder=holder: "stream" in holder and _close_quietly(holder["stream"]))
+        
+        candidate, first, text = winner.result()
+        return candidate, itertools.chain([first] if first else [], text)
+    
+    def _cache_lookup(self, use_cache, kind, messages, **params):
+        """
+        Look up a cached completion for a request.
+        
+        The key is built from the prompt and the requested length (`words`),
+        never from max_tokens: that budget moves with every calibration, and
+        identical requests must keep hitting the same entry.
+        
+        Returns:
+        - Tuple of (cache, key, cached text or None); cache is None when bypassed
+        """
+        cache = get_response_cache() if use_cache else None
+        if cache is None:
+            return None, None, None
+        key = ResponseCache.make_key(kind, messages, **params)
+        return cache, key, cache.get(key)
+    
+    def _complete(self, kind, messages, model, temperature, max_tokens, use_cache=True, expected_words=None):
+        """
+        Run a blocking chat completion, going through the response cache.
+        
+        Returns:
+        - Completion text
+        """
+        cache, cache_key, text = self._cache_lookup(
+            use_cache, kind, messages, model=model, temperature=temperature, words=expected_words
+        )
+        if text is not None:
+            return text
+        
+        response = self._create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            expected_words=expected_words,
+            kind=kind
+        )
+        text = response.choices[0].message.content
+        # A truncated answer must not be served to later identical requests
+        if cache is not None and _finished(response):
+            cache.set(cache_key, text)
+        return text
+    
+    @staticmethod
+    def _build_story_messages(title, genre, characters, setting, theme, word_count):
+        """
+        Build the chat messages for a story generation request.
+        """
+        # Generate title if not provided, unless a separate request does
+        title_prompt = ""
+        if separate_title(title):
+            title_prompt = "Do not write a title; begin directly with the story."
+        elif not title:
+            title_prompt = "Generate a creative and captivating title for this story."
+        
+        # Prepare the prompt
+        prompt = f"""
+        {f"Write a {genre.lower()} story with the following parameters:" if genre else "Write a story with the following parameters:"}
+        
+        {f"Title: {title}" if title else title_prompt}
+        Characters: {characters}
+        Setting: {setting}
+        {f"Theme: {theme}" if theme else ""}
+        
+        The story should be approximately {word_count} words long.
+        Include dialogue, descriptive language, and a satisfying plot arc.
+        Format the story with proper paragraphs and a clear beginning, middle, and end.
+        """
+        
+        return [
+            {"role": "system", "content": STORY_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    @staticmethod
+    def _build_title_messages(genre, characters, setting, theme):
+        """
+        Build the chat messages for a title request, from the story parameters alone.
+        """
+        prompt = f"""
+        Suggest a title for a {genre.lower() + " " if genre else ""}story.
+        
+        Characters: {characters}
+        Setting: {setting}
+        {f"Theme: {theme}" if theme else ""}
+        
+        Answer with the title only: at most eight words, no quotes and no explanation.
+        """
+        
+        return [
+            {"role": "system", "content": TITLE_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _build_expansion_messages(self, original_story, expansion_request):
+        """
+        Build the chat messages for a story expansion request.
+        """
+        prompt = f"""
+        Here is an existing story:
+        
+        {original_story}
+        
+        Please {expansion_request}. Maintain the same style, tone, and characters.
+        Return the full updated story with your changes incorporated seamlessly.
+        """
+        
+        return [
+            {"role": "system", "content": EXPANSION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _build_revision_messages(self, outline, sections, selected, revision_request):
+        """
+        Build the chat messages for a paragraph-level revision request.
+        """
+        paragraphs = "\n\n".join(f"[P{index + 1}]\n{sections[index]}" for index in selected)
+        prompt = f"""
+        Here is an outline of a story, one line per paragraph:
+        
+        {outline}
+        
+        These are the paragraphs to revise, in full:
+        
+        {paragraphs}
+        
+        Please {revision_request}. Maintain the same style, tone, and characters.
+        Return only the revised paragraphs. Start each one with its marker (for example [P{selected[0] + 1}]) on its own line.
+        A revised paragraph may be split into several paragraphs under the same marker.
+        Do not return paragraphs you did not change and do not add any commentary.
+        """
+        
+        return [
+            {"role": "system", "content": REVISION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _finalize_story(self, story_text, title, genre, characters, setting, theme, word_count,
+                        temperature, model, completion_time, time_to_first_token=None, cached=False,
+                        title_future=None):
+        """
+        Turn raw model output into the story result dictionary.
+        
+        A story without a title gets the one from `title_future` (the
+        parallel title request), or else the one scraped from its first line.
+        """
+        if not title:
+            title, story_text = self._resolve_title(story_text, title_future)
+        
+        # Prepare result with metadata
+        return {
+            "title": title,
+            "content": story_text.strip(),
+            "metadata": {
+                "genre": genre,
+                "characters": characters,
+                "setting": setting,
+                "theme": theme,
+                "model": model,
+                "temperature": temperature,
+                "word_count": word_count,
+                "generation_time": round(completion_time, 2),
+                "time_to_first_token": round(time_to_first_token, 2) if time_to_first_token is not None else None,
+                "timestamp": datetime.now().isoformat(),
+                "cached": cached
+            }
+        }
+    
+    def _resolve_title(self, story_text, title_future):
+        """
+        Title of a story that was requested without one.
+        
+        Returns:
+        - Tuple of (title, story text without its title line)
+        """
+        if title_future is None:
+            # The story was asked to start with its title
+            match = _TITLE_LINE.match(story_text)
+            return match.group(1).strip() or "Untitled Story", story_text[match.end():]
+        
+        try:
+            title = title_future.result(timeout=APP_CONFIG["title_wait"])
+        except Exception:
+            title = None
+        # Drop a heading the model wrote anyway, and fall back to it if the title request failed.
+        # Only a short line labelled "Title:" or repeating the title counts, so a bold
+        # or markdown opening line of the story itself is kept
+        first = _FIRST_LINE.match(story_text)
+        line = first.group(1).strip()
+        heading = clean_title(line) if len(line) <= _MAX_HEADING_CHARS else None
+        if heading and (_TITLE_LABEL.match(line) or (title and heading.casefold() == title.casefold())):
+            return title or heading, story_text[first.end():]
+        return title or "Untitled Story", story_text
+    
+    def generate_title(self, genre, characters, setting, theme=None, temperature=None, use_cache=True):
+        """
+        Generate a story title with the small, fast title model.
+        
+        Only the story parameters go into the request, so it can run at the
+        same time as the story itself and finish well before it.
+        
+        Returns:
+        - Title, or None if the model's answer held none
+        """
+        messages = self._build_title_messages(genre, characters, setting, theme)
+        return clean_title(self._complete(
+            "title", messages, APP_CONFIG["title_model"], temperature or APP_CONFIG["default_temperature"],
+            APP_CONFIG["title_max_tokens"], use_cache
+        ))
+    
+    def _start_title(self, title, genre, characters, setting, theme, temperature, use_cache):
+        """
+        Start the parallel title request for a story that needs one.
+        
+        Returns:
+        - Future of the title, or None if the title is given or written by the story request
+        """
+        if not separate_title(title):
+            return None
+        return _title_executor.submit(self.generate_title, genre, characters, setting, theme, temperature, use_cache)
+    
+    def generate_story(self, title, genre, characters, setting, theme=None, word_count=None, temperature=None, model=None, use_cache=True):
         """
         Generate a story using the Groq API.
         
@@ -30,6 +602,7 @@ class StoryGenerator:
         - word_count: Approximate number of words for the story
         - temperature: Creativity parameter (0.0 to 1.0)
         - model: Groq model to use
+        - use_cache: Serve identical requests from the response cache (False for a fresh sample)
         
         Returns:
         - Dictionary containing the story text and metadata
@@ -40,79 +613,171 @@ class StoryGenerator:
             temperature = temperature or APP_CONFIG["default_temperature"]
             model = model or get_model()
             
-            # Generate title if not provided
-            title_prompt = ""
-            if not title:
-                title_prompt = "Generate a creative and captivating title for this story."
+            messages = self._build_story_messages(title, genre, characters, setting, theme, word_count)
+            max_tokens = self._max_tokens(messages, model, word_count)
             
             # Track start time for performance monitoring
             start_time = time.time()
             
-            # Prepare the prompt
-            prompt = f"""
-            {"Write a {genre.lower()} story with the following parameters:" if genre else "Write a story with the following parameters:"}
+            # The title is written concurrently by the title model
+            title_future = self._start_title(title, genre, characters, setting, theme, temperature, use_cache)
             
-            {f"Title: {title}" if title else title_prompt}
-            Characters: {characters}
-            Setting: {setting}
-            {f"Theme: {theme}" if theme else ""}
-            
-            The story should be approximately {word_count} words long.
-            Include dialogue, descriptive language, and a satisfying plot arc.
-            Format the story with proper paragraphs and a clear beginning, middle, and end.
-            """
+            # Serve identical requests from the cache
+            cache, cache_key, story_text = self._cache_lookup(
+                use_cache, "story", messages, model=model, temperature=temperature, words=word_count
+            )
+            if story_text is not None:
+                return self._finalize_story(
+                    story_text, title, genre, characters, setting, theme,
+                    word_count, temperature, model, time.time() - start_time, cached=True,
+                    title_future=title_future
+                )
             
             # Generate story using Groq API
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a creative storyteller. Your task is to write engaging, original stories based on user parameters. Make your stories vivid, emotionally resonant, and memorable."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=min(word_count * 2, 4096),  # Adjust as needed, with a reasonable maximum
-                temperature=temperature
-            )
+            if APP_CONFIG["hedging_enabled"]:
+                # Hedged requests race streams; the metadata records the model that won
+                outcome = {}
+                model, chunks = self._hedged_stream_text(model, messages, max_tokens, temperature, word_count, outcome=outcome)
+                story_text = "".join(chunks)
+                finished = outcome.get("finish_reason") == "stop"
+            else:
+                response = self._create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    expected_words=word_count
+                )
+                story_text = response.choices[0].message.content
+                finished = _finished(response)
             
             # Calculate completion time
             completion_time = time.time() - start_time
-            story_text = response.choices[0].message.content
+            if cache is not None and finished:
+                cache.set(cache_key, story_text)
             
-            # Extract title if it was auto-generated
-            if not title:
-                # Try to find the title at the beginning of the text
-                title_match = re.search(r'^(?:Title:\s*|\s*#\s*|\s*)(.*?)(?:\n|$)', story_text, re.IGNORECASE)
-                if title_match:
-                    title = title_match.group(1).strip()
-                else:
-                    title = "Untitled Story"
+            return self._finalize_story(
+                story_text, title, genre, characters, setting, theme,
+                word_count, temperature, model, completion_time, title_future=title_future
+            )
                 
-                # Remove the title line from the story text
-                story_text = re.sub(r'^(?:Title:\s*|\s*#\s*|\s*)(.*?)(?:\n|$)', '', story_text, flags=re.IGNORECASE)
-            
-            # Prepare result with metadata
-            result = {
-                "title": title,
-                "content": story_text.strip(),
-                "metadata": {
-                    "genre": genre,
-                    "characters": characters,
-                    "setting": setting,
-                    "theme": theme,
-                    "model": model,
-                    "temperature": temperature,
-                    "word_count": word_count,
-                    "generation_time": round(completion_time, 2),
-                    "timestamp": datetime.now().isoformat()
-                }
-            }
+        except Exception as e:
+            raise Exception(f"Story generation failed: {str(e)}")
+            
+    def stream_story(self, title, genre, characters, setting, theme=None, word_count=None, temperature=None, model=None, use_cache=True):
+        """
+        Generate a story using the Groq API in streaming mode.
+            
+        Takes the same parameters as generate_story.
+        
+        Returns:
+        - StoryStream yielding text chunks as they arrive; after iteration its
+          `result` attribute holds the same dictionary generate_story returns,
+          with `time_to_first_token` recorded in the metadata
+        """
+        try:
+            # Set defaults from config if not provided
+            word_count = word_count or APP_CONFIG["default_word_count"]
+            temperature = temperature or APP_CONFIG["default_temperature"]
+            model = model or get_model()
+            
+            messages = self._build_story_messages(title, genre, characters, setting, theme, word_count)
+            max_tokens = self._max_tokens(messages, model, word_count)
+            
+            # Track start time for performance monitoring
+            start_time = time.time()
+            
+            # The title is written concurrently by the title model
+            title_future = self._start_title(title, genre, characters, setting, theme, temperature, use_cache)
+            
+            cache, cache_key, cached_text = self._cache_lookup(
+                use_cache, "story", messages, model=model, temperature=temperature, words=word_count
+            )
+            
+            outcome = {}
+            if cached_text is not None:
+                chunks = iter([cached_text])
+            else:
+                model, chunks = self._hedged_stream_text(model, messages, max_tokens, temperature, word_count, outcome=outcome)
+            
+            def finalize(story_text, completion_time, time_to_first_token):
+                # Only complete stories are cached, never one cut off by max_tokens
+                if cache is not None and cached_text is None and outcome.get("finish_reason") == "stop":
+                    cache.set(cache_key, story_text)
+                return self._finalize_story(
+                    story_text, title, genre, characters, setting, theme,
+                    word_count, temperature, model, completion_time, time_to_first_token,
+                    cached=cached_text is not None, title_future=title_future
+                )
+            
+            return StoryStream(chunks, finalize, start_time, title_future)
+        
+        except Exception as e:
+            raise Exception(f"Story generation failed: {str(e)}")
+    
+    def generate_long_story(self, title, genre, characters, setting, theme=None, word_count=None, temperature=None, model=None, use_cache=True):
+        """
+        Generate a long story by outlining it first and then writing the chapters in parallel.
+        
+        Each chapter is generated in its own request with the outline and the
+        neighbouring chapters' summaries, so wall-clock time follows the slowest
+        chapter rather than the total length.
+        
+        Takes the same parameters as generate_story.
+        
+        Returns:
+        - Dictionary containing the story text and metadata, in the same form as generate_story
+        """
+        try:
+            # Set defaults from config if not provided
+            word_count = word_count or APP_CONFIG["default_word_count"]
+            temperature = temperature or APP_CONFIG["default_temperature"]
+            model = model or get_model()
+            chapters = longform.chapter_count(word_count, APP_CONFIG["long_form_chapter_words"])
             
+            # Track start time for performance monitoring
+            start_time = time.time()
+            
+            # Plan the story, allowing a few sentences per chapter summary
+            outline_messages = longform.build_outline_messages(title, genre, characters, setting, theme, word_count, chapters)
+            outline = longform.parse_outline(self._complete(
+                "outline", outline_messages, model, temperature,
+                self._max_tokens(outline_messages, model, chapters * 60 + 20, overhead=64), use_cache
+            ))
+            if title:
+                outline["title"] = title
+            outline["title"] = outline["title"] or "Untitled Story"
+            outline_time = time.time() - start_time
+            
+            # Write every chapter concurrently, sharing the requested length between them
+            chapter_words = math.ceil(word_count / len(outline["chapters"]))
+            
+            def write_chapter(index):
+                chapter_messages = longform.build_chapter_messages(
+                    STORY_SYSTEM_PROMPT, outline, index, genre, characters, setting, theme, chapter_words
+                )
+                return self._complete(
+                    "chapter", chapter_messages, model, temperature,
+                    self._max_tokens(chapter_messages, model, chapter_words), use_cache, chapter_words
+                )
+            
+            workers = min(len(outline["chapters"]), APP_CONFIG["long_form_max_workers"])
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                chapter_texts = list(executor.map(write_chapter, range(len(outline["chapters"]))))
+            
+            completion_time = time.time() - start_time
+            result = self._finalize_story(
+                longform.stitch_chapters(outline, chapter_texts), outline["title"], genre, characters,
+                setting, theme, word_count, temperature, model, completion_time
+            )
+            result["metadata"]["chapters"] = len(outline["chapters"])
+            result["metadata"]["outline_time"] = round(outline_time, 2)
             return result
         
         except Exception as e:
-            st.error(f"Story generation failed: {str(e)}")
             raise Exception(f"Story generation failed: {str(e)}")
     
-    def expand_story(self, original_story, expansion_request, model=None, temperature=None):
+    def expand_story(self, original_story, expansion_request, model=None, temperature=None, use_cache=True):
         """
         Expand or modify an existing story based on user request.
         
@@ -121,6 +786,7 @@ class StoryGenerator:
         - expansion_request: What the user wants to expand or modify
         - model: Groq model to use
         - temperature: Creativity parameter
+        - use_cache: Serve identical requests from the response cache (False for a fresh sample)
         
         Returns:
         - Updated story text
@@ -130,33 +796,305 @@ class StoryGenerator:
             temperature = temperature or APP_CONFIG["default_temperature"]
             model = model or get_model()
             
-            # Prepare the prompt
-            prompt = f"""
-            Here is an existing story:
-            
-            {original_story}
+            messages = self._build_expansion_messages(original_story, expansion_request)
+            expected_words = int(len(original_story.split()) * APP_CONFIG["expansion_growth"])
+            max_tokens = self._max_tokens(messages, model, expected_words)
             
-            Please {expansion_request}. Maintain the same style, tone, and characters.
-            Return the full updated story with your changes incorporated seamlessly.
-            """
+            cache, cache_key, story_text = self._cache_lookup(
+                use_cache, "expansion", messages, model=model, temperature=temperature, words=expected_words
+            )
+            if story_text is not None:
+                return story_text
             
             # Generate expansion using Groq API
-            response = self.client.chat.completions.create(
+            response = self._create(
                 model=model,
-                messages=[
-                    {"role": "system", "content": "You are a creative storyteller. Your task is to expand or modify existing stories based on user requests while maintaining narrative consistency."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=min(len(original_story.split()) * 2, 4096),  # Twice the original length, with a maximum
-                temperature=temperature
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                expected_words=expected_words,
+                kind="expansion"
             )
             
-            return response.choices[0].message.content
+            story_text = response.choices[0].message.content
+            if cache is not None and _finished(response):
+                cache.set(cache_key, story_text)
+            return story_text
         
         except Exception as e:
-            st.error(f"Story expansion failed: {str(e)}")
             raise Exception(f"Story expansion failed: {str(e)}")
+    
+    def revise_story(self, original_story, revision_request, model=None, temperature=None, use_cache=True):
+        """
+        Revise a story by sending only the paragraphs the request refers to.
+        
+        The relevant paragraphs are sent in full together with a one-line-per-paragraph
+        outline of the rest; the model answers with replacements that are patched
+        back into the story. Requests that concern the whole story, or that cannot
+        be matched to specific paragraphs, fall back to expand_story.
+        
+        Parameters:
+        - original_story: Original story text
+        - revision_request: What the user wants to change
+        - model: Groq model to use
+        - temperature: Creativity parameter
+        - use_cache: Serve identical requests from the response cache (False for a fresh sample)
+        
+        Returns:
+        - Updated story text
+        """
+        sections = story_sections.split_sections(original_story)
+        selected = []
+        if not story_sections.is_global_request(revision_request):
+            selected = story_sections.select_sections(
+                sections, revision_request, APP_CONFIG["revision_max_sections"]
+            )
+        
+        # Small stories and story-wide requests are cheaper as a single full rewrite
+        if not selected or len(selected) * 2 > len(sections):
+            return self.expand_story(original_story, revision_request, model=model, temperature=temperature, use_cache=use_cache)
+        
+        try:
+            # Set defaults from config if not provided
+            temperature = temperature or APP_CONFIG["default_temperature"]
+            model = model or get_model()
+            
+            outline = story_sections.build_context_summary(sections, selected)
+            messages = self._build_revision_messages(outline, sections, selected, revision_request)
+            selected_words = sum(len(sections[index].split()) for index in selected)
+            expected_words = int(selected_words * APP_CONFIG["expansion_growth"])
+            max_tokens = self._max_tokens(messages, model, expected_words, overhead=32 + 8 * len(selected))
+            
+            cache, cache_key, response_text = self._cache_lookup(
+                use_cache, "revision", messages, model=model, temperature=temperature, words=expected_words
+            )
+            finished = False
+            if response_text is None:
+                response = self._create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    expected_words=expected_words,
+                    kind="revision"
+                )
+                response_text = response.choices[0].message.content
+                finished = _finished(response)
+            
+            replacements = story_sections.parse_replacements(response_text, set(selected))
+        
+        except Exception as e:
+            raise Exception(f"Story revision failed: {str(e)}")
+        
+        # The model ignored the format, so do a full rewrite instead
+        if not replacements:
+            return self.expand_story(original_story, revision_request, model=model, temperature=temperature, use_cache=use_cache)
+        
+        if cache is not None and finished:
+            cache.set(cache_key, response_text)
+        return story_sections.apply_replacements(sections, replacements)
+    
+    def stream_expansion(self, original_story, expansion_request, model=None, temperature=None, use_cache=True):
+        """
+        Expand or modify an existing story in streaming mode.
+        
+        Takes the same parameters as expand_story.
+        
+        Returns:
+        - StoryStream yielding text chunks; after iteration its `result`
+          attribute holds the updated story text
+        """
+        try:
+            # Set defaults from config if not provided
+            temperature = temperature or APP_CONFIG["default_temperature"]
+            model = model or get_model()
+            
+            messages = self._build_expansion_messages(original_story, expansion_request)
+            expected_words = int(len(original_story.split()) * APP_CONFIG["expansion_growth"])
+            max_tokens = self._max_tokens(messages, model, expected_words)
+            
+            start_time = time.time()
+            
+            cache, cache_key, cached_text = self._cache_lookup(
+                use_cache, "expansion", messages, model=model, temperature=temperature, words=expected_words
+            )
+            
+            outcome = {}
+            if cached_text is not None:
+                chunks = iter([cached_text])
+            else:
+                chunks = self._stream_text(model, messages, max_tokens, temperature, expected_words, "expansion", outcome)
+            
+            def finalize(story_text, completion_time, time_to_first_token):
+                if cache is not None and cached_text is None and outcome.get("finish_reason") == "stop":
+                    cache.set(cache_key, story_text)
+                return story_text
+            
+            return StoryStream(chunks, finalize, start_time)
+        
+        except Exception as e:
+            raise Exception(f"Story expansion failed: {str(e)}")
+
+
+class AsyncStoryGenerator(StoryGenerator):
+    """
+    Story generator built on the async Groq client, for headless bulk runs.
+    Shares prompt building and result finalization with StoryGenerator.
+    """
+    
+    def __init__(self, api_key, max_connections=None, session_id="batch"):
+        """
+        Initialize the async story generator with an API key.
+        The client is bound to the running event loop; close it with aclose().
+        
+        Parameters:
+        - api_key: Groq API key
+        - max_connections: HTTP connection pool size (defaults to APP_CONFIG)
+        - session_id: Identifier used for fair request scheduling
+        """
+        self.api_key = api_key
+        self.session_id = session_id
+        self.client = new_async_client(api_key, max_connections)
+    
+    async def _acreate(self, model, messages, max_tokens, temperature, kind="story"):
+        """
+        Send a chat completion request through the process-wide rate-limit scheduler.
+        """
+        call = telemetry.start_call(kind, model, self.session_id)
+        try:
+            response, _ = await get_scheduler().call_async(
+                lambda: self.client.chat.completions.with_raw_response.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                ),
+                model,
+                estimate_request_tokens(messages, max_tokens, model),
+                self.session_id,
+                info=call
+            )
+        except Exception as e:
+            telemetry.finish_call(call, error=e)
+            raise
+        telemetry.finish_call(call, response.usage)
+        return response
+    
+    async def _agenerate_title(self, genre, characters, setting, theme, temperature, use_cache):
+        """
+        Async counterpart of generate_title.
+        
+        Returns:
+        - Title, or None if the request failed or the answer held none
+        """
+        try:
+            messages = self._build_title_messages(genre, characters, setting, theme)
+            model, max_tokens = APP_CONFIG["title_model"], APP_CONFIG["title_max_tokens"]
+            cache, cache_key, text = self._cache_lookup(
+                use_cache, "title", messages, model=model, temperature=temperature, words=None
+            )
+            if text is None:
+                response = await self._acreate(model, messages, max_tokens, temperature, kind="title")
+                text = response.choices[0].message.content
+                if cache is not None and _finished(response):
+                    cache.set(cache_key, text)
+            return clean_title(text)
+        except Exception:
+            return None
+    
+    async def aclose(self):
+        """Close the underlying HTTP connection pool."""
+        await self.client.close()
+    
+    async def generate_story(self, title, genre, characters, setting, theme=None, word_count=None, temperature=None, model=None, use_cache=True):
+        """
+        Generate a story using the async Groq API.
+        
+        Takes the same parameters as StoryGenerator.generate_story. Token usage
+        reported by the API is added to the metadata as prompt_tokens and
+        completion_tokens.
+        
+        Returns:
+        - Dictionary containing the story text and metadata
+        """
+        try:
+            # Set defaults from config if not provided
+            word_count = word_count or APP_CONFIG["default_word_count"]
+            temperature = temperature or APP_CONFIG["default_temperature"]
+            model = model or APP_CONFIG["default_model"]
+            
+            messages = self._build_story_messages(title, genre, characters, setting, theme, word_count)
+            max_tokens = self._max_tokens(messages, model, word_count)
+            
+            start_time = time.time()
+            
+            # The title is written concurrently by the title model
+            title_task = None
+            if separate_title(title):
+                title_task = asyncio.ensure_future(
+                    self._agenerate_title(genre, characters, setting, theme, temperature, use_cache)
+                )
+            
+            cache, cache_key, story_text = self._cache_lookup(
+                use_cache, "story", messages, model=model, temperature=temperature, words=word_count
+            )
+            usage = None
+            if story_text is None:
+                try:
+                    response = await self._acreate(
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature
+                    )
+                except BaseException:
+                    # Without a story the title is not needed: stop its request too
+                    if title_task is not None:
+                        title_task.cancel()
+                        with contextlib.suppress(asyncio.CancelledError):
+                            await title_task
+                    raise
+                story_text = response.choices[0].message.content
+                usage = response.usage
+                get_token_budget().observe(
+                    model, messages, usage, story_text, word_count,
+                    getattr(response.choices[0], "finish_reason", None) == "length"
+                )
+                if cache is not None and _finished(response):
+                    cache.set(cache_key, story_text)
+            
+            title_future = None
+            if title_task is not None:
+                title_future = Future()
+                try:
+                    title_future.set_result(await asyncio.wait_for(title_task, APP_CONFIG["title_wait"]))
+                except asyncio.TimeoutError:
+                    title_future.set_result(None)
+            
+            result = self._finalize_story(
+                story_text, title, genre, characters, setting, theme,
+                word_count, temperature, model, time.time() - start_time, cached=usage is None,
+                title_future=title_future
+            )
+            result["metadata"]["prompt_tokens"] = usage.prompt_tokens if usage else 0
+            result["metadata"]["completion_tokens"] = usage.completion_tokens if usage else 0
+            return result
+        
+        except Exception as e:
+            raise Exception(f"Story generation failed: {str(e)}")
+
 
+def estimate_story_request(title, genre, characters, setting, theme=None, word_count=None, model=None):
+    """
+    Estimate the token cost of a story request before it is sent.
+    
+    Returns:
+    - Dictionary with prompt_tokens, completion_tokens (expected), max_tokens and total_tokens
+    """
+    word_count = word_count or APP_CONFIG["default_word_count"]
+    model = model or APP_CONFIG["default_model"]
+    messages = StoryGenerator._build_story_messages(title, genre, characters, setting, theme, word_count)
+    return get_token_budget().estimate_request(messages, model, word_count)
 
 def generate_story(api_key, title, genre, characters, setting, word_count=None):
     """
@@ -182,4 +1120,4 @@ def generate_story(api_key, title, genre, characters, setting, word_count=None):
         setting=setting,
         word_count=word_count or APP_CONFIG["default_word_count"]
     )
-    return result["content"]
\ No newline at end of file
+    return result["content"]
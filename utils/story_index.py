@@ -0,0 +1,619 @@
+# utils/story_index.py
+import contextlib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from utils import minhash
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    file_path TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    timestamp TEXT NOT NULL DEFAULT '',
+    genre TEXT,
+    saved_at TEXT,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stories_by_timestamp ON stories (timestamp DESC);
+CREATE INDEX IF NOT EXISTS stories_by_title ON stories (title COLLATE NOCASE);
+"""
+
+# Full-text index with BM25 ranking. Postings are FTS5's delta/varint-encoded
+# segments; prefix queries walk the sorted term dictionary, which measured as
+# fast as dedicated prefix indexes at a fraction of the size
+_SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE stories_fts USING fts5(
+    file_path UNINDEXED, title, content, genre, characters, setting,
+    tokenize='unicode61 remove_diacritics 2'
+);
+INSERT INTO stories_fts (stories_fts, rank) VALUES ('rank', 'bm25(0.0, 10.0, 1.0, 2.0, 2.0, 2.0)');
+"""
+
+# MinHash signature of every story's content, and its LSH buckets (one row per band)
+# so near-duplicates of a story are found with one indexed lookup per band.
+# Stories are keyed by the same path digest as their full-text row
+_DUPLICATE_SCHEMA = """
+CREATE TABLE story_minhash (
+    id INTEGER PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    signature BLOB NOT NULL
+);
+CREATE TABLE story_lsh (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    story INTEGER NOT NULL,
+    PRIMARY KEY (band, bucket, story)
+) WITHOUT ROWID;
+CREATE INDEX story_lsh_by_story ON story_lsh (story);
+"""
+
+# Candidate stories compared per near-duplicate asked for
+_CANDIDATES_PER_RESULT = 4
+
+# Stories whose signatures are computed together during a reconcile
+_SIGNATURE_BATCH = 1000
+
+# Changed stories in one reconcile after which the full-text index is merged
+_OPTIMIZE_THRESHOLD = 1000
+
+_QUERY_TERMS = re.compile(r"\w+\*?")
+
+# Sort orders for listing stories, each backed by an index
+SORT_ORDERS = {
+    "newest": "timestamp DESC, file_path",
+    "oldest": "timestamp ASC, file_path",
+    "title": "title COLLATE NOCASE ASC, file_path"
+}
+
+class StoryIndex:
+    """
+    Persistent metadata index for the saved stories directory.
+    
+    Holds one row per story file (title, timestamp, genre, path, size, mtime)
+    so the library can be listed with a single query instead of parsing
+    every JSON file.
+    
+    By default one connection is shared and every operation holds a lock.
+    In WAL mode each concurrent operation checks out its own pooled
+    connection instead: reads never wait for writes, and writes queue
+    inside SQLite (for up to `busy_timeout` seconds) rather than in Python.
+    """
+    
+    def __init__(self, db_path, wal=False, busy_timeout=30.0):
+        """
+        Parameters:
+        - db_path: Path to the SQLite database file
+        - wal: Use SQLite's write-ahead log and a connection per concurrent operation
+        - busy_timeout: Seconds a write waits for another connection's write to finish
+        """
+        self.db_path = Path(db_path)
+        self.wal = wal
+        self.busy_timeout = busy_timeout
+        self._lock = threading.Lock()
+        # Idle connections; in shared mode, the one connection
+        self._idle = []
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+            self.search_enabled = self._create_search_index(conn)
+            self._create_duplicate_index(conn)
+            conn.commit()
+    
+    def _open_connection(self):
+        if not self.wal:
+            return sqlite3.connect(str(self.db_path), check_same_thread=False)
+        
+        # Writes take the database write lock when their transaction begins,
+        # so a transaction never fails halfway by upgrading from read to write
+        conn = sqlite3.connect(
+            str(self.db_path), timeout=self.busy_timeout, check_same_thread=False, isolation_level="IMMEDIATE"
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+    
+    @contextlib.contextmanager
+    def _connection(self):
+        """Connection for one operation: the shared one under the lock, or a pooled one in WAL mode."""
+        if not self.wal:
+            with self._lock:
+                if not self._idle:
+                    self._idle.append(self._open_connection())
+                conn = self._idle[0]
+                try:
+                    yield conn
+                except BaseException:
+                    # Don't leave partial writes for the next caller's commit
+                    conn.rollback()
+                    raise
+            return
+        
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open_connection()
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            with self._lock:
+                self._idle.append(conn)
+    
+    def _create_search_index(self, conn):
+        """
+        Create the full-text index if it is missing.
+        
+        Returns:
+        - False if this SQLite build has no FTS5, True otherwise
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'stories_fts'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            conn.executescript(_SEARCH_SCHEMA)
+        except sqlite3.OperationalError:
+            return False
+        # Stories indexed before search existed are re-read by the next reconcile
+        conn.execute("UPDATE stories SET mtime = -1")
+        return True
+    
+    def _create_duplicate_index(self, conn):
+        """Create the near-duplicate tables if they are missing."""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'story_minhash'"
+        ).fetchone()
+        if exists:
+            return
+        conn.executescript(_DUPLICATE_SCHEMA)
+        # Stories indexed before signatures existed are re-read by the next reconcile
+        conn.execute("UPDATE stories SET mtime = -1")
+    
+    def upsert(self, file_path, story_data, size=None, mtime=None, signature=None):
+        """
+        Add or refresh the row for one story file.
+        
+        Parameters:
+        - file_path: Path to the story JSON file (or a segment store locator)
+        - story_data: Parsed story dictionary
+        - size, mtime: Version stamp of the story; read from the file when omitted
+        - signature: MinHash signature of the content, if already computed
+        
+        Returns:
+        - The story record as listed by list_stories
+        """
+        if size is None or mtime is None:
+            stat = Path(file_path).stat()
+            size, mtime = stat.st_size, stat.st_mtime
+        with self._connection() as conn:
+            row = self._upsert_row(conn, str(file_path), story_data, size, mtime)
+            self._upsert_signatures(
+                conn, [(str(file_path), story_data.get("content", ""))], None if signature is None else [signature]
+            )
+            conn.commit()
+        return _row_to_record(row)
+    
+    def remove(self, file_path):
+        """Drop the row for a story file."""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM stories WHERE file_path = ?", (str(file_path),))
+            if self.search_enabled:
+                conn.execute("DELETE FROM stories_fts WHERE rowid = ?", (_search_id(file_path),))
+            _remove_signatures(conn, [file_path])
+            conn.commit()
+    
+    def reconcile(self, storage_path):
+        """
+        Bring the index in line with the files on disk.
+        
+        Only files that are new or whose size/mtime changed are parsed;
+        rows for deleted files are dropped.
+        
+        Parameters:
+        - storage_path: Directory holding the story JSON files
+        
+        Returns:
+        - List of (file_path, error message) for files that could not be read
+        """
+        errors = []
+        changed = 0
+        with self._connection() as conn:
+            known = {
+                row[0]: (row[1], row[2])
+                for row in conn.execute("SELECT file_path, size, mtime FROM stories")
+            }
+            seen = set()
+            # Signatures are computed together once every file has been read
+            contents = []
+            
+            with os.scandir(storage_path) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".json") or not entry.is_file():
+                        continue
+                    file_path = str(Path(storage_path) / entry.name)
+                    seen.add(file_path)
+                    stat = entry.stat()
+                    if known.get(file_path) == (stat.st_size, stat.st_mtime):
+                        continue
+                    try:
+                        with open(file_path, "r", encoding="utf-8") as f:
+                            story_data = json.load(f)
+                        self._upsert_row(conn, file_path, story_data, stat.st_size, stat.st_mtime)
+                        contents.append((file_path, story_data.get("content", "")))
+                        if len(contents) >= _SIGNATURE_BATCH:
+                            self._upsert_signatures(conn, contents)
+                            contents = []
+                        changed += 1
+                    except Exception as e:
+                        errors.append((file_path, str(e)))
+            
+            self._upsert_signatures(conn, contents)
+            missing = [(file_path,) for file_path in known if file_path not in seen]
+            self._remove_rows(conn, missing, changed)
+            conn.commit()
+        return errors
+    
+    def reconcile_store(self, store, locator):
+        """
+        Bring the index in line with a segment store.
+        
+        Records are identified by locator; the record's length and sequence
+        number act as its version stamp, so only stories written since the
+        last reconcile are read.
+        
+        Parameters:
+        - store: SegmentStore holding the stories
+        - locator: Callable mapping a store key to the path stored in the index
+        
+        Returns:
+        - List of (locator, error message) for stories that could not be read
+        """
+        errors = []
+        changed = 0
+        with self._connection() as conn:
+            known = {
+                row[0]: (row[1], row[2])
+                for row in conn.execute("SELECT file_path, size, mtime FROM stories")
+            }
+            seen = set()
+            contents = []
+            for entry in store.entries():
+                file_path = locator(entry["key"])
+                seen.add(file_path)
+                if known.get(file_path) == (entry["length"], entry["seq"]):
+                    continue
+                try:
+                    story_data = store.get(entry["key"])
+                    self._upsert_row(conn, file_path, story_data, entry["length"], entry["seq"])
+                    contents.append((file_path, story_data.get("content", "")))
+                    if len(contents) >= _SIGNATURE_BATCH:
+                        self._upsert_signatures(conn, contents)
+                        contents = []
+                    changed += 1
+                except Exception as e:
+                    errors.append((file_path, str(e)))
+            
+            self._upsert_signatures(conn, contents)
+            missing = [(file_path,) for file_path in known if file_path not in seen]
+            self._remove_rows(conn, missing, changed)
+            conn.commit()
+        return errors
+    
+    def list_stories(self, order="newest", offset=0, limit=None):
+        """
+        List indexed stories, or one page of them.
+        
+        Parameters:
+        - order: Key of SORT_ORDERS ("newest", "oldest" or "title")
+        - offset: Number of stories to skip
+        - limit: Maximum number of stories to return (None for all)
+        
+        Returns:
+        - List of StoryRecord objects (no content)
+        """
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT file_path, title, timestamp, genre, saved_at, size, mtime "
+                f"FROM stories ORDER BY {SORT_ORDERS[order]} LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset)
+            ).fetchall()
+        return [_row_to_record(row) for row in rows]
+    
+    def search(self, query, limit=20):
+        """
+        Ranked full-text search over title, content, genre, characters and setting.
+        
+        Every word must match; the last word also matches as a prefix, so
+        partial input finds results while typing. A word ending in * is
+        always a prefix.
+        
+        Parameters:
+        - query: Search text
+        - limit: Maximum number of results
+        
+        Returns:
+        - List of story records, best match first, each with a "snippet" of matching content
+        """
+        match = build_match_query(query)
+        if not match or not self.search_enabled:
+            return []
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT s.file_path, s.title, s.timestamp, s.genre, s.saved_at, s.size, s.mtime, "
+                "snippet(stories_fts, 2, '**', '**', '…', 12) "
+                "FROM stories_fts JOIN stories s ON s.file_path = stories_fts.file_path "
+                "WHERE stories_fts MATCH ? ORDER BY rank LIMIT ?",
+                (match, limit)
+            ).fetchall()
+        records = []
+        for row in rows:
+            record = _row_to_record(row[:7])
+            record["snippet"] = row[7]
+            records.append(record)
+        return records
+    
+    def find_near_duplicates(self, signature, threshold, limit=5):
+        """
+        Find indexed stories whose content is nearly the same as a text.
+        
+        Only stories sharing an LSH bucket with the text are candidates, and
+        only the few sharing the most buckets are compared, so the cost does
+        not grow with the size of the library.
+        
+        Parameters:
+        - signature: MinHash signature of the text (minhash.signature())
+        - threshold: Minimum estimated Jaccard similarity of word shingles (0-1)
+        - limit: Maximum number of results
+        
+        Returns:
+        - List of story records, most similar first, each with its "similarity"
+        """
+        if signature is None:
+            return []
+        buckets = minhash.band_hashes(signature)
+        params = [value for band, bucket in enumerate(buckets.tolist()) for value in (band, bucket)]
+        with self._connection() as conn:
+            # Stories sharing the most bands are the likeliest matches; only those are compared
+            candidates = conn.execute(
+                "SELECT m.file_path, m.signature FROM ("
+                "SELECT story, COUNT(*) AS shared FROM story_lsh WHERE "
+                + " OR ".join(["(band = ? AND bucket = ?)"] * minhash.BANDS) +
+                " GROUP BY story ORDER BY shared DESC LIMIT ?"
+                ") JOIN story_minhash m ON m.id = story",
+                params + [limit * _CANDIDATES_PER_RESULT]
+            ).fetchall()
+            scores = minhash.similarities(signature, [data for _, data in candidates]).tolist()
+            scored = [
+                (similarity, file_path) for (file_path, _), similarity in zip(candidates, scores)
+                if similarity >= threshold
+            ]
+            scored.sort(key=lambda item: (-item[0], item[1]))
+            records = []
+            for similarity, file_path in scored[:limit]:
+                row = conn.execute(
+                    "SELECT file_path, title, timestamp, genre, saved_at, size, mtime "
+                    "FROM stories WHERE file_path = ?", (file_path,)
+                ).fetchone()
+                if row:
+                    record = _row_to_record(row)
+                    record["similarity"] = round(similarity, 3)
+                    records.append(record)
+        return records
+    
+    def near_duplicate_clusters(self, threshold):
+        """
+        Group the indexed stories into clusters of near-duplicates, from the
+        stored signatures and LSH buckets; no story is read.
+        
+        Parameters:
+        - threshold: Minimum estimated Jaccard similarity of word shingles (0-1)
+        
+        Returns:
+        - List of clusters with more than one member, each a list of story records
+        """
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT m.id, s.file_path, s.title, s.timestamp, s.genre, s.saved_at, s.size, s.mtime, m.signature "
+                "FROM story_minhash m JOIN stories s ON s.file_path = m.file_path"
+            ).fetchall()
+            # Stories sharing a bucket in any band
+            shared = conn.execute(
+                "SELECT DISTINCT a.story, b.story FROM story_lsh a JOIN story_lsh b "
+                "ON b.band = a.band AND b.bucket = a.bucket AND b.story > a.story"
+            ).fetchall()
+        position = {row[0]: i for i, row in enumerate(rows)}
+        pairs = {
+            (position[a], position[b]) for a, b in shared
+            if a in position and b in position
+        }
+        if not pairs:
+            return []
+        signature_rows = minhash.from_bytes([row[8] for row in rows])
+        return [
+            [_row_to_record(rows[i][1:8]) for i in members]
+            for members in minhash.cluster(signature_rows, threshold, pairs)
+        ]
+    
+    def count(self):
+        """Number of indexed stories."""
+        with self._connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM stories").fetchone()[0]
+    
+    def get(self, file_path):
+        """
+        Get the indexed record for one story file, or None if it is not indexed.
+        """
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT file_path, title, timestamp, genre, saved_at, size, mtime "
+                "FROM stories WHERE file_path = ?", (str(file_path),)
+            ).fetchone()
+        return _row_to_record(row) if row else None
+    
+    def close(self):
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle = []
+    
+    def _remove_rows(self, conn, missing, changed):
+        """Drop rows for stories that are gone, after a reconcile that changed `changed` rows."""
+        conn.executemany("DELETE FROM stories WHERE file_path = ?", missing)
+        _remove_signatures(conn, [file_path for (file_path,) in missing])
+        if self.search_enabled:
+            conn.executemany(
+                "DELETE FROM stories_fts WHERE rowid = ?",
+                [(_search_id(file_path),) for (file_path,) in missing]
+            )
+            # Merge the segments written by a bulk (re)index into compact postings
+            if changed + len(missing) >= _OPTIMIZE_THRESHOLD:
+                conn.execute("INSERT INTO stories_fts (stories_fts) VALUES ('optimize')")
+    
+    def _upsert_row(self, conn, file_path, story_data, size, mtime):
+        metadata = story_data.get("metadata") or {}
+        row = (
+            file_path,
+            story_data.get("title", "Untitled Story"),
+            story_data.get("timestamp", "") or "",
+            metadata.get("genre"),
+            metadata.get("saved_at"),
+            size,
+            mtime
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO stories (file_path, title, timestamp, genre, saved_at, size, mtime) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            row
+        )
+        if self.search_enabled:
+            search_id = _search_id(file_path)
+            conn.execute("DELETE FROM stories_fts WHERE rowid = ?", (search_id,))
+            conn.execute(
+                "INSERT INTO stories_fts (rowid, file_path, title, content, genre, characters, setting) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    search_id,
+                    file_path,
+                    row[1],
+                    story_data.get("content", ""),
+                    metadata.get("genre") or "",
+                    metadata.get("characters") or "",
+                    metadata.get("setting") or ""
+                )
+            )
+        return row
+
+    def _upsert_signatures(self, conn, contents, signature_rows=None):
+        """
+        Replace the MinHash signatures and LSH buckets of stories, given
+        (file_path, content) pairs and optionally their computed signatures.
+        """
+        if not contents:
+            return
+        _remove_signatures(conn, [file_path for file_path, _ in contents])
+        
+        if signature_rows is None:
+            signature_rows = minhash.signatures([content for _, content in contents])
+        buckets = minhash.band_hashes(signature_rows).tolist()
+        # Stories without words get no signature
+        keep = [i for i in range(len(contents)) if minhash.has_words(signature_rows[i])]
+        ids = [_search_id(file_path) for file_path, _ in contents]
+        conn.executemany(
+            "INSERT INTO story_minhash (id, file_path, signature) VALUES (?, ?, ?)",
+            [(ids[i], contents[i][0], minhash.to_bytes(signature_rows[i])) for i in keep]
+        )
+        conn.executemany(
+            "INSERT INTO story_lsh (band, bucket, story) VALUES (?, ?, ?)",
+            [(band, bucket, ids[i]) for i in keep for band, bucket in enumerate(buckets[i])]
+        )
+
+def _remove_signatures(conn, file_paths):
+    ids = [(_search_id(file_path),) for file_path in file_paths]
+    conn.executemany("DELETE FROM story_minhash WHERE id = ?", ids)
+    conn.executemany("DELETE FROM story_lsh WHERE story = ?", ids)
+
+def _search_id(file_path):
+    """Stable full-text and signature rowid for a story file (63-bit digest of its path)."""
+    return int.from_bytes(hashlib.sha1(str(file_path).encode("utf-8")).digest()[:8], "big") >> 1
+
+def build_match_query(text):
+    """
+    Turn free search text into an FTS5 MATCH expression.
+    
+    Returns:
+    - MATCH expression, or "" if the text has no searchable words
+    """
+    terms = _QUERY_TERMS.findall(text or "")
+    if not terms:
+        return ""
+    parts = []
+    for i, term in enumerate(terms):
+        prefix = term.endswith("*") or i == len(terms) - 1
+        parts.append('"' + term.rstrip("*") + '"' + ("*" if prefix else ""))
+    return " ".join(parts)
+
+class StoryRecord:
+    """
+    Listing entry of one saved story: what the index knows about it, never its content.
+    
+    Every session keeps a page of these in its state, so they are slotted
+    objects rather than dictionaries. Fields read as attributes or by key,
+    like the dictionaries they replace (record["title"], record.get("snippet")).
+    """
+    __slots__ = (
+        "file_path", "title", "timestamp", "genre", "saved_at", "size", "mtime",
+        "snippet", "similarity", "near_duplicates"
+    )
+    
+    def __init__(self, file_path, title, timestamp, genre=None, saved_at=None, size=None, mtime=None):
+        self.file_path = file_path
+        self.title = title
+        self.timestamp = timestamp
+        self.genre = genre
+        self.saved_at = saved_at
+        self.size = size
+        self.mtime = mtime
+        # Set by search, near-duplicate lookups and saves respectively
+        self.snippet = None
+        self.similarity = None
+        self.near_duplicates = None
+    
+    @property
+    def metadata(self):
+        """Indexed story metadata (genre, saved_at), in the shape of a story's "metadata"."""
+        metadata = {}
+        if self.genre is not None:
+            metadata["genre"] = self.genre
+        if self.saved_at is not None:
+            metadata["saved_at"] = self.saved_at
+        return metadata
+    
+    def __getitem__(self, key):
+        if key != "metadata" and key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+    
+    def get(self, key, default=None):
+        """Field value, or default when the field is unknown or unset."""
+        if key != "metadata" and key not in self.__slots__:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+    
+    def __repr__(self):
+        return f"StoryRecord({self.file_path!r}, {self.title!r})"
+
+def _row_to_record(row):
+    return StoryRecord(*row)
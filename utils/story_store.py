@@ -0,0 +1,373 @@
+# utils/story_store.py
+import json
+import mmap
+import os
+import struct
+import threading
+import uuid
+import zlib
+from pathlib import Path
+
+# Locator prefix for stories kept in the segment store (used where a file path would be)
+LOCATOR_PREFIX = "segment:"
+
+# Segment file header: magic and generation id (shared with the metadata file)
+_FILE_MAGIC = b"STSEG1\n"
+_GENERATION_BYTES = 16
+
+# Record header: flags, key length, payload length, crc32 of key + payload, sequence number
+_RECORD = struct.Struct("<BHIIQ")
+_FLAG_TOMBSTONE = 1
+
+def locator(key, namespace=""):
+    """
+    Locator string of a stored story, usable wherever a story file path is expected.
+    Stories of a user namespace carry it as "segment:<namespace>/<key>".
+    """
+    return LOCATOR_PREFIX + (f"{namespace}/" if namespace else "") + key
+
+def is_locator(value):
+    return str(value).startswith(LOCATOR_PREFIX)
+
+def locator_key(value):
+    return str(value)[len(LOCATOR_PREFIX):].rpartition("/")[2]
+
+def locator_namespace(value):
+    return str(value)[len(LOCATOR_PREFIX):].rpartition("/")[0]
+
+class SegmentStore:
+    """
+    Append-only story store with compressed content.
+    
+    Stories are appended to a single segment file as zlib-compressed JSON
+    records; saving a story again appends a new version and deleting one
+    appends a tombstone. A separate metadata file holds one JSON line per
+    record (offset, length, sequence number, title, timestamp, genre, saved_at), so listing
+    stories never touches content. Content is read through a memory map of
+    the segment. compact() rewrites the segment with live records only.
+    """
+    
+    def __init__(self, path, compress_level=6):
+        """
+        Parameters:
+        - path: Directory holding stories.seg and stories.meta
+        - compress_level: zlib compression level for content
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_path = self.path / "stories.seg"
+        self.meta_path = self.path / "stories.meta"
+        self.compress_level = compress_level
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._dead_bytes = 0
+        self._next_seq = 1
+        self._map = None
+        self._map_size = 0
+        self._open()
+    
+    def _open(self):
+        if not self.segment_path.exists():
+            self._write_headers(self.segment_path, self.meta_path, uuid.uuid4().bytes)
+        with open(self.segment_path, "rb") as f:
+            header = f.read(len(_FILE_MAGIC) + _GENERATION_BYTES)
+        if not header.startswith(_FILE_MAGIC):
+            raise ValueError(f"{self.segment_path} is not a story segment file")
+        self._generation = header[len(_FILE_MAGIC):]
+        
+        if not self._load_meta():
+            self._rebuild_meta()
+        self._segment = open(self.segment_path, "ab")
+        self._meta = open(self.meta_path, "a", encoding="utf-8")
+    
+    @staticmethod
+    def _write_headers(segment_path, meta_path, generation):
+        with open(segment_path, "wb") as f:
+            f.write(_FILE_MAGIC + generation)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(meta_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"generation": generation.hex()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _load_meta(self):
+        """
+        Load the metadata file.
+        
+        Returns:
+        - False if it is missing, from another generation, or ends past the segment (rebuild needed)
+        """
+        if not self.meta_path.exists():
+            return False
+        segment_size = self.segment_path.stat().st_size
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        try:
+            if json.loads(lines[0]).get("generation") != self._generation.hex():
+                return False
+        except ValueError:
+            return False
+        
+        end = len(_FILE_MAGIC) + _GENERATION_BYTES
+        for line in lines[1:]:
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A torn line from a crash: rebuild from the segment
+                return False
+            self._apply(entry)
+            end = entry["offset"] + entry["length"]
+        if end > segment_size:
+            return False
+        if end < segment_size:
+            # Records appended to the segment after the last metadata line
+            self._scan(end, write_meta=True)
+        return True
+    
+    def _rebuild_meta(self):
+        """Recreate the metadata file by scanning every record of the segment."""
+        self._entries = {}
+        self._dead_bytes = 0
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"generation": self._generation.hex()}) + "\n")
+        self._scan(len(_FILE_MAGIC) + _GENERATION_BYTES, write_meta=True)
+    
+    def _scan(self, offset, write_meta):
+        """Read records from `offset` to the end of the segment, truncating a torn tail."""
+        new_entries = []
+        with open(self.segment_path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            while offset + _RECORD.size <= size:
+                f.seek(offset)
+                flags, key_length, payload_length, crc, seq = _RECORD.unpack(f.read(_RECORD.size))
+                body = f.read(key_length + payload_length)
+                if len(body) < key_length + payload_length or zlib.crc32(body) != crc:
+                    break
+                key = body[:key_length].decode("utf-8")
+                length = _RECORD.size + key_length + payload_length
+                if flags & _FLAG_TOMBSTONE:
+                    entry = {"key": key, "offset": offset, "length": length, "seq": seq, "deleted": True}
+                else:
+                    story_data = json.loads(zlib.decompress(body[key_length:]))
+                    entry = self._entry(key, offset, length, seq, story_data)
+                self._apply(entry)
+                new_entries.append(entry)
+                offset += length
+            if offset < size:
+                f.truncate(offset)
+        if write_meta and new_entries:
+            with open(self.meta_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(entry) + "\n" for entry in new_entries))
+    
+    @staticmethod
+    def _entry(key, offset, length, seq, story_data):
+        metadata = story_data.get("metadata") or {}
+        return {
+            "key": key,
+            "offset": offset,
+            "length": length,
+            "seq": seq,
+            "title": story_data.get("title", "Untitled Story"),
+            "timestamp": story_data.get("timestamp", "") or "",
+            "genre": metadata.get("genre"),
+            "saved_at": metadata.get("saved_at")
+        }
+    
+    def _apply(self, entry):
+        self._next_seq = max(self._next_seq, entry["seq"] + 1)
+        previous = self._entries.pop(entry["key"], None)
+        if previous is not None:
+            self._dead_bytes += previous["length"]
+        if entry.get("deleted"):
+            self._dead_bytes += entry["length"]
+        else:
+            self._entries[entry["key"]] = entry
+    
+    def _append(self, key, payload, flags, sync=True):
+        key_bytes = key.encode("utf-8")
+        body = key_bytes + payload
+        seq = self._next_seq
+        record = _RECORD.pack(flags, len(key_bytes), len(payload), zlib.crc32(body), seq) + body
+        offset = self._segment.tell()
+        self._segment.write(record)
+        self._segment.flush()
+        if sync:
+            os.fsync(self._segment.fileno())
+        return offset, len(record), seq
+    
+    def put(self, key, story_data, sync=True):
+        """
+        Store a story (a new version if the key exists).
+        
+        Parameters:
+        - key: Story key
+        - story_data: Story dictionary
+        - sync: fsync the segment before returning; bulk writers can pass False and call sync() once
+        
+        Returns:
+        - Metadata entry of the stored record (key, offset, length, seq, title, ...)
+        """
+        payload = zlib.compress(json.dumps(story_data).encode("utf-8"), self.compress_level)
+        with self._lock:
+            offset, length, seq = self._append(key, payload, 0, sync)
+            entry = self._entry(key, offset, length, seq, story_data)
+            self._meta.write(json.dumps(entry) + "\n")
+            self._meta.flush()
+            self._apply(entry)
+        return dict(entry)
+    
+    def sync(self):
+        """Flush both files to disk."""
+        with self._lock:
+            self._segment.flush()
+            os.fsync(self._segment.fileno())
+            self._meta.flush()
+            os.fsync(self._meta.fileno())
+    
+    def delete(self, key):
+        """Delete a story by appending a tombstone."""
+        with self._lock:
+            if key not in self._entries:
+                return
+            offset, length, seq = self._append(key, b"", _FLAG_TOMBSTONE)
+            entry = {"key": key, "offset": offset, "length": length, "seq": seq, "deleted": True}
+            self._meta.write(json.dumps(entry) + "\n")
+            self._meta.flush()
+            self._apply(entry)
+    
+    def _mapped(self, end):
+        """Memory map covering the segment up to `end`, remapped when the file has grown."""
+        if self._map is None or end > self._map_size:
+            if self._map is not None:
+                self._map.close()
+            with open(self.segment_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map_size = len(self._map)
+        return self._map
+    
+    def get(self, key):
+        """
+        Read a story in full.
+        
+        Returns:
+        - Story dictionary
+        
+        Raises:
+        - KeyError if the story does not exist
+        """
+        return self.read(key)[0]
+    
+    def read(self, key):
+        """
+        Read a story in full, with its version stamp.
+        
+        Returns:
+        - Tuple of (story dictionary, sequence number of the stored version,
+          uncompressed size in bytes)
+        
+        Raises:
+        - KeyError if the story does not exist
+        """
+        with self._lock:
+            entry = self._entries[key]
+            end = entry["offset"] + entry["length"]
+            record = self._mapped(end)[entry["offset"]:end]
+        flags, key_length, payload_length, crc, seq = _RECORD.unpack_from(record)
+        body = record[_RECORD.size:]
+        if zlib.crc32(body) != crc:
+            raise ValueError(f"Corrupt record for story {key}")
+        payload = zlib.decompress(body[key_length:])
+        return json.loads(payload), seq, len(payload)
+    
+    def seq(self, key):
+        """
+        Sequence number of a story's stored version; it changes whenever the story is saved again.
+        
+        Raises:
+        - KeyError if the story does not exist
+        """
+        with self._lock:
+            return self._entries[key]["seq"]
+    
+    def entries(self):
+        """Metadata entries of all live stories (no content is read)."""
+        with self._lock:
+            return [dict(entry) for entry in self._entries.values()]
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def stats(self):
+        """
+        Returns:
+        - Dictionary with stories, segment_bytes, meta_bytes, dead_bytes and dead_ratio
+        """
+        with self._lock:
+            segment_bytes = self.segment_path.stat().st_size
+            return {
+                "stories": len(self._entries),
+                "segment_bytes": segment_bytes,
+                "meta_bytes": self.meta_path.stat().st_size,
+                "dead_bytes": self._dead_bytes,
+                "dead_ratio": self._dead_bytes / segment_bytes if segment_bytes else 0.0
+            }
+    
+    def compact(self):
+        """
+        Rewrite the segment with only the live records, reclaiming the space of
+        old versions and deleted stories. Safe against crashes: the new files
+        carry a new generation, and a metadata file that does not match its
+        segment is rebuilt on open.
+        
+        Returns:
+        - Bytes reclaimed
+        """
+        with self._lock:
+            before = self.segment_path.stat().st_size
+            generation = uuid.uuid4().bytes
+            new_segment = self.path / "stories.seg.compact"
+            new_meta = self.path / "stories.meta.compact"
+            self._write_headers(new_segment, new_meta, generation)
+            
+            entries = sorted(self._entries.values(), key=lambda e: e["offset"])
+            mapped = self._mapped(max((e["offset"] + e["length"] for e in entries), default=0))
+            new_entries = {}
+            with open(new_segment, "ab") as seg, open(new_meta, "a", encoding="utf-8") as meta:
+                for entry in entries:
+                    offset = seg.tell()
+                    seg.write(mapped[entry["offset"]:entry["offset"] + entry["length"]])
+                    moved = dict(entry, offset=offset)
+                    meta.write(json.dumps(moved) + "\n")
+                    new_entries[entry["key"]] = moved
+                seg.flush()
+                os.fsync(seg.fileno())
+                meta.flush()
+                os.fsync(meta.fileno())
+            
+            self._close_files()
+            os.replace(new_segment, self.segment_path)
+            os.replace(new_meta, self.meta_path)
+            self._generation = generation
+            self._entries = new_entries
+            self._dead_bytes = 0
+            self._segment = open(self.segment_path, "ab")
+            self._meta = open(self.meta_path, "a", encoding="utf-8")
+            return before - self.segment_path.stat().st_size
+    
+    def _close_files(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._map_size = 0
+        self._segment.close()
+        self._meta.close()
+    
+    def close(self):
+        with self._lock:
+            self._close_files()
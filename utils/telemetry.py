@@ -0,0 +1,168 @@
+# utils/telemetry.py
+import json
+import logging
+import math
+import queue
+import threading
+import time
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from utils.config import APP_CONFIG
+
+# Fields recorded for every Groq call
+CALL_FIELDS = (
+    "timestamp", "kind", "model", "session_id", "stream", "queue_wait", "ttft", "latency",
+    "prompt_tokens", "completion_tokens", "tokens_per_second", "retries", "error"
+)
+
+_buffer = deque(maxlen=APP_CONFIG["telemetry_buffer_size"])
+_buffer_lock = threading.Lock()
+_logger = None
+_logger_lock = threading.Lock()
+
+def _get_logger():
+    """
+    Logger writing one JSON line per call to a rotating file.
+    Records go through a queue so callers never wait on disk I/O.
+    """
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            log_dir = Path(APP_CONFIG["file_storage_path"]) / APP_CONFIG["telemetry_dir"]
+            log_dir.mkdir(exist_ok=True, parents=True)
+            file_handler = RotatingFileHandler(
+                log_dir / "calls.log",
+                maxBytes=APP_CONFIG["telemetry_log_max_bytes"],
+                backupCount=APP_CONFIG["telemetry_log_backups"],
+                encoding="utf-8"
+            )
+            file_handler.setFormatter(logging.Formatter("%(message)s"))
+            log_queue = queue.SimpleQueue()
+            listener = QueueListener(log_queue, file_handler)
+            listener.start()
+            
+            logger = logging.getLogger("storychat.telemetry")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(QueueHandler(log_queue))
+            _logger = logger
+        return _logger
+
+def start_call(kind, model, session_id=None, stream=False):
+    """
+    Begin a call record. Fill in the measurements, then pass it to finish_call.
+    Times are measured from this call, so ttft includes the queue wait.
+    
+    Returns:
+    - Call record dictionary
+    """
+    return {
+        "timestamp": time.time(),
+        "kind": kind,
+        "model": model,
+        "session_id": session_id,
+        "stream": stream,
+        "queue_wait": 0.0,
+        "ttft": None,
+        "latency": None,
+        "prompt_tokens": None,
+        "completion_tokens": None,
+        "tokens_per_second": None,
+        "retries": 0,
+        "error": None,
+        "_start": time.time()
+    }
+
+def finish_call(call, usage=None, error=None):
+    """
+    Complete a call record and publish it to the ring buffer and the log.
+    
+    Parameters:
+    - call: Record from start_call
+    - usage: Usage object reported by the API, if any
+    - error: Exception that ended the call, or a label such as "Cancelled"
+    """
+    if call.get("_done"):
+        return
+    call["_done"] = True
+    latency = time.time() - call["_start"]
+    if usage is not None:
+        call["prompt_tokens"] = usage.prompt_tokens
+        call["completion_tokens"] = usage.completion_tokens
+        # Decode rate: time after the first token, or after the queue for blocking calls
+        generation_time = latency - (call["ttft"] if call["ttft"] is not None else call["queue_wait"])
+        if usage.completion_tokens and generation_time > 0:
+            call["tokens_per_second"] = round(usage.completion_tokens / generation_time, 1)
+    call["latency"] = round(latency, 4)
+    call["queue_wait"] = round(call["queue_wait"], 4)
+    if call["ttft"] is not None:
+        call["ttft"] = round(call["ttft"], 4)
+    if error is not None:
+        call["error"] = error if isinstance(error, str) else type(error).__name__
+    
+    record = {field: call[field] for field in CALL_FIELDS}
+    with _buffer_lock:
+        _buffer.append(record)
+    if APP_CONFIG["telemetry_log_enabled"]:
+        _get_logger().info(json.dumps(record))
+
+def get_records(since=None):
+    """
+    Snapshot of the in-process ring buffer.
+    
+    Parameters:
+    - since: Only return records with a timestamp at or after this epoch time
+    
+    Returns:
+    - List of call records, oldest first
+    """
+    with _buffer_lock:
+        records = list(_buffer)
+    if since is not None:
+        records = [r for r in records if r["timestamp"] >= since]
+    return records
+
+def read_log_records(limit=10000):
+    """
+    Read the most recent call records from the on-disk log (including rotated files).
+    
+    Returns:
+    - List of call records, oldest first
+    """
+    log_dir = Path(APP_CONFIG["file_storage_path"]) / APP_CONFIG["telemetry_dir"]
+    files = sorted(log_dir.glob("calls.log*"), key=lambda p: p.stat().st_mtime)
+    records = deque(maxlen=limit)
+    for file_path in files:
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return sorted(records, key=lambda r: r["timestamp"])
+
+def percentile(values, p):
+    """Nearest-rank percentile (0-100) of a list of numbers, or None if empty."""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return values[max(0, math.ceil(len(values) * p / 100.0) - 1)]
+
+def summarize(records, metric, percentiles=(50, 95, 99)):
+    """
+    Percentiles of a metric per model.
+    
+    Returns:
+    - Dictionary of model to {"count", "p50", "p95", "p99"}
+    """
+    by_model = {}
+    for record in records:
+        by_model.setdefault(record["model"], []).append(record.get(metric))
+    summary = {}
+    for model, values in by_model.items():
+        row = {"count": sum(v is not None for v in values)}
+        for p in percentiles:
+            row[f"p{p}"] = percentile(values, p)
+        summary[model] = row
+    return summary
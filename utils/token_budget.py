@@ -0,0 +1,178 @@
+# utils/token_budget.py
+import math
+import re
+import threading
+from utils.config import APP_CONFIG
+
+# Per model family defaults: characters per sub-word piece of the tokenizer,
+# completion tokens per word of English prose, and the context window.
+MODEL_FAMILIES = {
+    "llama3": {"piece_chars": 6.0, "tokens_per_word": 1.3, "context": 8192},
+    "mixtral": {"piece_chars": 4.5, "tokens_per_word": 1.45, "context": 32768},
+    "gemma": {"piece_chars": 6.5, "tokens_per_word": 1.25, "context": 8192},
+    "default": {"piece_chars": 5.0, "tokens_per_word": 1.4, "context": 8192}
+}
+
+# Words, numbers and single punctuation marks roughly match how BPE tokenizers split text
+_PIECES = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+_WORDS = re.compile(r"\S+")
+
+# Tokens added by the chat template around each message
+_MESSAGE_OVERHEAD = 4
+
+def model_family(model):
+    """Map a model name to its tokenizer family."""
+    for family in MODEL_FAMILIES:
+        if model and model.startswith(family):
+            return family
+    return "default"
+
+def count_words(text):
+    """Number of whitespace-separated words in a text."""
+    return len(_WORDS.findall(text or ""))
+
+class TokenBudget:
+    """
+    Estimates prompt and completion tokens per model family with a local
+    tokenizer approximation, and calibrates itself from the usage numbers
+    the API reports.
+    """
+    
+    def __init__(self, margin=None, smoothing=0.2):
+        """
+        Parameters:
+        - margin: Extra fraction of the expected completion reserved in max_tokens
+        - smoothing: Weight of each new observation in the running averages
+        """
+        self.margin = APP_CONFIG["token_budget_margin"] if margin is None else margin
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._calibration = {}
+    
+    def _family_state(self, family):
+        state = self._calibration.get(family)
+        if state is None:
+            state = {
+                "prompt_ratio": 1.0,
+                "tokens_per_word": MODEL_FAMILIES[family]["tokens_per_word"],
+                "verbosity": 1.0,
+                "samples": 0
+            }
+            self._calibration[family] = state
+        return state
+    
+    def _raw_text_tokens(self, text, family):
+        piece_chars = MODEL_FAMILIES[family]["piece_chars"]
+        return sum(1 + int(len(piece) // piece_chars) for piece in _PIECES.findall(text or ""))
+    
+    def _raw_prompt_tokens(self, messages, family):
+        return sum(self._raw_text_tokens(m["content"], family) + _MESSAGE_OVERHEAD for m in messages)
+    
+    def estimate_prompt_tokens(self, messages, model):
+        """
+        Estimate the prompt tokens of a list of chat messages for a model.
+        """
+        family = model_family(model)
+        with self._lock:
+            ratio = self._family_state(family)["prompt_ratio"]
+        return math.ceil(self._raw_prompt_tokens(messages, family) * ratio)
+    
+    def expected_completion_tokens(self, words, model):
+        """
+        Expected completion tokens for a response asked to be about `words` words long.
+        """
+        with self._lock:
+            state = self._family_state(model_family(model))
+            return math.ceil(words * state["verbosity"] * state["tokens_per_word"])
+    
+    def completion_budget(self, words, model, prompt_tokens=0, overhead=32):
+        """
+        Pick max_tokens for a response of about `words` words.
+        
+        Parameters:
+        - words: Requested length of the response in words
+        - model: Model the request targets
+        - prompt_tokens: Estimated prompt size, to stay inside the context window
+        - overhead: Fixed allowance for titles, markers and the like
+        
+        Returns:
+        - max_tokens value
+        """
+        expected = self.expected_completion_tokens(words, model)
+        
+        # Terse replies may lower the expectation, but never below the requested
+        # length itself: calibration only widens the margin, it never truncates
+        with self._lock:
+            requested = math.ceil(words * self._family_state(model_family(model))["tokens_per_word"])
+        budget = math.ceil(max(expected, requested) * (1 + self.margin)) + overhead
+        context = MODEL_FAMILIES[model_family(model)]["context"]
+        limit = min(APP_CONFIG["max_completion_tokens"], context - prompt_tokens)
+        return max(64, min(budget, limit))
+    
+    def estimate_request(self, messages, model, words):
+        """
+        Expected cost of a request, for display before it is sent.
+        
+        Returns:
+        - Dictionary with prompt_tokens, completion_tokens (expected), max_tokens and total_tokens
+        """
+        prompt_tokens = self.estimate_prompt_tokens(messages, model)
+        completion_tokens = self.expected_completion_tokens(words, model)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "max_tokens": self.completion_budget(words, model, prompt_tokens),
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    
+    def observe(self, model, messages, usage, text=None, expected_words=None, truncated=False):
+        """
+        Calibrate from the usage reported for a finished request.
+        
+        Parameters:
+        - model: Model that served the request
+        - messages: Chat messages that were sent
+        - usage: Usage object with prompt_tokens and completion_tokens
+        - text: Completion text, to calibrate tokens per word
+        - expected_words: Requested response length, to calibrate how closely the model follows it
+        - truncated: Whether the response hit max_tokens (verbosity is then only nudged up)
+        """
+        if usage is None:
+            return
+        family = model_family(model)
+        raw_prompt = self._raw_prompt_tokens(messages, family)
+        words = count_words(text) if text else 0
+        alpha = self.smoothing
+        
+        with self._lock:
+            state = self._family_state(family)
+            if raw_prompt and usage.prompt_tokens:
+                state["prompt_ratio"] += alpha * (usage.prompt_tokens / raw_prompt - state["prompt_ratio"])
+            if words and usage.completion_tokens:
+                state["tokens_per_word"] += alpha * (usage.completion_tokens / words - state["tokens_per_word"])
+            if expected_words and words:
+                if truncated:
+                    state["verbosity"] *= 1 + self.margin
+                else:
+                    state["verbosity"] += alpha * (words / expected_words - state["verbosity"])
+                # Keep one odd response from collapsing or blowing up the budget
+                state["verbosity"] = min(max(state["verbosity"], 0.5), 2.0)
+            state["samples"] += 1
+    
+    def calibration(self):
+        """Snapshot of the calibrated values per model family."""
+        with self._lock:
+            return {family: dict(state) for family, state in self._calibration.items()}
+
+_budget = None
+_budget_lock = threading.Lock()
+
+def get_token_budget():
+    """
+    Get the process-wide token budget, shared so calibration benefits every session.
+    """
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = TokenBudget()
+        return _budget
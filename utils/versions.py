@@ -0,0 +1,239 @@
+# utils/versions.py
+import datetime
+import difflib
+import html
+import re
+from utils.config import APP_CONFIG
+
+# Words with their trailing whitespace, so a diff never splits a word from its spacing
+_TOKEN = re.compile(r"\S+\s*|\s+")
+
+# Word-level diffs of larger blocks (old tokens x new tokens) are stored as one replacement
+_MAX_WORD_DIFF = 4_000_000
+
+def _offsets(parts):
+    offsets = [0]
+    for part in parts:
+        offsets.append(offsets[-1] + len(part))
+    return offsets
+
+def _word_delta(old, new, base):
+    old_tokens = _TOKEN.findall(old)
+    new_tokens = _TOKEN.findall(new)
+    if len(old_tokens) * len(new_tokens) > _MAX_WORD_DIFF:
+        return [[base, base + len(old), new]]
+    old_offsets = _offsets(old_tokens)
+    new_offsets = _offsets(new_tokens)
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    return [
+        [base + old_offsets[i1], base + old_offsets[i2], new[new_offsets[j1]:new_offsets[j2]]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"
+    ]
+
+def compute_delta(old, new):
+    """
+    Compute the edits turning one text into another: changed lines are found
+    first, then narrowed down to the changed words within them.
+    
+    Parameters:
+    - old: Previous text
+    - new: New text
+    
+    Returns:
+    - List of [start, end, replacement] edits, with character offsets into old, in order
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    old_offsets = _offsets(old_lines)
+    new_offsets = _offsets(new_lines)
+    delta = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        start, end = old_offsets[i1], old_offsets[i2]
+        replacement = new[new_offsets[j1]:new_offsets[j2]]
+        if tag == "replace":
+            delta.extend(_word_delta(old[start:end], replacement, start))
+        else:
+            delta.append([start, end, replacement])
+    return delta
+
+def apply_delta(text, delta):
+    """Apply edits from compute_delta() to the text they were computed against."""
+    parts = []
+    position = 0
+    for start, end, replacement in delta:
+        parts.append(text[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(text[position:])
+    return "".join(parts)
+
+def render_diff_html(old, delta):
+    """
+    Render edits as HTML, with removed text struck through in red and added text in green.
+    
+    Parameters:
+    - old: Text the edits apply to
+    - delta: Edits from compute_delta()
+    
+    Returns:
+    - HTML string
+    """
+    parts = []
+    position = 0
+    for start, end, replacement in delta:
+        parts.append(html.escape(old[position:start]))
+        if end > start:
+            parts.append(f'<del style="color:#c0392b">{html.escape(old[start:end])}</del>')
+        if replacement:
+            parts.append(f'<ins style="color:#1e8449">{html.escape(replacement)}</ins>')
+        position = end
+    parts.append(html.escape(old[position:]))
+    return '<div style="white-space: pre-wrap">' + "".join(parts) + "</div>"
+
+class VersionHistory:
+    """
+    Revision history of one story: the original text plus a delta per revision.
+    
+    Every `snapshot_interval`-th version is kept in full, so rebuilding any
+    version replays fewer than `snapshot_interval` deltas; otherwise a
+    revision costs memory in proportion to the edit, not to the story.
+    undo() steps back one version. As in an editor, a revision made after
+    an undo discards the versions that were undone.
+    """
+    
+    def __init__(self, text, snapshot_interval=None):
+        """
+        Parameters:
+        - text: Original story text
+        - snapshot_interval: Versions between full snapshots (default from APP_CONFIG)
+        """
+        self.snapshot_interval = snapshot_interval or APP_CONFIG["version_snapshot_interval"]
+        self._versions = [{"text": text, "created_at": datetime.datetime.now().isoformat(), "request": None}]
+        self._current = 0
+        self._text = text
+    
+    def __len__(self):
+        return len(self._versions)
+    
+    @property
+    def current(self):
+        """Index of the current version (0 is the original)."""
+        return self._current
+    
+    @property
+    def text(self):
+        """Text of the current version."""
+        return self._text
+    
+    def get(self, index):
+        """
+        Rebuild the text of a version.
+        
+        Raises:
+        - IndexError if there is no such version
+        """
+        if not 0 <= index < len(self._versions):
+            raise IndexError(f"No version {index}")
+        if index == self._current:
+            return self._text
+        
+        # Replay deltas forward from the nearest full snapshot
+        start = index
+        while "text" not in self._versions[start]:
+            start -= 1
+        text = self._versions[start]["text"]
+        for version in self._versions[start + 1:index + 1]:
+            text = apply_delta(text, version["delta"])
+        return text
+    
+    def commit(self, text, request=None):
+        """
+        Record a revision as the new current version.
+        
+        Parameters:
+        - text: Revised story text
+        - request: Revision request that produced it, shown in the history
+        
+        Returns:
+        - Index of the new version (the current one if the text did not change)
+        """
+        if text == self._text:
+            return self._current
+        
+        # Drop versions that were undone
+        del self._versions[self._current + 1:]
+        version = {"created_at": datetime.datetime.now().isoformat(), "request": request}
+        if len(self._versions) % self.snapshot_interval == 0:
+            version["text"] = text
+        else:
+            version["delta"] = compute_delta(self._text, text)
+        self._versions.append(version)
+        self._current = len(self._versions) - 1
+        self._text = text
+        return self._current
+    
+    def undo(self):
+        """
+        Step back to the previous version.
+        
+        Returns:
+        - Text of the now current version, or None if already at the original
+        """
+        if self._current == 0:
+            return None
+        self._text = self.get(self._current - 1)
+        self._current -= 1
+        return self._text
+    
+    def delta(self, index):
+        """
+        Edits from the version before `index` to version `index`.
+        
+        Returns:
+        - Tuple of (previous text, edits from compute_delta())
+        """
+        if index <= 0:
+            raise IndexError("The original version has no previous version")
+        previous = self.get(index - 1)
+        version = self._versions[index]
+        if "delta" in version:
+            return previous, version["delta"]
+        return previous, compute_delta(previous, version["text"])
+    
+    def versions(self):
+        """
+        Describe every version, oldest first.
+        
+        Returns:
+        - List of dictionaries with index, created_at, request, snapshot (stored in full)
+          and stored_chars (characters held for it)
+        """
+        return [
+            {
+                "index": index,
+                "created_at": version["created_at"],
+                "request": version["request"],
+                "snapshot": "text" in version,
+                "stored_chars": len(version["text"]) if "text" in version else sum(len(edit[2]) for edit in version["delta"])
+            }
+            for index, version in enumerate(self._versions)
+        ]
+    
+    def to_dict(self):
+        """JSON-serializable form, saved alongside the story."""
+        return {"snapshot_interval": self.snapshot_interval, "current": self._current, "versions": self._versions}
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a history saved with to_dict()."""
+        history = cls.__new__(cls)
+        history.snapshot_interval = data["snapshot_interval"]
+        history._versions = data["versions"]
+        history._current = 0
+        history._text = history._versions[0]["text"]
+        history._text = history.get(data["current"])
+        history._current = data["current"]
+        return history